@@ -1,7 +1,14 @@
-from flask import Blueprint, jsonify
-import pandas as pd
+from flask import Blueprint, jsonify, request, Response, send_file, stream_with_context
+import json
 import os
 from sqlalchemy import create_engine
+from recommender import RecommendationEngine
+from keyword_matcher import KeywordMatcher
+from scoring import rule_keywords
+from clustering import ClusterStore
+from cluster_recommender import ClusterRecommender
+from instrumentation import TimedCursor
+from profiling import Profiler, pstats_text
 
 ai_bp = Blueprint('ai', __name__, url_prefix='/api/ai')
 
@@ -13,45 +20,27 @@ DB_PASSWORD = os.environ.get("DB_PASSWORD")
 DB_HOST = os.environ.get("DB_HOST")
 DB_NAME = os.environ.get("DB_NAME")
 
+# TimedCursor: استعلامات المحرك تُحسب في مقاييس الطلب (instrumentation.py)
 engine = create_engine(
-    f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}'
+    f'postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}',
+    connect_args={"cursor_factory": TimedCursor},
 )
 
-# =====================================================
-# تحميل البيانات
-# =====================================================
-def load_data():
-    customers = pd.read_sql("SELECT * FROM customers", engine)
-    orders = pd.read_sql("SELECT * FROM orders", engine)
-    meals = pd.read_sql("SELECT * FROM meals", engine)
-
-    customers['age'] = customers['age'].fillna(customers['age'].median())
-    customers['health_condition'] = customers['health_condition'].fillna('None')
-
-    # حساب الفئة المفضلة
-    def favorite_category(cid):
-        o = orders[orders.customer_id == cid]
-        if o.empty:
-            return 'Unknown'
-        m = meals[meals.meal_id.isin(o.meal_id)]
-        return m.category_id.mode()[0] if not m.empty else 'Unknown'
-
-    customers['fav_category'] = customers['customer_id'].apply(favorite_category)
-
-    return customers, orders, meals
-
-
 # =====================================================
 # قواعد صحية (الأولوية الأولى)
 # =====================================================
+# unsafe_meals: أسماء وجبات تُستبعد دائماً (قائمة is_safe القديمة)
+# لأن أوصافها قد لا تحتوي أي كلمة "bad"
 HEALTH_RULES = {
     "Diabetic": {
         "bad": ["سكر", "عسل", "sweet", "cake"],
-        "good": ["مشوي", "سلطة", "بدون سكر"]
+        "good": ["مشوي", "سلطة", "بدون سكر"],
+        "unsafe_meals": ["كسرة بالزبدة والعسل", "عصير طبيعي"]
     },
     "Hypertension": {
         "bad": ["ملح", "fried", "مقلي"],
-        "good": ["steam", "مشوي", "low salt"]
+        "good": ["steam", "مشوي", "low salt"],
+        "unsafe_meals": ["برغر لحم", "بيتزا مارجريتا"]
     }
 }
 
@@ -59,15 +48,15 @@ def health_score(description, health_condition):
     if not description or health_condition not in HEALTH_RULES:
         return 1.0
 
-    desc = description.lower()
+    hits = rule_matcher.hits(description)
     score = 1.0
 
     for bad in HEALTH_RULES[health_condition]["bad"]:
-        if bad in desc:
+        if hits[rule_matcher.index[bad]]:
             score -= 0.7   # عقوبة قوية
 
     for good in HEALTH_RULES[health_condition]["good"]:
-        if good in desc:
+        if hits[rule_matcher.index[good]]:
             score += 0.4   # مكافأة
 
     return max(score, 0)
@@ -76,14 +65,20 @@ def health_score(description, health_condition):
 # =====================================================
 # بقية عوامل التقييم
 # =====================================================
+HEALTHY_WORDS = ["fresh", "طبيعي", "سلطة", "مشوي"]
+
+# كل الكلمات (عربية ولاتينية) في آلة مطابقة واحدة: مرور واحد على الوصف
+# مهما زادت الحالات في HEALTH_RULES
+rule_matcher = KeywordMatcher(rule_keywords(HEALTH_RULES, HEALTHY_WORDS))
+
 def description_score(description):
     if not description:
         return 0.5
 
-    healthy_words = ["fresh", "طبيعي", "سلطة", "مشوي"]
+    hits = rule_matcher.hits(description)
     score = 0
-    for w in healthy_words:
-        if w in description.lower():
+    for w in HEALTHY_WORDS:
+        if hits[rule_matcher.index[w]]:
             score += 0.2
     return min(score, 1)
 
@@ -129,29 +124,169 @@ def recommendation_score(customer, meal):
     return round(final_score, 3)
 
 
+# =====================================================
+# محرك التوصيات (البيانات محمّلة في الذاكرة)
+# =====================================================
+recommender = RecommendationEngine(
+    engine,
+    HEALTH_RULES,
+    HEALTHY_WORDS,
+    refresh_interval=int(os.environ.get("RECOMMENDER_REFRESH_SECONDS", 30)),
+    full_reload_interval=int(os.environ.get("RECOMMENDER_FULL_RELOAD_SECONDS", 900)),
+    feature_lag=float(os.environ.get("CUSTOMER_FEATURES_LAG_SECONDS", 5)),
+    matcher=rule_matcher,
+)
+
+
+# =====================================================
+# نموذج تجميع الزبائن (يدرّبه prepare_dataset.py)
+# =====================================================
+cluster_store = ClusterStore(
+    os.environ.get("CLUSTER_MODEL_DIR", os.path.join(os.getcwd(), "models", "clusters")),
+    check_interval=int(os.environ.get("CLUSTER_MODEL_CHECK_SECONDS", 60)),
+)
+cluster_recommender = ClusterRecommender(
+    engine,
+    cluster_store,
+    recommender,
+    refresh_interval=int(os.environ.get("CLUSTER_POPULARITY_REFRESH_SECONDS", 300)),
+)
+CLUSTER_BLEND = float(os.environ.get("CLUSTER_BLEND", 0.5))
+
+
+# =====================================================
+# تحليل الأداء عند الطلب (دون إعادة نشر):
+# ترويسة X-Profile: sample|cprofile مع X-Profile-Key = PROFILE_KEY
+# أو PROFILE_SAMPLE_RATE (مثلاً 0.01) لعينة من الطلبات بوضع PROFILE_MODE
+# =====================================================
+profiler = Profiler(
+    os.environ.get("PROFILE_DIR", os.path.join(os.getcwd(), "profiles")),
+    key=os.environ.get("PROFILE_KEY"),
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+    mode=os.environ.get("PROFILE_MODE", "sample"),
+    interval=float(os.environ.get("PROFILE_INTERVAL_MS", 2)) / 1000,
+    keep=int(os.environ.get("PROFILE_KEEP", 50)),
+)
+
+
 # =====================================================
 # API Route
 # =====================================================
 @ai_bp.route('/recommend/<int:customer_id>')
+@profiler.profiled
 def recommend(customer_id):
-    customers, orders, meals = load_data()
+    result = recommender.recommend(customer_id, top_n=5)
+
+    if result is None:
+        return jsonify({"error": "Customer not found"}), 404
 
-    if customer_id not in customers.customer_id.values:
+    return jsonify(result)
+
+
+@ai_bp.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    data = request.get_json(silent=True) or {}
+    customer_ids = data.get('customer_ids')
+
+    if not isinstance(customer_ids, list) or not customer_ids:
+        return jsonify({"error": "customer_ids must be a non-empty list"}), 400
+
+    try:
+        customer_ids = [int(c) for c in customer_ids]
+        top_n = int(data.get('top_n', 5))
+    except (TypeError, ValueError):
+        return jsonify({"error": "customer_ids and top_n must be integers"}), 400
+
+    if top_n < 1:
+        return jsonify({"error": "top_n must be positive"}), 400
+
+    # تحميل البيانات قبل بدء البث حتى تظهر الأخطاء كرمز حالة
+    recommender.ensure_loaded()
+
+    # بث النتائج سطراً بسطر (NDJSON)
+    def generate():
+        for customer_id, meals in recommender.recommend_many(customer_ids, top_n):
+            if meals is None:
+                row = {"customer_id": customer_id, "error": "Customer not found"}
+            else:
+                row = {"customer_id": customer_id, "recommendations": meals}
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@ai_bp.route('/recommend/cluster/<int:customer_id>')
+@profiler.profiled
+def recommend_cluster(customer_id):
+    # ?top_n=5&blend=0.5 (وزن درجة القواعد مقابل شعبية الوجبة في المجموعة)
+    try:
+        top_n = int(request.args.get('top_n', 5))
+        blend = float(request.args.get('blend', CLUSTER_BLEND))
+    except ValueError:
+        return jsonify({"error": "top_n and blend must be numbers"}), 400
+    if top_n < 1 or not 0 <= blend <= 1:
+        return jsonify({"error": "top_n must be positive and blend between 0 and 1"}), 400
+
+    try:
+        result = cluster_recommender.recommend(customer_id, top_n, blend)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 503
+    if result is None:
         return jsonify({"error": "Customer not found"}), 404
+    return jsonify(result)
 
-    customer = customers[customers.customer_id == customer_id].iloc[0]
 
-    meals_copy = meals.copy()
-    meals_copy['score'] = meals_copy.apply(
-        lambda m: recommendation_score(customer, m),
-        axis=1
-    )
+@ai_bp.route('/cluster/<int:customer_id>')
+def customer_cluster(customer_id):
+    model = cluster_store.current()
+    if model is None:
+        return jsonify({"error": "No cluster model trained"}), 503
 
-    meals_copy = meals_copy.sort_values(by='score', ascending=False)
+    cluster = model.cluster_of(customer_id)
+    if cluster is None:
+        # زبون جديد بعد التدريب: أقرب مركز حسب ميزاته الحالية
+        recommender.ensure_loaded()
+        features = recommender.customer_features(customer_id)
+        if features is None:
+            return jsonify({"error": "Customer not found"}), 404
+        cluster = model.assign(features)
 
-    result = meals_copy.head(5)[
-    ['meal_id','name','price','meal_time','description','image_url','score']
-]
+    return jsonify({"customer_id": customer_id, "cluster": cluster, "model_version": model.version})
 
 
-    return jsonify(result.to_dict(orient='records'))
+@ai_bp.route('/cluster-model')
+def cluster_model_info():
+    model = cluster_store.current()
+    if model is None:
+        return jsonify({"error": "No cluster model trained"}), 503
+    return jsonify(model.metadata)
+
+
+# =====================================================
+# تنزيل نتائج التحليل (تتطلب X-Profile-Key)
+# =====================================================
+@ai_bp.route('/profiles')
+def list_profiles():
+    if not profiler.authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({"stats": profiler.stats, "profiles": profiler.list()})
+
+
+@ai_bp.route('/profiles/<profile_id>')
+def download_profile(profile_id):
+    # .pstats (cprofile) أو .collapsed (sample)؛ ?format=text لجدول pstats مقروء
+    if not profiler.authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    found = profiler.get(profile_id)
+    if found is None:
+        return jsonify({"error": "Profile not found"}), 404
+    meta, path = found
+
+    try:
+        if request.args.get('format') == 'text':
+            if meta["mode"] != "cprofile":
+                return jsonify({"error": "format=text is only available for cprofile traces"}), 400
+            return Response(pstats_text(path), mimetype='text/plain')
+        return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+    except FileNotFoundError:
+        return jsonify({"error": "Profile not found"}), 404
@@ -60,6 +60,12 @@ async function apiGet(path) {
     return res.json();
 }
 
+// رمز الدخول الموقَّع (POST /api/login) للمسارات المحمية
+function authHeaders() {
+    const token = localStorage.getItem('authToken');
+    return token ? { 'Authorization': `Bearer ${token}` } : {};
+}
+
 async function apiPost(path, body, headers = {}) {
     const res = await fetch(`${API_URL}${path}`, {
         method: 'POST',
@@ -215,7 +221,8 @@ async function loadMeals() {
         const mealsRaw = await apiGet('/meals');
         state.meals = (Array.isArray(mealsRaw) ? mealsRaw : []).map(m => ({
             ...m,
-            image_url: normalizeImageUrl(m.image_url || m.image || null)
+            // نسخة "card" المصغّرة إن كانت جاهزة بدل الصورة الأصلية
+            image_url: normalizeImageUrl(m.image_variants?.card?.webp || m.image_url || m.image || null)
         }));
         renderMeals();
         fillOrderMealSelect();
@@ -409,6 +416,7 @@ async function loginUser() {
         const data = await apiPost('/login', JSON.stringify({ email, password }), { 'Content-Type': 'application/json' });
         const user = data.customer || data;
         localStorage.setItem('loggedUser', JSON.stringify(user));
+        if (data.token) localStorage.setItem('authToken', data.token);
         if (msg) msg.textContent = "Login successful!";
         updateUIForLoggedUser();
         showSection('menu');
@@ -450,6 +458,7 @@ async function registerUser() {
         if (data.customer) {
             if (msgEl) msgEl.textContent = 'Registered successfully';
             localStorage.setItem('loggedUser', JSON.stringify(data.customer));
+            if (data.token) localStorage.setItem('authToken', data.token);
             updateUIForLoggedUser();
             showSection('menu');
         } else {
@@ -463,6 +472,7 @@ async function registerUser() {
 
 function logout() {
     localStorage.removeItem('loggedUser');
+    localStorage.removeItem('authToken');
     updateUIForLoggedUser();
     showSection('login');
 }
@@ -608,26 +618,22 @@ async function confirmAllOrders() {
         }
 
 
-    // 2️⃣ إرسال كل طلب بشكل منفصل (كما يتوقع Backend)
-    for (const o of cart) {
-
-      const payload = {
+    // 2️⃣ إرسال السلة كاملة في طلب واحد (السعر يُحسب في الخادم)
+    await apiPost(
+      "/orders/bulk",
+      JSON.stringify({
         customer_id: user.customer_id,
-        meal_id: o.meal_id,                  // ✅ موجود
-        quantity: o.quantity,                // ✅ موجود
-        price: o.price,                      // ✅ موجود
-        order_type: o.type,
-        table_id: o.type === "dinein" ? o.table_id : null,
-        address: o.type === "delivery" ? o.address : null,
-        reservation_time: o.type === "dinein" ? reservationTime : null
-      };
-
-      await apiPost(
-        "/orders",
-        JSON.stringify(payload),
-        { "Content-Type": "application/json" }
-      );
-    }
+        items: cart.map(o => ({
+          meal_id: o.meal_id,
+          quantity: o.quantity,
+          order_type: o.type,
+          table_id: o.type === "dinein" ? o.table_id : null,
+          address: o.type === "delivery" ? o.address : null,
+          reservation_time: o.type === "dinein" ? reservationTime : null
+        }))
+      }),
+      { "Content-Type": "application/json" }
+    );
 
     cart = [];
     renderCart();
@@ -635,7 +641,8 @@ async function confirmAllOrders() {
 
   } catch (e) {
     console.error("Confirm order error:", e);
-    alert("❌ Error confirming orders");
+    // 409: الطاولة محجوزة في هذا الوقت
+    alert(e && e.error ? `❌ ${e.error}` : "❌ Error confirming orders");
   }
 }
 
@@ -661,9 +668,12 @@ async function saveSettings() {
     try {
         const res = await fetch(`${API_URL}/customers/${user.customer_id}/profile`, {
             method: 'POST',
+            headers: authHeaders(),
             body: formData
         });
 
+        // الرمز منتهٍ: إعادة تسجيل الدخول
+        if (res.status === 401) { logout(); return; }
         if (!res.ok) throw new Error("Update failed");
 
         const updatedUser = await res.json();
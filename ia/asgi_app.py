@@ -0,0 +1,662 @@
+# asgi_app.py
+# وضع تشغيل غير متزامن لنفس واجهات server.py (نفس المسارات ونفس JSON)
+# التشغيل: uvicorn asgi_app:app --workers 4
+# المسارات الساخنة منفّذة هنا بـ asyncpg؛ الباقي (رفع الصور، التصدير، الدخول...)
+# يُمرَّر إلى تطبيق Flask الأصلي عبر WSGI
+import contextlib
+import functools
+import itertools
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+
+import asyncio
+
+import asyncpg
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Match, Mount, Route
+from werkzeug.http import parse_etags
+
+import server
+from ai_routes import profiler, recommender
+from cache import NOT_MODIFIED
+from instrumentation import InstrumentationMiddleware, current
+from order_feed import format_sse
+from pagination import decode_cursor, parse_fields, split_page
+from server import (
+    AVAILABLE_TABLES_SQL, CUSTOMER_FIELDS, LAST_ORDER_EVENT_SQL, MEAL_FIELDS, MEAL_PRICES_SQL,
+    MAX_IDEMPOTENCY_KEY, ORDER_DEFAULT_FIELDS, ORDER_EVENT_SQL, ORDER_FIELDS, ORDER_INSERT_COLUMNS, ORDER_STREAM_HEARTBEAT,
+    RESERVE_SQL, add_image_variants, available_tables_args, available_tables_vary, bulk_meal_ids, bulk_order_rows,
+    customers_query, customers_with_orders_query, datetime_arg, int_arg, meals_query, order_feed,
+    order_updates, order_values, orders_query, page_args, reservation_values, unknown_meals,
+)
+
+
+# ----- Async DB pool -----
+db = None
+
+def _status_rows(status):
+    # "DELETE 3" / "INSERT 0 1" -> 3 / 1
+    count = status.rsplit(" ", 1)[-1] if isinstance(status, str) else ""
+    return int(count) if count.isdigit() else 0
+
+def _timed(name, rows):
+    base = getattr(asyncpg.Connection, name)
+
+    async def method(self, query, *args, **kwargs):
+        stats = current.get()
+        if stats is None:
+            return await base(self, query, *args, **kwargs)
+        started = time.perf_counter()
+        result = None
+        try:
+            result = await base(self, query, *args, **kwargs)
+            return result
+        finally:
+            stats.add_query(query, time.perf_counter() - started, rows(result))
+    return method
+
+class TimedConnection(asyncpg.Connection):
+    # مثل TimedCursor لـ psycopg2: كل استعلام ضمن إحصاءات الطلب الحالي (instrumentation.py)
+    fetch = _timed("fetch", lambda r: len(r) if r else 0)
+    fetchrow = _timed("fetchrow", lambda r: int(r is not None))
+    fetchval = _timed("fetchval", lambda r: int(r is not None))
+    execute = _timed("execute", _status_rows)
+    executemany = _timed("executemany", lambda r: 0)
+
+    async def reset(self, *, timeout=None):
+        # تنظيف الاتصال عند إرجاعه للمجمّع ليس من استعلامات الطلب
+        token = current.set(None)
+        try:
+            return await super().reset(timeout=timeout)
+        finally:
+            current.reset(token)
+
+async def init_connection(conn):
+    # json/jsonb كقيم Python كما في psycopg2
+    for name in ("json", "jsonb"):
+        await conn.set_type_codec(name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+
+async def open_pool():
+    global db
+    db = await asyncpg.create_pool(
+        host=os.environ.get("DB_HOST"),
+        database=os.environ.get("DB_NAME"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port=int(os.environ.get("DB_PORT", 5432)),
+        min_size=int(os.environ.get("ASYNC_DB_POOL_MIN", 2)),
+        max_size=int(os.environ.get("ASYNC_DB_POOL_MAX", 20)),
+        command_timeout=float(os.environ.get("ASYNC_DB_COMMAND_TIMEOUT", 30)),
+        init=init_connection,
+        connection_class=TimedConnection,
+    )
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await open_pool()
+    try:
+        yield
+    finally:
+        await db.close()
+
+_PLACEHOLDER = re.compile(r"%s")
+
+@functools.lru_cache(maxsize=512)
+def pg(query):
+    # استعلامات server.py بصيغة psycopg2 (%s) ← صيغة asyncpg ($1, $2...)
+    counter = itertools.count(1)
+    return _PLACEHOLDER.sub(lambda m: f"${next(counter)}", query)
+
+async def fetch(query, params=()):
+    return [dict(r) for r in await db.fetch(pg(query), *params)]
+
+async def fetchrow(query, params=()):
+    row = await db.fetchrow(pg(query), *params)
+    return dict(row) if row is not None else None
+
+
+# ----- Responses -----
+def json_response(data, status=200, headers=None):
+    # نفس مُسلسل Flask (ترتيب المفاتيح، التواريخ، Decimal) لتطابق العقود
+    body = server.app.json.dumps(data, separators=(",", ":"))
+    return Response(body + "\n", status, headers, media_type="application/json")
+
+def error(message, status):
+    return json_response({"error": message}, status)
+
+def paged_response(rows, limit, cursor_columns):
+    rows, next_cursor = split_page(rows, limit, cursor_columns)
+    return json_response(rows, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+def optional_int(value):
+    # asyncpg لا يحوّل النصوص تلقائياً كما يفعل psycopg2
+    return int(value) if value not in (None, "") else None
+
+async def cache_call(func, *args):
+    # Redis (مشترك) استدعاء شبكي يُنفَّذ خارج حلقة الأحداث
+    if server.response_cache.backend.shared:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
+
+def cached(*tags, vary=None):
+    # نفس مفاتيح وETag كاش server.py (response_cache)، فالإبطال مشترك بين الوضعين
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            cache = server.response_cache
+            items = request.query_params.multi_items()
+            if vary is not None:
+                items += vary(request.query_params)
+            key, etag, hit = await cache_call(
+                cache.probe, tags, request.url.path, items,
+                parse_etags(request.headers.get("if-none-match")),
+            )
+            quoted = f'"{etag}"'
+            if hit is NOT_MODIFIED:
+                return Response(status_code=304, headers={"ETag": quoted})
+            if hit is not None:
+                headers, body = hit
+                return Response(body, headers=dict(headers, ETag=quoted), media_type="application/json")
+
+            response = await endpoint(request)
+            if response.status_code != 200 or isinstance(response, StreamingResponse):
+                return response
+            headers = {k: v for k, v in response.headers.items() if k.lower().startswith("x-")}
+            await cache_call(cache.store, key, headers, response.body)
+            response.headers["ETag"] = quoted
+            return response
+        return wrapper
+    return decorator
+
+async def publish_order_event(conn, op, *order_ids):
+    # نفس ORDER_EVENT_SQL في server.py داخل معاملة الطلب
+    await conn.execute(pg(ORDER_EVENT_SQL), op, list(order_ids))
+
+async def invalidate(*tags):
+    await cache_call(server.response_cache.invalidate, *tags)
+
+async def json_body(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+# ----- Fallback to Flask -----
+def without_origin(asgi):
+    # CORS تعالجه Starlette لكل المسارات؛ إخفاء Origin يمنع flask-cors من تكرار الترويسات
+    async def wrapped(scope, receive, send):
+        if scope["type"] == "http":
+            scope = dict(scope, headers=[(k, v) for k, v in scope["headers"] if k != b"origin"])
+        await asgi(scope, receive, send)
+    return wrapped
+
+flask_app = without_origin(WSGIMiddleware(server.app, workers=int(os.environ.get("WSGI_FALLBACK_THREADS", 10))))
+
+
+# ------------------ API Pool stats ------------------
+async def pool_stats(request):
+    return json_response({
+        "async_pool": {
+            "size": db.get_size(),
+            "idle": db.get_idle_size(),
+            "min": db.get_min_size(),
+            "max": db.get_max_size(),
+        },
+        "sync_pool": server.db_pool.stats(),
+        "cache": server.response_cache.stats(),
+        "order_feed": dict(order_feed.stats, subscribers=order_feed.subscriber_count()),
+        "order_queue": dict(server.order_queue.stats, depth=server.order_queue.depth()) if server.order_queue else None,
+    })
+
+
+# ------------------ API Meals ------------------
+@cached('meals', 'categories')
+async def get_meals(request):
+    args = request.query_params
+    try:
+        fields = parse_fields(args.get('fields'), MEAL_FIELDS, ())
+        limit, cursor = page_args(args)
+        after = decode_cursor(cursor, (int,)) if cursor else None
+        category_id = int_arg('category_id', minimum=1, args=args)
+        query, params = meals_query(fields, limit, after, category_id)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        meals = await fetch(query, params)
+        return paged_response(add_image_variants(meals), limit, ["_cursor_id"])
+    except Exception as e:
+        print(f"GET /api/meals: {e}")
+        return error("Server error", 500)
+
+@cached('categories')
+async def get_categories(request):
+    try:
+        return json_response(await fetch("SELECT * FROM meal_categories ORDER BY category_name ASC"))
+    except Exception as e:
+        print(f"GET /api/meal-categories: {e}")
+        return error("Server error", 500)
+
+async def add_category(request):
+    try:
+        data = await request.json()
+        name = data.get('category_name')
+        if not name:
+            return error("category_name is required", 400)
+        category = await fetchrow("INSERT INTO meal_categories (category_name) VALUES (%s) RETURNING *", (name,))
+        await invalidate('categories')
+        return json_response(category, 201)
+    except Exception as e:
+        print(f"POST /api/meal-categories: {e}")
+        return error("Server error", 500)
+
+
+# ------------------ API Customers ------------------
+async def get_customers(request):
+    args = request.query_params
+    if args.get('export'):
+        return flask_app
+    try:
+        fields = parse_fields(args.get('fields'), CUSTOMER_FIELDS, ())
+        limit, cursor = page_args(args)
+        after = decode_cursor(cursor, (int,)) if cursor else None
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        return paged_response(await fetch(*customers_query(fields, limit, after)), limit, ["_cursor_id"])
+    except Exception as e:
+        print(f"GET /api/customers: {e}")
+        return error("Server error", 500)
+
+async def delete_customer(request):
+    id = request.path_params['id']
+    try:
+        await db.execute("DELETE FROM customers WHERE customer_id=$1", id)
+        recommender.customer_removed(id)
+        return Response(status_code=204)
+    except Exception as e:
+        print(f"DELETE /api/customers/{id}: {e}")
+        return error("Server error", 500)
+
+async def get_customers_with_orders(request):
+    args = request.query_params
+    try:
+        limit = int_arg('limit', minimum=1, maximum=1000, args=args)
+        offset = int_arg('offset', default=0, args=args)
+        date_from = datetime_arg('from', args=args)
+        date_to = datetime_arg('to', end_of_day=True, args=args)
+    except ValueError:
+        return error("invalid limit, offset, from or to", 400)
+
+    try:
+        return json_response(await fetch(*customers_with_orders_query(limit, offset, date_from, date_to)))
+    except Exception as e:
+        print(f"GET /api/customers-with-orders: {e}")
+        return error("Server error", 500)
+
+
+# ------------------ API Orders ------------------
+async def get_orders(request):
+    args = request.query_params
+    if args.get('export'):
+        return flask_app
+    try:
+        fields = parse_fields(args.get('fields'), ORDER_FIELDS, ORDER_DEFAULT_FIELDS)
+        limit, cursor = page_args(args)
+        after = decode_cursor(cursor, (datetime.fromisoformat, int)) if cursor else None
+        query, params = orders_query(fields, limit, after, args)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        async with db.acquire() as conn:
+            last_event_id = await conn.fetchval(LAST_ORDER_EVENT_SQL)
+            orders = [dict(r) for r in await conn.fetch(pg(query), *params)]
+        response = paged_response(orders, limit, ["_cursor_datetime", "_cursor_id"])
+        response.headers['X-Order-Event-Id'] = str(last_event_id)
+        return response
+    except Exception as e:
+        print("GET /api/orders:", e)
+        return error("Server error", 500)
+
+async def add_order(request):
+    try:
+        data = await request.json()
+        values, message = order_values(data)
+        if message:
+            return error(message, 400)
+
+        if server.order_queue is not None:
+            key = request.headers.get('idempotency-key') or uuid.uuid4().hex
+            if len(key) > MAX_IDEMPOTENCY_KEY:
+                return error(f"Idempotency-Key longer than {MAX_IDEMPOTENCY_KEY} characters", 400)
+            customer_id = values[ORDER_INSERT_COLUMNS.index("customer_id")]
+            entry, created = await run_in_threadpool(server.order_queue.enqueue, customer_id, key, values)
+            return json_response(entry, 202 if created else 200)
+
+        values = list(values)
+        values[ORDER_INSERT_COLUMNS.index("table_id")] = optional_int(data.get("table_id"))
+
+        async with db.acquire() as conn, conn.transaction():
+            order = dict(await conn.fetchrow(pg(f"""
+                INSERT INTO orders
+                ({', '.join(ORDER_INSERT_COLUMNS)})
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                RETURNING *
+            """), *values))
+            await publish_order_event(conn, 'insert', order['order_id'])
+
+        recommender.order_added(order)
+        return json_response(order, 201)
+    except Exception as e:
+        print("POST /api/orders:", e)
+        return error("Server error", 500)
+
+async def add_orders_bulk(request):
+    data = await json_body(request)
+    try:
+        meal_ids = bulk_meal_ids(data)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        async with db.acquire() as conn, conn.transaction():
+            prices = {r['meal_id']: r['price'] for r in await conn.fetch(pg(MEAL_PRICES_SQL), meal_ids)}
+            message = unknown_meals(meal_ids, prices)
+            if not message:
+                rows, message = bulk_order_rows(data, prices)
+            if message:
+                return error(message, 400)
+
+            # INSERT متعدد الصفوف واحد (asyncpg لا يوفر execute_values)
+            table_id = ORDER_INSERT_COLUMNS.index("table_id")
+            params, placeholders = [], []
+            for row in rows:
+                row = list(row)
+                row[table_id] = optional_int(row[table_id])
+                placeholders.append("(" + ", ".join(f"${len(params) + i + 1}" for i in range(len(row))) + ")")
+                params += row
+            orders = [dict(r) for r in await conn.fetch(f"""
+                INSERT INTO orders ({', '.join(ORDER_INSERT_COLUMNS)})
+                VALUES {', '.join(placeholders)}
+                RETURNING *
+            """, *params)]
+            await publish_order_event(conn, 'insert', *(o['order_id'] for o in orders))
+
+        for order in orders:
+            recommender.order_added(order)
+        return json_response(orders, 201)
+    except asyncpg.exceptions.ForeignKeyViolationError:
+        return error("Unknown customer or table", 400)
+    except Exception as e:
+        print("POST /api/orders/bulk:", e)
+        return error("Server error", 500)
+
+async def update_order(request):
+    id = request.path_params['id']
+    try:
+        data = await request.json()
+        updates = order_updates(data)
+
+        if not updates:
+            return error("no updatable fields provided", 400)
+        if 'table_id' in updates:
+            updates['table_id'] = optional_int(updates['table_id'])
+
+        set_clause = ', '.join([f"{k}=%s" for k in updates.keys()])
+        async with db.acquire() as conn, conn.transaction():
+            order = await conn.fetchrow(
+                pg(f"UPDATE orders SET {set_clause} WHERE order_id=%s RETURNING *"), *updates.values(), id
+            )
+            if not order:
+                return error("order not found", 404)
+            await publish_order_event(conn, 'update', id)
+        return json_response(dict(order))
+    except Exception as e:
+        print(f"PUT /api/orders/{id}: {e}")
+        return error("Server error", 500)
+
+async def delete_order(request):
+    id = request.path_params['id']
+    try:
+        async with db.acquire() as conn, conn.transaction():
+            order = await conn.fetchrow(
+                "DELETE FROM orders WHERE order_id=$1 RETURNING order_id, customer_id, meal_id", id
+            )
+            if order:
+                await publish_order_event(conn, 'delete', id)
+        if order:
+            recommender.order_removed(dict(order))
+        return Response(status_code=204)
+    except Exception as e:
+        print(f"DELETE /api/orders/{id}: {e}")
+        return error("Server error", 500)
+
+async def order_stream(request):
+    # نفس /api/orders/stream في server.py لكن بلا خيط لكل لوحة:
+    # الأحداث تصل من خيط المستمع إلى حلقة الأحداث مباشرة
+    try:
+        last_event_id = request.headers.get('last-event-id') or request.query_params.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return error("invalid last_event_id", 400)
+
+    try:
+        subscription = await run_in_threadpool(
+            order_feed.subscribe, last_event_id, asyncio.get_running_loop()
+        )
+    except Exception as e:
+        print(f"GET /api/orders/stream: {e}")
+        return error("Server error", 500)
+
+    async def generate():
+        with subscription:
+            yield "retry: 3000\n\n"
+            async for event in subscription.aevents(heartbeat=ORDER_STREAM_HEARTBEAT):
+                yield format_sse(event)
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# ------------------ API Tables ------------------
+@cached('tables')
+async def get_tables(request):
+    try:
+        return json_response(await fetch("SELECT * FROM tables ORDER BY table_id ASC"))
+    except Exception as e:
+        print(f"GET /api/tables: {e}")
+        return error("Server error", 500)
+
+async def add_table(request):
+    data = await request.json()
+    table_number = data.get('table_number')
+    capacity = data.get('capacity')
+    if not table_number or not capacity:
+        return error("Missing fields", 400)
+
+    table = await fetchrow(
+        "INSERT INTO tables (table_number, capacity, status) VALUES (%s, %s, 'Available') RETURNING *",
+        (int(table_number), int(capacity)),
+    )
+    await invalidate('tables')
+    return json_response(table, 201)
+
+async def update_table_status(request):
+    table_id = request.path_params['table_id']
+    try:
+        data = await request.json()
+        new_status = data.get('status')
+        if new_status not in ['Available', 'Reserved']:
+            return error("Invalid status", 400)
+
+        await db.execute("UPDATE tables SET status=$1 WHERE table_id=$2", new_status, table_id)
+        await invalidate('tables')
+        return json_response({"table_id": table_id, "status": new_status})
+    except Exception as e:
+        print(f"PUT /api/tables/{table_id}/status: {e}")
+        return error("Server error", 500)
+
+@cached('tables', 'reservations', vary=available_tables_vary)
+async def get_available_tables(request):
+    try:
+        params = available_tables_args(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    try:
+        return json_response(await fetch(AVAILABLE_TABLES_SQL, params))
+    except Exception as e:
+        print(f"GET /api/available-tables: {e}")
+        return error("Server error", 500)
+
+
+# ------------------ API Reservations ------------------
+async def reserve_table(request):
+    data = await json_body(request) or {}
+    values, message = reservation_values(data)
+    if message:
+        return error(message, 400)
+
+    try:
+        try:
+            reservation = await fetchrow(RESERVE_SQL, values)
+        except asyncpg.exceptions.ExclusionViolationError:
+            return error("Table already reserved for this time", 409)
+        except asyncpg.exceptions.ForeignKeyViolationError:
+            return error("Unknown customer", 400)
+        if not reservation:
+            return error("Table not available", 400)
+        await invalidate('reservations')
+        return json_response(reservation, 201)
+    except Exception as e:
+        print(f"POST /api/reservations: {e}")
+        return error("Server error", 500)
+
+async def cancel_reservation(request):
+    id = request.path_params['id']
+    try:
+        cancelled = await db.fetchval("""
+            UPDATE reservations SET cancelled_at = now()
+            WHERE reservation_id = $1 AND cancelled_at IS NULL
+            RETURNING reservation_id
+        """, id)
+        if not cancelled:
+            return error("reservation not found", 404)
+        await invalidate('reservations')
+        return Response(status_code=204)
+    except Exception as e:
+        print(f"DELETE /api/reservations/{id}: {e}")
+        return error("Server error", 500)
+
+
+# ------------------ API AI ------------------
+def profiled_recommend(mode, customer_id, path):
+    # نفس profiler.profiled في ai_routes.py: التحليل داخل خيط الحساب
+    result, profile, seconds = profiler.run(mode, recommender.recommend, customer_id, 5)
+    profile_id = profiler.save(mode, profile, seconds, path, "ai.recommend") if profile is not None else None
+    return result, profile_id
+
+async def recommend(request):
+    # التوصيات حساب numpy متزامن (وقد تُحمَّل البيانات أول مرة) فتُنفَّذ في خيط
+    # X-Profile / PROFILE_SAMPLE_RATE كما في وضع Flask
+    customer_id = request.path_params['customer_id']
+    mode = profiler.requested_mode(request.headers)
+    if mode is None:
+        result, profile_id = await run_in_threadpool(recommender.recommend, customer_id, 5), None
+    else:
+        path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        result, profile_id = await run_in_threadpool(profiled_recommend, mode, customer_id, path)
+    headers = {"X-Profile-Id": profile_id} if profile_id else None
+
+    if result is None:
+        return json_response({"error": "Customer not found"}, 404, headers)
+
+    return json_response(result, headers=headers)
+
+async def recommend_batch(request):
+    data = await json_body(request) or {}
+    customer_ids = data.get('customer_ids')
+
+    if not isinstance(customer_ids, list) or not customer_ids:
+        return error("customer_ids must be a non-empty list", 400)
+
+    try:
+        customer_ids = [int(c) for c in customer_ids]
+        top_n = int(data.get('top_n', 5))
+    except (TypeError, ValueError):
+        return error("customer_ids and top_n must be integers", 400)
+
+    if top_n < 1:
+        return error("top_n must be positive", 400)
+
+    await run_in_threadpool(recommender.ensure_loaded)
+
+    def generate():
+        for customer_id, meals in recommender.recommend_many(customer_ids, top_n):
+            if meals is None:
+                row = {"customer_id": customer_id, "error": "Customer not found"}
+            else:
+                row = {"customer_id": customer_id, "recommendations": meals}
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(iterate_in_threadpool(generate()), media_type='application/x-ndjson')
+
+
+# ----- App -----
+routes = [
+    Route('/api/db/pool-stats', pool_stats, methods=['GET']),
+    Route('/api/meals', get_meals, methods=['GET']),
+    Route('/api/meal-categories', get_categories, methods=['GET']),
+    Route('/api/meal-categories', add_category, methods=['POST']),
+    Route('/api/customers', get_customers, methods=['GET']),
+    Route('/api/customers/{id:int}', delete_customer, methods=['DELETE']),
+    Route('/api/customers-with-orders', get_customers_with_orders, methods=['GET']),
+    Route('/api/orders', get_orders, methods=['GET']),
+    Route('/api/orders', add_order, methods=['POST']),
+    Route('/api/orders/bulk', add_orders_bulk, methods=['POST']),
+    Route('/api/orders/stream', order_stream, methods=['GET']),
+    Route('/api/orders/{id:int}', update_order, methods=['PUT']),
+    Route('/api/orders/{id:int}', delete_order, methods=['DELETE']),
+    Route('/api/tables', get_tables, methods=['GET']),
+    Route('/api/tables', add_table, methods=['POST']),
+    Route('/api/tables/{table_id:int}/status', update_table_status, methods=['PUT']),
+    Route('/api/available-tables', get_available_tables, methods=['GET']),
+    Route('/api/reservations', reserve_table, methods=['POST']),
+    Route('/api/reservations/{id:int}', cancel_reservation, methods=['DELETE']),
+    Route('/api/ai/recommend/batch', recommend_batch, methods=['POST']),
+    Route('/api/ai/recommend/{customer_id:int}', recommend, methods=['GET']),
+    # كل ما عدا ذلك (رفع الصور، POST/PUT /api/meals، التسجيل والدخول، التصدير...) عبر Flask
+    Mount('/', app=flask_app),
+]
+
+def route_for(scope):
+    # قالب المسار المنفّذ هنا للمقاييس؛ None للطلبات المُمرَّرة إلى Flask (تسجّلها خطافاته)
+    for route in routes:
+        if isinstance(route, Route) and route.matches(scope)[0] == Match.FULL:
+            return route.path
+    return None
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=["https://infosarafg.github.io"],
+                   allow_methods=["*"], allow_headers=["*"], expose_headers=["X-Next-Cursor", "X-Order-Event-Id"]),
+        Middleware(GZipMiddleware, minimum_size=int(os.environ.get("COMPRESS_MIN_SIZE", 1024))),
+        # نفس /metrics وسجل الطلبات البطيئة في server.py
+        Middleware(InstrumentationMiddleware, metrics=server.metrics, slow_log=server.slow_log, route_for=route_for),
+    ],
+    lifespan=lifespan,
+)
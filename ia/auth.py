@@ -0,0 +1,182 @@
+# auth.py
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from flask import g, jsonify, request
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+
+SCHEME = "scrypt"
+
+
+class HasherBusy(Exception):
+    # كل الخيوط مشغولة والطابور ممتلئ: الرد 503 بدل انتظار غير محدود
+    pass
+
+
+def _maxmem(n, r, p):
+    # ذاكرة scrypt ≈ 128·n·r؛ الهامش لـ p والبنى الداخلية
+    return 128 * n * r * (p + 1) + 2 ** 20
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+# =====================================================
+# تخزين كلمات المرور بـ scrypt (مكلف في الذاكرة، المعاملات قابلة للضبط)
+# الصيغة: scrypt$n$r$p$salt$hash، فتغيير المعاملات لا يبطل الكلمات القديمة
+# الحساب في مجمّع خيوط محدود (scrypt يحرر الـ GIL) حتى لا يحجز عمّال الطلبات
+# =====================================================
+class PasswordHasher:
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=2, max_pending=32, timeout=10):
+        self.n, self.r, self.p = n, r, p
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth-hash")
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._dummy = None
+        self.workers, self.max_pending = workers, max_pending
+        self.stats = {"hashed": 0, "verified": 0, "failed": 0, "upgraded": 0, "busy": 0, "seconds": 0.0}
+
+    def _scrypt(self, password, salt, n, r, p):
+        started = time.perf_counter()
+        try:
+            return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, maxmem=_maxmem(n, r, p), dklen=32)
+        finally:
+            self.stats["seconds"] += time.perf_counter() - started
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.stats["busy"] += 1
+            raise HasherBusy()
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(self.timeout)
+
+    def _hash(self, password):
+        salt = os.urandom(16)
+        digest = self._scrypt(password, salt, self.n, self.r, self.p)
+        self.stats["hashed"] += 1
+        return f"{SCHEME}${self.n}${self.r}${self.p}${_b64(salt)}${_b64(digest)}"
+
+    def _check(self, password, stored):
+        # (صحيحة؟، تجزئة جديدة إن كان المخزَّن قديماً أو بمعاملات أخرى)
+        if stored is None:
+            # بريد غير موجود: نفس التكلفة حتى لا يكشف زمن الرد وجود الحساب
+            if self._dummy is None:
+                self._dummy = self._hash(os.urandom(16).hex())
+            self._check(password, self._dummy)
+            return False, None
+
+        parts = stored.split("$")
+        if len(parts) != 6 or parts[0] != SCHEME:
+            # كلمة مرور قديمة بنص صريح: تُقارن ثم تُستبدل بتجزئة عند أول دخول ناجح
+            ok = hmac.compare_digest(password.encode("utf-8"), stored.encode("utf-8"))
+            return ok, self._hash(password) if ok else None
+
+        n, r, p = (int(v) for v in parts[1:4])
+        salt, expected = base64.b64decode(parts[4]), base64.b64decode(parts[5])
+        digest = self._scrypt(password, salt, n, r, p)
+        ok = hmac.compare_digest(digest, expected)
+        stale = ok and (n, r, p) != (self.n, self.r, self.p)
+        return ok, self._hash(password) if stale else None
+
+    def hash(self, password):
+        return self._run(self._hash, password)
+
+    def verify(self, password, stored):
+        ok, upgraded = self._run(self._check, password, stored)
+        self.stats["verified" if ok else "failed"] += 1
+        if upgraded:
+            self.stats["upgraded"] += 1
+        return ok, upgraded
+
+    def config(self):
+        return {"n": self.n, "r": self.r, "p": self.p, "workers": self.workers, "max_pending": self.max_pending}
+
+
+# =====================================================
+# رموز موقَّعة بدون حالة (HMAC عبر itsdangerous): التحقق لا يحتاج قاعدة البيانات
+# AUTH_SECRET يجب أن يكون واحداً لكل العمّال؛ تغييره يبطل كل الرموز
+# =====================================================
+class TokenSigner:
+    def __init__(self, secret, max_age=86400):
+        self.max_age = max_age
+        self._serializer = URLSafeTimedSerializer(secret, salt="customer-auth")
+
+    def issue(self, customer_id):
+        return self._serializer.dumps({"sub": int(customer_id)})
+
+    def verify(self, token):
+        # يعيد المحتوى أو None إذا كان الرمز مزوراً أو منتهياً
+        try:
+            claims = self._serializer.loads(token, max_age=self.max_age)
+        except (SignatureExpired, BadSignature):
+            return None
+        return claims if isinstance(claims, dict) and isinstance(claims.get("sub"), int) else None
+
+    def from_request(self):
+        header = request.headers.get("Authorization", "")
+        scheme, _, token = header.partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        return self.verify(token.strip())
+
+    def required(self, view):
+        # g.customer_id = صاحب الرمز؛ 401 بدون رمز صالح
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            claims = self.from_request()
+            if claims is None:
+                return jsonify({"error": "Invalid or missing token"}), 401
+            g.customer_id = claims["sub"]
+            return view(*args, **kwargs)
+        return wrapper
+
+
+if __name__ == "__main__":
+    # تحويل كل كلمات المرور القديمة (نص صريح) إلى تجزئة دفعة واحدة
+    # الاستعمال: python auth.py rehash
+    import argparse
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description="Hash legacy plaintext passwords")
+    parser.add_argument("command", choices=["rehash"])
+    args = parser.parse_args()
+
+    hasher = PasswordHasher(
+        n=int(os.environ.get("AUTH_SCRYPT_N", 2 ** 14)),
+        r=int(os.environ.get("AUTH_SCRYPT_R", 8)),
+        p=int(os.environ.get("AUTH_SCRYPT_P", 1)),
+        workers=os.cpu_count() or 1,
+        max_pending=1000,
+    )
+    conn = psycopg2.connect(
+        host=os.environ.get("DB_HOST"),
+        database=os.environ.get("DB_NAME"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT customer_id, password FROM customers WHERE password NOT LIKE %s FOR UPDATE",
+                        (SCHEME + "$%",))
+            rows = cur.fetchall()
+            hashed = list(hasher._pool.map(hasher._hash, [password for _, password in rows]))
+            cur.executemany("UPDATE customers SET password = %s WHERE customer_id = %s",
+                            [(h, customer_id) for (customer_id, _), h in zip(rows, hashed)])
+        conn.commit()
+        print(f"Hashed {len(rows)} passwords")
+    finally:
+        conn.close()
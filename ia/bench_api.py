@@ -0,0 +1,296 @@
+# bench_api.py
+# اختبار حمل لمسارات server.py و ai_routes.py على قاعدة bench_seed.py
+# لكل مسار: عملاء متزامنون لمدة محددة ثم p50/p95/p99 والإنتاجية وعدد استعلامات SQL لكل طلب
+# النتائج JSON في bench_results/ للمقارنة بين النسخ:
+#   python bench_api.py run --url http://127.0.0.1:5000 --concurrency 16 --duration 20
+#   python bench_api.py compare bench_results/old.json bench_results/new.json
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+from bench_auth import percentile
+from bench_seed import connect, row_counts
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+
+# عدد الاستعلامات ووقتها من pg_stat_statements (إن كانت مثبّتة)، وإلا عدد المعاملات
+STATEMENTS_SQL = """
+    SELECT COALESCE(SUM(calls), 0), COALESCE(SUM(total_exec_time), 0)
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+      AND query NOT LIKE '%pg_stat_statements%'
+"""
+TRANSACTIONS_SQL = "SELECT xact_commit + xact_rollback FROM pg_stat_database WHERE datname = current_database()"
+# إحصاءات pg_stat_database تُرسل من العمليات الأخرى بعد ثوانٍ (PGSTAT_IDLE_INTERVAL)
+STATS_SETTLE_SECONDS = 11
+
+
+# =====================================================
+# السيناريوهات: كل دالة تعيد (method، path، body، الحالات المقبولة)
+# =====================================================
+def orders_page(rng, ids):
+    # صفحة من أحدث الطلبات، ونصف المرات طلبات زبون واحد
+    path = "/api/orders?limit=50"
+    if rng.random() < 0.5:
+        path += f"&customer_id={rng.randint(*ids['customers'])}"
+    return "GET", path, None, (200,)
+
+
+def customers_with_orders(rng, ids):
+    offset = rng.randrange(0, min(ids["customers"][1], 5000), 50)
+    return "GET", f"/api/customers-with-orders?limit=50&offset={offset}", None, (200,)
+
+
+def recommend(rng, ids):
+    return "GET", f"/api/ai/recommend/{rng.randint(*ids['customers'])}", None, (200,)
+
+
+def add_order(rng, ids):
+    body = {
+        "customer_id": rng.randint(*ids["customers"]),
+        "meal_id": rng.randint(*ids["meals"]),
+        "quantity": rng.randint(1, 3),
+        "price": 10,
+        "order_type": "delivery",
+        "address": "Bench address",
+    }
+    # 202: ORDER_INGEST_MODE=queue
+    return "POST", "/api/orders", body, (200, 201, 202)
+
+
+def reserve(rng, ids):
+    # فترات مستقبلية عشوائية؛ 409 (الطاولة محجوزة) نتيجة متوقعة تحت الحمل
+    start = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(
+        days=rng.randint(1, 365), hours=rng.randint(0, 12))
+    body = {
+        "customer_id": rng.randint(*ids["customers"]),
+        "table_id": rng.choice(ids["tables"]),
+        "reservation_time": start.isoformat(),
+        "party_size": 2,
+    }
+    return "POST", "/api/reservations", body, (201, 409)
+
+
+SCENARIOS = {
+    "orders": orders_page,
+    "customers_with_orders": customers_with_orders,
+    "recommend": recommend,
+    "add_order": add_order,
+    "reservations": reserve,
+}
+
+
+def id_ranges(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(customer_id), MAX(customer_id) FROM customers")
+        customers = cur.fetchone()
+        cur.execute("SELECT MIN(meal_id), MAX(meal_id) FROM meals")
+        meals = cur.fetchone()
+        cur.execute("SELECT table_id FROM tables WHERE capacity >= 2 AND status = 'Available'")
+        tables = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    if None in customers or None in meals or not tables:
+        raise RuntimeError("database has no customers, meals or tables (run bench_seed.py first)")
+    return {"customers": customers, "meals": meals, "tables": tables}
+
+
+# =====================================================
+# عدّاد استعلامات قاعدة البيانات حول كل مسار
+# =====================================================
+class DbCounters:
+    def __init__(self, conn):
+        self.conn = conn
+        self.conn.autocommit = True  # لقطة جديدة في كل قراءة
+        self.source = "pg_stat_statements"
+        try:
+            self._read(STATEMENTS_SQL)
+        except Exception:
+            self.source = "pg_stat_database"
+
+    def _read(self, sql):
+        with self.conn.cursor() as cur:
+            cur.execute(sql)
+            return cur.fetchone()
+
+    def snapshot(self):
+        if self.source == "pg_stat_statements":
+            calls, exec_ms = self._read(STATEMENTS_SQL)
+            return {"queries": int(calls), "db_ms": float(exec_ms)}
+        time.sleep(STATS_SETTLE_SECONDS)
+        return {"transactions": int(self._read(TRANSACTIONS_SQL)[0])}
+
+    def per_request(self, before, after, requests):
+        # الفرق بين لقطتين مقسوماً على عدد الطلبات (يشمل أعمال الخلفية في الخادم)
+        if not requests:
+            return {"source": self.source}
+        stats = {"source": self.source}
+        for key in before:
+            stats[f"{key}_per_request"] = round((after[key] - before[key]) / requests, 2)
+        return stats
+
+
+# =====================================================
+# التشغيل: عملاء متزامنون (اتصال keep-alive لكل عميل) لمدة محددة
+# =====================================================
+def _client(base, scenario, ids, seed, deadline, results, lock):
+    rng = random.Random(seed)
+    url = urlsplit(base)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    local = []
+    while time.perf_counter() < deadline:
+        method, path, body, expected = scenario(rng, ids)
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        started = time.perf_counter()
+        try:
+            conn.request(method, url.path.rstrip("/") + path, payload, headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            status = 0
+        local.append((status, time.perf_counter() - started, status in expected))
+    conn.close()
+    with lock:
+        results.extend(local)
+
+
+def run_scenario(base, name, ids, concurrency, duration, seed):
+    results, lock = [], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=_client, args=(base, SCENARIOS[name], ids, f"{seed}-{name}-{i}", deadline, results, lock))
+        for i in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - started
+
+
+def summarize(results, elapsed):
+    statuses = {}
+    for status, _, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ok = [latency * 1000 for _, latency, expected in results if expected]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "statuses": statuses,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(len(ok) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(ok) / len(ok), 2) if ok else None,
+            "p50": round(percentile(ok, 50), 2) if ok else None,
+            "p95": round(percentile(ok, 95), 2) if ok else None,
+            "p99": round(percentile(ok, 99), 2) if ok else None,
+            "max": round(max(ok), 2) if ok else None,
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(base, routes, concurrency, duration, warmup, seed, out_dir, label=None):
+    conn = connect()
+    try:
+        ids = id_ranges(conn)
+        report = {
+            "label": label,
+            "commit": git_commit(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "url": base,
+            "concurrency": concurrency,
+            "duration": duration,
+            "host": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+            "dataset": row_counts(conn),
+            "routes": {},
+        }
+        counters = DbCounters(conn)
+        for name in routes:
+            if warmup:
+                run_scenario(base, name, ids, concurrency, warmup, f"{seed}-warmup")
+            before = counters.snapshot()
+            results, elapsed = run_scenario(base, name, ids, concurrency, duration, seed)
+            after = counters.snapshot()
+            stats = summarize(results, elapsed)
+            stats["db"] = counters.per_request(before, after, len(results))
+            report["routes"][name] = stats
+            latency = stats["latency_ms"]
+            print(f"{name:<24} {stats['throughput_rps']:>8} req/s  p50 {latency['p50']} ms  "
+                  f"p95 {latency['p95']} ms  p99 {latency['p99']} ms  errors {stats['errors']}  db {stats['db']}")
+    finally:
+        conn.close()
+
+    os.makedirs(out_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'nogit'}{'-' + label if label else ''}.json"
+    path = os.path.join(out_dir, name)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {path}")
+    return report
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    print(f"{'route':<24} {'metric':<26} {'old':>10} {'new':>10} {'change':>8}")
+    for route in new["routes"]:
+        if route not in old["routes"]:
+            continue
+        a, b = old["routes"][route], new["routes"][route]
+        rows = [("throughput_rps", a["throughput_rps"], b["throughput_rps"])]
+        rows += [(f"{q} ms", a["latency_ms"][q], b["latency_ms"][q]) for q in ("p50", "p95", "p99")]
+        rows += [(k, a["db"].get(k), b["db"].get(k)) for k in b["db"] if k.endswith("_per_request")]
+        for metric, x, y in rows:
+            change = f"{(y - x) / x * 100:+.1f}%" if x and y is not None else ""
+            print(f"{route:<24} {metric:<26} {x!s:>10} {y!s:>10} {change:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the API routes and save the results as JSON")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="benchmark a running server (DB_* must point at its database)")
+    r.add_argument("--url", default="http://127.0.0.1:5000")
+    r.add_argument("--routes", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    r.add_argument("--concurrency", type=int, default=16)
+    r.add_argument("--duration", type=float, default=20, help="seconds per route")
+    r.add_argument("--warmup", type=float, default=3, help="seconds per route, not recorded")
+    r.add_argument("--seed", default="bench", help="client random seed (same requests across runs)")
+    r.add_argument("--label", help="appended to the result file name")
+    r.add_argument("--out", default=RESULTS_DIR)
+
+    c = sub.add_parser("compare", help="compare two result files")
+    c.add_argument("old")
+    c.add_argument("new")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args.url.rstrip("/"), args.routes, args.concurrency, args.duration, args.warmup,
+            args.seed, args.out, args.label)
+    else:
+        compare(args.old, args.new)
@@ -0,0 +1,120 @@
+# bench_auth.py
+# قياس تكلفة التجزئة وإنتاجية تسجيل الدخول لاختيار AUTH_SCRYPT_N و AUTH_HASH_WORKERS
+# الاستعمال:
+#   python bench_auth.py hash --n 16384 32768 65536 --workers 1 2 4
+#   python bench_auth.py login --url http://127.0.0.1:5000 --concurrency 16 --requests 400
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from auth import PasswordHasher
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))] if values else None
+
+
+def bench_hash(n_values, r, p, worker_counts, seconds):
+    print(f"{'n':>8} {'r':>3} {'p':>3} {'mem MB':>7} {'workers':>8} {'ms/hash':>8} {'hashes/s':>9}")
+    for n in n_values:
+        for workers in worker_counts:
+            hasher = PasswordHasher(n=n, r=r, p=p, workers=workers, max_pending=workers * 4)
+            stored = hasher.hash("bench-password")
+            latencies = []
+            lock = threading.Lock()
+            deadline = time.perf_counter() + seconds
+
+            def client():
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    hasher.verify("bench-password", stored)
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for _ in range(workers):
+                    pool.submit(client)
+            elapsed = time.perf_counter() - started
+            mem = 128 * n * r / 2 ** 20
+            print(f"{n:>8} {r:>3} {p:>3} {mem:>7.0f} {workers:>8} "
+                  f"{statistics.median(latencies) * 1000:>8.1f} {len(latencies) / elapsed:>9.1f}")
+
+
+def _post(url, body):
+    req = urllib.request.Request(url, json.dumps(body).encode(), {"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=30) as res:
+            return res.status, json.loads(res.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def bench_login(url, email, password, concurrency, requests):
+    if not email:
+        # حساب مؤقت للقياس
+        name = f"bench-{uuid.uuid4().hex[:10]}"
+        email, password = f"{name}@example.com", "bench-password"
+        status, _ = _post(f"{url}/api/register",
+                          {"first_name": "Bench", "username": name, "email": email, "password": password})
+        if status != 201:
+            raise SystemExit(f"register failed ({status})")
+
+    def login(_):
+        started = time.perf_counter()
+        status, data = _post(f"{url}/api/login", {"email": email, "password": password})
+        return status, time.perf_counter() - started, bool(data and data.get("token"))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(login, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    statuses = {}
+    for status, _, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    ok = [latency for status, latency, token in results if status == 200 and token]
+    report = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "logins_per_second": round(len(ok) / elapsed, 1),
+        "statuses": statuses,
+        "p50_ms": round(percentile(ok, 50) * 1000, 1) if ok else None,
+        "p95_ms": round(percentile(ok, 95) * 1000, 1) if ok else None,
+        "p99_ms": round(percentile(ok, 99) * 1000, 1) if ok else None,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark password hashing and login throughput")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    h = sub.add_parser("hash", help="scrypt cost per parameter set (no server needed)")
+    h.add_argument("--n", type=int, nargs="+", default=[int(os.environ.get("AUTH_SCRYPT_N", 2 ** 14))])
+    h.add_argument("--r", type=int, default=int(os.environ.get("AUTH_SCRYPT_R", 8)))
+    h.add_argument("--p", type=int, default=int(os.environ.get("AUTH_SCRYPT_P", 1)))
+    h.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    h.add_argument("--seconds", type=float, default=3)
+
+    l = sub.add_parser("login", help="POST /api/login against a running server")
+    l.add_argument("--url", default="http://127.0.0.1:5000")
+    l.add_argument("--email", help="existing account (default: register a temporary one)")
+    l.add_argument("--password")
+    l.add_argument("--concurrency", type=int, default=16)
+    l.add_argument("--requests", type=int, default=400)
+
+    args = parser.parse_args()
+    if args.command == "hash":
+        bench_hash(args.n, args.r, args.p, args.workers, args.seconds)
+    else:
+        bench_login(args.url.rstrip("/"), args.email, args.password, args.concurrency, args.requests)
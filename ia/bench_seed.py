@@ -0,0 +1,230 @@
+# bench_seed.py
+# قاعدة بيانات اصطناعية بحجم قابل للضبط لاختبارات الأداء (bench_api.py)
+# الاستعمال (قاعدة منفصلة، مثلاً DB_NAME=restaurant_bench):
+#   python bench_seed.py --customers 100000 --orders 5000000 --meals 5000 --reset
+import argparse
+import os
+import time
+
+import psycopg2
+
+from auth import PasswordHasher
+from customer_features import refresh_features
+from migrate import load_migrations, migrate_up, statements
+
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sql_IA.sql")
+BENCH_PASSWORD = "bench-password"
+
+SEEDED_TABLES = (
+    "customers", "meal_categories", "meals", "tables", "orders", "reservations", "order_events",
+    "customer_recommendations", "customer_features", "feature_watermarks",
+)
+
+# كلمات الأوصاف: تشمل كلمات HEALTH_RULES و HEALTHY_WORDS حتى تعمل كل فروع التقييم
+DESCRIPTION_WORDS = [
+    "مشوي", "سلطة", "طبيعي", "fresh", "ملح", "مقلي", "fried", "سكر", "عسل", "cake", "sweet",
+    "steam", "low salt", "بدون سكر", "لحم", "خضار", "دجاج", "أرز", "خبز", "جبن", "حار", "زيتون",
+]
+
+CATEGORIES_SQL = """
+    INSERT INTO meal_categories (category_name)
+    SELECT 'Bench category ' || i FROM generate_series(1, %(categories)s) i
+"""
+
+MEALS_SQL = """
+    INSERT INTO meals (category_id, meal_time, name, price, description, image_url)
+    SELECT 1 + i %% %(categories)s,
+           (enum_range(NULL::meal_time_enum))[1 + i %% 4],
+           'Bench meal ' || i,
+           round((1 + random() * 1500)::numeric, 2),
+           w[1 + floor(random() * cardinality(w))::int] || ' ' ||
+           w[1 + floor(random() * cardinality(w))::int] || ' ' ||
+           w[1 + floor(random() * cardinality(w))::int],
+           NULL
+    FROM generate_series(1, %(meals)s) i, (SELECT %(words)s::text[] AS w) words
+"""
+
+CUSTOMERS_SQL = """
+    INSERT INTO customers (first_name, last_name, phone, address, email, username, password, age, health_condition)
+    SELECT 'Bench', 'Customer ' || i, '0555' || lpad(i::text, 6, '0'), 'Bench address',
+           'bench' || i || '@example.com', 'bench' || i, %(password)s,
+           CASE WHEN random() < 0.05 THEN NULL ELSE 8 + floor(random() * 72)::int END,
+           (ARRAY['None', 'None', 'None', 'Diabetic', 'Hypertension'])[1 + floor(random() * 5)::int]
+    FROM generate_series(1, %(customers)s) i
+"""
+
+TABLES_SQL = """
+    INSERT INTO tables (table_number, capacity, location, status)
+    SELECT i, 2 + 2 * (i %% 4), 'Bench hall', 'Available' FROM generate_series(1, %(tables)s) i
+"""
+
+# الطلبات موزعة بشكل غير متساوٍ (random()^2): قلة من الزبائن لديهم طلبات كثيرة
+ORDERS_SQL = """
+    INSERT INTO orders (customer_id, meal_id, quantity, price, status, order_datetime, order_type, address, table_id)
+    SELECT o.customer_id, o.meal_id, o.quantity, m.price * o.quantity, o.status, o.order_datetime,
+           CASE WHEN o.delivery THEN 'delivery' ELSE 'dinein' END,
+           CASE WHEN o.delivery THEN 'Bench address' END,
+           CASE WHEN o.delivery THEN NULL ELSE o.table_id END
+    FROM (
+        SELECT 1 + floor(power(random(), 2) * %(customers)s)::int AS customer_id,
+               1 + floor(random() * %(meals)s)::int AS meal_id,
+               1 + floor(random() * 3)::int AS quantity,
+               (enum_range(NULL::order_status_enum))[1 + floor(random() * 5)::int] AS status,
+               now() - random() * interval '365 days' AS order_datetime,
+               random() < 0.8 AS delivery,
+               1 + floor(random() * %(tables)s)::int AS table_id
+        FROM generate_series(1, %(n)s)
+    ) o
+    JOIN meals m ON m.meal_id = o.meal_id
+"""
+
+# حجوزات سابقة: طاولة واحدة في اليوم لكل حجز فلا تتداخل الفترات
+RESERVATIONS_SQL = """
+    INSERT INTO reservations (customer_id, table_id, reservation_datetime, reservation_end, party_size)
+    SELECT 1 + floor(random() * %(customers)s)::int, 1 + (i - 1) %% %(tables)s, s, s + interval '90 minutes', 2
+    FROM generate_series(1, %(reservations)s) i,
+         LATERAL (SELECT date_trunc('day', now()) - ((i - 1) / %(tables)s + 1) * interval '1 day'
+                         + interval '12 hours' AS s) slot
+"""
+
+
+def connect():
+    return psycopg2.connect(
+        host=os.environ.get("DB_HOST"),
+        database=os.environ.get("DB_NAME"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+
+
+def has_schema(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('public.customers') IS NOT NULL")
+        exists = cur.fetchone()[0]
+    conn.rollback()
+    return exists
+
+
+def create_schema(conn, path=SCHEMA_FILE):
+    # تعريفات sql_IA.sql فقط (بدون بيانات المثال)؛ الملف ليس بترتيب الاعتماديات
+    # (orders قبل meals) فتُعاد العبارات الفاشلة حتى لا يبقى تقدّم
+    with open(path, encoding="utf-8") as f:
+        sql = f.read()
+    pending = []
+    for statement in statements(sql):
+        code = "\n".join(line for line in statement.splitlines() if not line.strip().startswith("--")).strip()
+        if code and code.split(None, 1)[0].upper() not in ("INSERT", "SELECT"):
+            pending.append(code)
+
+    conn.autocommit = True
+    try:
+        while pending:
+            failed = []
+            with conn.cursor() as cur:
+                for statement in pending:
+                    try:
+                        cur.execute(statement)
+                    except psycopg2.Error as e:
+                        failed.append((statement, e))
+            if len(failed) == len(pending):
+                raise RuntimeError(f"cannot apply {path}: {failed[0][1]}")
+            pending = [statement for statement, _ in failed]
+    finally:
+        conn.autocommit = False
+    return migrate_up(conn, load_migrations())
+
+
+def row_counts(conn):
+    # تقدير من الإحصاءات (count(*) على ملايين الطلبات بطيء)
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT relname, GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relkind = 'r' AND relname = ANY(%s)",
+            (list(SEEDED_TABLES),),
+        )
+        counts = dict(cur.fetchall())
+    conn.rollback()
+    return counts
+
+
+def seed(conn, customers, orders, meals, categories=20, tables=50, reservations=10000,
+         chunk_size=500000, random_seed=0.42, reset=False):
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM customers) OR EXISTS (SELECT 1 FROM meals)")
+        if cur.fetchone()[0] and not reset:
+            conn.rollback()
+            raise RuntimeError("database is not empty (use --reset to truncate it)")
+        cur.execute(f"TRUNCATE {', '.join(SEEDED_TABLES)} RESTART IDENTITY CASCADE")
+        conn.commit()
+
+    # كل الحسابات بنفس كلمة المرور (bench_auth.py login --email bench1@example.com)
+    password = PasswordHasher(
+        n=int(os.environ.get("AUTH_SCRYPT_N", 2 ** 14)),
+        r=int(os.environ.get("AUTH_SCRYPT_R", 8)),
+        p=int(os.environ.get("AUTH_SCRYPT_P", 1)),
+    ).hash(BENCH_PASSWORD)
+
+    params = {
+        "customers": customers, "meals": meals, "categories": categories, "tables": tables,
+        "reservations": reservations, "password": password, "words": DESCRIPTION_WORDS,
+    }
+    steps = [
+        ("meal_categories", CATEGORIES_SQL, params),
+        ("meals", MEALS_SQL, params),
+        ("customers", CUSTOMERS_SQL, params),
+        ("tables", TABLES_SQL, params),
+        ("reservations", RESERVATIONS_SQL, params),
+    ]
+    # الطلبات على دفعات: معاملة لكل دفعة والتقدم ظاهر
+    for start in range(0, orders, chunk_size):
+        steps.append((f"orders {start + 1}-{min(start + chunk_size, orders)}", ORDERS_SQL,
+                      dict(params, n=min(chunk_size, orders - start))))
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT setseed(%s)", (random_seed,))
+        for name, sql, step_params in steps:
+            started = time.time()
+            cur.execute(sql, step_params)
+            conn.commit()
+            print(f"{name}: {cur.rowcount} rows in {time.time() - started:.1f}s")
+
+    # الميزات جاهزة مسبقاً حتى يقيس bench_api الحالة المستقرة وليس أول تحديث
+    started = time.time()
+    updated = refresh_features(conn, rebuild=True, lag_seconds=0, wait=True)
+    print(f"customer_features: {updated} rows in {time.time() - started:.1f}s")
+
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("ANALYZE")
+    finally:
+        conn.autocommit = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed a database with synthetic data for benchmarks")
+    parser.add_argument("--customers", type=int, default=100000)
+    parser.add_argument("--orders", type=int, default=5000000)
+    parser.add_argument("--meals", type=int, default=5000)
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--tables", type=int, default=50)
+    parser.add_argument("--reservations", type=int, default=10000)
+    parser.add_argument("--chunk-size", type=int, default=500000, help="orders per transaction")
+    parser.add_argument("--seed", type=float, default=0.42, help="setseed() value, for reproducible data")
+    parser.add_argument("--reset", action="store_true", help="truncate existing data first")
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        if not has_schema(conn):
+            print("Creating schema from sql_IA.sql")
+            create_schema(conn)
+        else:
+            migrate_up(conn, load_migrations())
+        started = time.time()
+        seed(conn, args.customers, args.orders, args.meals, args.categories, args.tables,
+             args.reservations, args.chunk_size, args.seed, args.reset)
+        print(f"Seeded in {time.time() - started:.1f}s: {row_counts(conn)}")
+    finally:
+        conn.close()
@@ -0,0 +1,184 @@
+# cache.py
+import hashlib
+import json
+import threading
+import time
+import uuid
+from functools import wraps
+
+from flask import request, Response
+
+
+# =====================================================
+# واجهات التخزين (backend)
+# MemoryBackend داخل العملية؛ RedisBackend مشترك بين العمّال (اختياري)
+# أي كائن يوفّر get / set / incr يمكن أن يحل محلهما
+# =====================================================
+class MemoryBackend:
+    shared = False
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = {}
+        self._counters = {}  # أرقام النسخ لا تُحذف عند الإخلاء
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if len(self._data) >= self.max_entries and key not in self._data:
+                self._evict()
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def incr(self, key):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def _evict(self):
+        # حذف المنتهية أولاً ثم الأقدم إدراجاً
+        now = time.monotonic()
+        expired = [k for k, (_, exp) in self._data.items() if exp is not None and exp < now]
+        for k in expired:
+            del self._data[k]
+        while len(self._data) >= self.max_entries:
+            del self._data[next(iter(self._data))]
+
+
+class RedisBackend:
+    shared = True
+
+    def __init__(self, url, prefix="smart_restorent:"):
+        import redis  # اعتماد اختياري
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self._redis.get(self.prefix + key)
+
+    def set(self, key, value, ttl=None):
+        self._redis.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def incr(self, key):
+        return self._redis.incr(self.prefix + key)
+
+
+# لاحقات ETag التي يضيفها الضغط (compression.py) لنفس المحتوى
+ENCODING_SUFFIXES = ("", "-gzip", "-br")
+
+NOT_MODIFIED = object()
+
+
+# =====================================================
+# كاش الاستجابات: JSON مُسلسل جاهز + ETag
+# الإبطال بزيادة رقم نسخة كل وسم (tag) فتصبح المفاتيح القديمة غير مستعملة
+# =====================================================
+class ResponseCache:
+    def __init__(self, backend=None, ttl=60):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        # أرقام النسخ في كاش داخل العملية لا تخص إلا هذه العملية
+        self._epoch = "" if getattr(self.backend, "shared", False) else uuid.uuid4().hex[:8] + "."
+
+    def version(self, tag):
+        return int(self.backend.get(f"version:{tag}") or 0)
+
+    def invalidate(self, *tags):
+        for tag in tags:
+            self.backend.incr(f"version:{tag}")
+
+    def _key(self, tags, path, items):
+        versions = ".".join(str(self.version(t)) for t in tags)
+        query = "&".join(sorted(f"{k}={v}" for k, v in items))
+        scope = hashlib.sha1(f"{path}?{query}".encode()).hexdigest()[:16]
+        return f"response:{scope}:{versions}"
+
+    def _etag(self, key):
+        # ETag قوي من أرقام نسخ الجداول؛ يتجدد أيضاً كل ttl لحصر أثر
+        # أي تعديل يتم خارج التطبيق مباشرة على قاعدة البيانات
+        scope, versions = key.split(":")[1:]
+        return f"{scope}-{self._epoch}{int(time.time() // self.ttl)}-{versions}"
+
+    @staticmethod
+    def _pack(headers, body):
+        return json.dumps(headers).encode() + b"\n" + body
+
+    @staticmethod
+    def _unpack(raw):
+        headers, body = raw.split(b"\n", 1)
+        return json.loads(headers), body
+
+    @staticmethod
+    def _respond(etag, headers, body):
+        response = Response(body, mimetype="application/json")
+        response.set_etag(etag)
+        for name, value in headers.items():
+            response.headers[name] = value
+        return response
+
+    def probe(self, tags, path, items, if_none_match):
+        # (key, etag, hit): hit = NOT_MODIFIED أو (headers, body) أو None
+        # مستقل عن Flask ليستعمله asgi_app.py أيضاً
+        key = self._key(tags, path, items)
+        etag = self._etag(key)
+
+        # 304 مباشرة دون تنفيذ الاستعلام ولا قراءة الكاش
+        if any(etag + suffix in if_none_match for suffix in ENCODING_SUFFIXES):
+            self.not_modified += 1
+            return key, etag, NOT_MODIFIED
+
+        raw = self.backend.get(key)
+        if raw is not None:
+            self.hits += 1
+            return key, etag, self._unpack(raw)
+
+        self.misses += 1
+        return key, etag, None
+
+    def store(self, key, headers, body, ttl=None):
+        self.backend.set(key, self._pack(headers, body), ttl or self.ttl)
+
+    def cached(self, *tags, ttl=None, vary=None):
+        # vary(args): عناصر إضافية للمفتاح لا تظهر في الرابط (مثلاً الوقت الحالي)
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                items = list(request.args.items(multi=True))
+                if vary is not None:
+                    items += vary(request.args)
+                key, etag, hit = self.probe(tags, request.path, items, request.if_none_match)
+                if hit is NOT_MODIFIED:
+                    response = Response(status=304)
+                    response.set_etag(etag)
+                    return response
+                if hit is not None:
+                    return self._respond(etag, *hit)
+
+                response = view(*args, **kwargs)
+                if isinstance(response, tuple) or response.status_code != 200 or response.is_streamed:
+                    return response
+
+                body = response.get_data()
+                headers = {k: v for k, v in response.headers.items() if k.startswith("X-")}
+                self.store(key, headers, body, ttl)
+                return self._respond(etag, headers, body)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
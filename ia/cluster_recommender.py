@@ -0,0 +1,147 @@
+# cluster_recommender.py
+import threading
+import time
+
+import numpy as np
+
+from recommender import RESULT_FIELDS
+
+
+CANDIDATE_FACTOR = 3  # عدد المرشحين الشائعين لكل نتيجة قبل الدمج مع درجة القواعد
+
+# شعبية الوجبات داخل كل مجموعة من تعيينات النموذج الحالي
+POPULARITY_SQL = """
+    SELECT a.cluster, o.meal_id, COUNT(*) AS n
+    FROM unnest(%s::int[], %s::int[]) AS a(customer_id, cluster)
+    JOIN orders o ON o.customer_id = a.customer_id
+    GROUP BY a.cluster, o.meal_id
+    ORDER BY a.cluster, n DESC, o.meal_id
+"""
+
+
+def bitset(mask):
+    # مصفوفة منطقية -> عدد صحيح (البت i = الوجبة i)
+    return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+# =====================================================
+# توصيات حسب المجموعة: الأكثر طلباً في مجموعة الزبون
+# بعد استبعاد غير الآمن لحالته الصحية، مدموجة مع درجة القواعد
+# كل شيء يُحسب مرة لكل تحديث؛ الطلب نفسه O(top_n)
+# =====================================================
+class ClusterRecommender:
+    def __init__(self, engine, store, recommender, refresh_interval=300):
+        self._db = engine
+        self.store = store
+        self.recommender = recommender
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._popularity = None    # (نسخة النموذج، وقت البناء، cluster -> [(meal_id, شعبية 0..1)])
+        self._safety = None        # (scorer، condition -> bitset، فهرس meal_id)
+
+    # ---------- البناء ----------
+    def _load_popularity(self, model):
+        ids, clusters = model.artifact["customer_ids"], model.artifact["clusters"]
+        conn = self._db.raw_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(POPULARITY_SQL, (ids.tolist(), clusters.tolist()))
+                rows = cur.fetchall()
+            conn.rollback()
+        finally:
+            conn.close()
+
+        ranked = {}
+        for cluster, meal_id, n in rows:
+            ranked.setdefault(int(cluster), []).append((int(meal_id), int(n)))
+        # شعبية نسبية لأكثر وجبة في المجموعة
+        return {c: [(mid, n / meals[0][1]) for mid, n in meals] for c, meals in ranked.items()}
+
+    def _popularity_for(self, model):
+        state = self._popularity
+        fresh = (
+            state is not None and state[0] == model.version
+            and time.monotonic() - state[1] < self.refresh_interval
+        )
+        if fresh:
+            return state[2]
+        # عملية بناء واحدة؛ الطلبات الأخرى تستعمل النسخة السابقة إن وجدت
+        if not self._lock.acquire(blocking=state is None or state[0] != model.version):
+            return state[2]
+        try:
+            state = self._popularity
+            if state is None or state[0] != model.version or time.monotonic() - state[1] >= self.refresh_interval:
+                self._popularity = (model.version, time.monotonic(), self._load_popularity(model))
+            return self._popularity[2]
+        finally:
+            self._lock.release()
+
+    def _safety_for(self, scorer):
+        # يُعاد بناؤه عند تغيّر الوجبات (scorer جديد)
+        state = self._safety
+        if state is None or state[0] is not scorer:
+            safe = {c: bitset(scorer.safe_mask(c)) for c in scorer.conditions}
+            index = {m["meal_id"]: i for i, m in enumerate(scorer.meals)}
+            state = self._safety = (scorer, safe, index)
+        return state
+
+    # ---------- التوصية ----------
+    def recommend(self, customer_id, top_n=5, blend=0.5):
+        # blend: وزن درجة القواعد (0 = الشعبية فقط، 1 = القواعد فقط)
+        # يعيد None إذا كان الزبون غير موجود، ويرفع LookupError بدون نموذج
+        model = self.store.current()
+        if model is None:
+            raise LookupError("No cluster model trained")
+
+        self.recommender.ensure_loaded()
+        customer = self.recommender.customer_features(customer_id)
+        if customer is None:
+            return None
+
+        cluster = model.cluster_of(customer_id)
+        if cluster is None:
+            cluster = model.assign(customer)
+
+        popularity = self._popularity_for(model)
+        scorer = self.recommender.scorer()
+        _, safe_sets, index = self._safety_for(scorer)
+        safe = safe_sets.get(customer["health_condition"])
+
+        candidates, weights = [], []
+        for meal_id, weight in popularity.get(cluster, ()):
+            i = index.get(meal_id)
+            if i is None or (safe is not None and not safe >> i & 1):
+                continue
+            candidates.append(i)
+            weights.append(weight)
+            if len(candidates) >= top_n * CANDIDATE_FACTOR:
+                break
+
+        results = []
+        if candidates:
+            rules = scorer.score([customer], candidates)[0]
+            blended = blend * rules + (1 - blend) * np.array(weights)
+            for j in np.argsort(-blended, kind="stable")[:top_n]:
+                i = candidates[j]
+                results.append(dict(
+                    {k: scorer.meals[i][k] for k in RESULT_FIELDS},
+                    score=round(float(blended[j]), 3),
+                    popularity=round(weights[j], 3),
+                ))
+
+        # مجموعة بلا طلبات كافية: إكمال القائمة بتوصيات القواعد
+        # بنفس فلتر الأمان (القواعد تخفض درجة غير الآمن فقط ولا تستبعده)؛
+        # يُطلب عدد يكفي حتى لو جاءت كل الوجبات غير الآمنة في المقدمة
+        if len(results) < top_n:
+            seen = {r["meal_id"] for r in results}
+            unsafe = len(scorer) - safe.bit_count() if safe is not None else 0
+            for meal in self.recommender.recommend(customer_id, top_n + len(seen) + unsafe) or ():
+                if len(results) >= top_n:
+                    break
+                i = index.get(meal["meal_id"])
+                if meal["meal_id"] in seen or i is None or (safe is not None and not safe >> i & 1):
+                    continue
+                results.append(dict(meal, score=round(blend * meal["score"], 3), popularity=0.0))
+
+        return {"customer_id": customer_id, "cluster": cluster, "model_version": model.version,
+                "recommendations": results}
@@ -0,0 +1,279 @@
+# clustering.py
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+import sklearn
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
+
+
+FEATURES_SQL = "SELECT customer_id, age, health_condition, fav_category FROM customer_features"
+MODEL_FILE = "model.joblib"
+METADATA_FILE = "metadata.json"
+CURRENT_FILE = "CURRENT"
+
+
+def categorical_values(health_condition, fav_category):
+    # نفس الترميز في التدريب والتقديم (fav_category: رقم، None أو "Unknown")
+    health = "None" if health_condition is None else str(health_condition)
+    fav = "Unknown" if fav_category in (None, "Unknown") else str(int(fav_category))
+    return [health, fav]
+
+
+def _age(value):
+    # العمر مقدَّر مسبقاً في customer_features؛ None فقط إذا كانت كل الأعمار مجهولة
+    return 0.0 if value is None or value != value else float(value)
+
+
+# =====================================================
+# التدريب: القراءة من customer_features على دفعات و MiniBatchKMeans.partial_fit
+# حتى لا تتجاوز الذاكرة حجم دفعة واحدة مهما كبر عدد الزبائن
+# =====================================================
+def _chunks(conn, chunk_size, where="", params=()):
+    with conn.cursor(name="cluster_features") as cur:
+        cur.itersize = chunk_size
+        cur.execute(f"{FEATURES_SQL} {where} ORDER BY customer_id", params)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    conn.rollback()
+
+
+def _transform(encoder, scaler, rows):
+    ages = scaler.transform(np.array([[_age(r[1])] for r in rows]))
+    encoded = encoder.transform([categorical_values(r[2], r[3]) for r in rows]).toarray()
+    return np.hstack([ages, encoded])
+
+
+def features_as_of(conn):
+    # أحدث تحديث للميزات قبل القراءة؛ update يبدأ منه
+    with conn.cursor() as cur:
+        cur.execute("SELECT MAX(updated_at) FROM customer_features")
+        latest = cur.fetchone()[0]
+    conn.rollback()
+    return latest.isoformat() if latest else None
+
+
+def fit_preprocessing(conn):
+    # المجال والفئات من SQL بدل تحميل الجدول كاملاً
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(age), MAX(age) FROM customer_features")
+        low, high = cur.fetchone()
+        cur.execute("SELECT DISTINCT health_condition, fav_category FROM customer_features")
+        values = [categorical_values(*row) for row in cur.fetchall()]
+    conn.rollback()
+    if not values:
+        raise ValueError("customer_features is empty")
+
+    scaler = MinMaxScaler(clip=True).fit([[_age(low)], [_age(high)]])
+    categories = [sorted({v[i] for v in values}) for i in range(2)]
+    encoder = OneHotEncoder(categories=categories, handle_unknown="ignore").fit(values)
+    return encoder, scaler
+
+
+def _assign_all(conn, encoder, scaler, model, chunk_size, where="", params=()):
+    ids, labels, inertia = [], [], 0.0
+    for rows in _chunks(conn, chunk_size, where, params):
+        X = _transform(encoder, scaler, rows)
+        distances = model.transform(X).min(axis=1)
+        ids += [r[0] for r in rows]
+        labels += model.predict(X).tolist()
+        inertia += float((distances ** 2).sum())
+    return ids, labels, inertia
+
+
+def train(conn, n_clusters=4, chunk_size=10000, epochs=3, random_state=42):
+    encoder, scaler = fit_preprocessing(conn)
+    model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=chunk_size, random_state=random_state, n_init=3)
+    fitted = False
+    for _ in range(epochs):
+        for rows in _chunks(conn, chunk_size):
+            if not fitted and len(rows) < n_clusters:
+                raise ValueError(f"need at least {n_clusters} customers to train")
+            model.partial_fit(_transform(encoder, scaler, rows))
+            fitted = True
+
+    ids, labels, inertia = _assign_all(conn, encoder, scaler, model, chunk_size)
+    return _artifact(encoder, scaler, model, dict(zip(ids, labels)), inertia, mode="train", parent=None)
+
+
+def update(conn, current, chunk_size=10000):
+    # تحديث تدريجي: partial_fit على الزبائن الذين تغيّرت ميزاتهم منذ النسخة الحالية
+    # (المرمّز والمقياس ثابتان؛ الفئات الجديدة تُتجاهل حتى التدريب الكامل التالي)
+    artifact = current.artifact
+    encoder, scaler, model = artifact["encoder"], artifact["scaler"], artifact["model"]
+    # هامش دقيقة كما في recommender: إعادة تمرير صف مرتين لا تضر
+    where = "WHERE updated_at > CAST(%s AS timestamp) - interval '1 minute'"
+    params = (current.metadata["features_as_of"],)
+
+    changed = 0
+    for rows in _chunks(conn, chunk_size, where, params):
+        model.partial_fit(_transform(encoder, scaler, rows))
+        changed += len(rows)
+    if not changed:
+        return None
+
+    assignments = dict(zip(artifact["customer_ids"].tolist(), artifact["clusters"].tolist()))
+    ids, labels, _ = _assign_all(conn, encoder, scaler, model, chunk_size, where, params)
+    assignments.update(zip(ids, labels))
+    return _artifact(encoder, scaler, model, assignments, None, mode="update", parent=current.version)
+
+
+def _artifact(encoder, scaler, model, assignments, inertia, mode, parent):
+    ids = np.fromiter(assignments, dtype=np.int64, count=len(assignments))
+    clusters = np.fromiter(assignments.values(), dtype=np.int32, count=len(assignments))
+    metadata = {
+        "mode": mode,
+        "parent": parent,
+        "trained_at": datetime.now().isoformat(timespec="seconds"),
+        "n_clusters": int(model.n_clusters),
+        "n_customers": len(assignments),
+        "cluster_sizes": np.bincount(clusters, minlength=model.n_clusters).tolist(),
+        "inertia": inertia,
+        "features": ["age"] + encoder.get_feature_names_out(["health_condition", "fav_category"]).tolist(),
+        "sklearn_version": sklearn.__version__,
+    }
+    return {
+        "encoder": encoder,
+        "scaler": scaler,
+        "model": model,
+        "centroids": model.cluster_centers_,
+        "customer_ids": ids,
+        "clusters": clusters,
+    }, metadata
+
+
+# =====================================================
+# النسخ: models/clusters/<version>/{model.joblib, metadata.json}
+# والملف CURRENT يشير إلى النسخة المستعملة (يُستبدل ذرياً)
+# =====================================================
+def save(folder, artifact, metadata, features_as_of, keep=5):
+    os.makedirs(folder, exist_ok=True)
+    version = base = time.strftime("%Y%m%d-%H%M%S")
+    n = 1
+    while os.path.exists(os.path.join(folder, version)):
+        n += 1
+        version = f"{base}-{n}"
+    metadata = dict(metadata, version=version, features_as_of=features_as_of)
+
+    tmp = tempfile.mkdtemp(dir=folder, prefix=".tmp-")
+    try:
+        joblib.dump(artifact, os.path.join(tmp, MODEL_FILE))
+        with open(os.path.join(tmp, METADATA_FILE), "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        os.rename(tmp, os.path.join(folder, version))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    fd, pointer = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(folder, CURRENT_FILE))
+
+    for old in versions(folder)[:-keep]:
+        shutil.rmtree(os.path.join(folder, old), ignore_errors=True)
+    return metadata
+
+
+def versions(folder):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(
+        name for name in os.listdir(folder)
+        if not name.startswith(".") and os.path.isfile(os.path.join(folder, name, METADATA_FILE))
+    )
+
+
+def current_version(folder):
+    try:
+        with open(os.path.join(folder, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def load(folder, version=None):
+    version = version or current_version(folder)
+    if version is None:
+        return None
+    path = os.path.join(folder, version)
+    with open(os.path.join(path, METADATA_FILE), encoding="utf-8") as f:
+        metadata = json.load(f)
+    return ClusterModel(joblib.load(os.path.join(path, MODEL_FILE)), metadata)
+
+
+# =====================================================
+# التقديم: تعيين زبون لمجموعة دون sklearn (متجه صغير + أقرب مركز)
+# =====================================================
+class ClusterModel:
+    def __init__(self, artifact, metadata):
+        self.artifact = artifact
+        self.metadata = metadata
+        self.version = metadata["version"]
+        self.centroids = np.asarray(artifact["centroids"], dtype=np.float64)
+        # ||c||² - 2c·x: نفس ترتيب المسافات دون حساب ||x||²
+        self._centroid_norms = (self.centroids ** 2).sum(axis=1)
+
+        scaler = artifact["scaler"]
+        self._age_scale = float(scaler.scale_[0])
+        self._age_min = float(scaler.min_[0])
+        # عمود كل قيمة فئوية في المتجه (العمود 0 للعمر)
+        self._columns = []
+        start = 1
+        for categories in artifact["encoder"].categories_:
+            self._columns.append({str(v): start + i for i, v in enumerate(categories)})
+            start += len(categories)
+
+        self._assignments = dict(zip(artifact["customer_ids"].tolist(), artifact["clusters"].tolist()))
+
+    def vector(self, features):
+        x = np.zeros(self.centroids.shape[1])
+        x[0] = min(max(_age(features.get("age")) * self._age_scale + self._age_min, 0.0), 1.0)
+        values = categorical_values(features.get("health_condition"), features.get("fav_category"))
+        for columns, value in zip(self._columns, values):
+            j = columns.get(value)
+            if j is not None:
+                x[j] = 1.0
+        return x
+
+    def assign(self, features):
+        return int(np.argmin(self._centroid_norms - 2 * (self.centroids @ self.vector(features))))
+
+    def cluster_of(self, customer_id):
+        # المجموعة المحسوبة وقت التدريب، أو None لزبون جديد
+        return self._assignments.get(customer_id)
+
+
+class ClusterStore:
+    # النسخة الحالية في الذاكرة؛ تُعاد قراءتها إذا تغيّر CURRENT (تدريب جديد)
+    def __init__(self, folder, check_interval=60):
+        self.folder = folder
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._model = None
+        self._checked = float("-inf")
+        self.current()
+
+    def current(self):
+        if time.monotonic() - self._checked < self.check_interval:
+            return self._model
+        with self._lock:
+            if time.monotonic() - self._checked >= self.check_interval:
+                self._checked = time.monotonic()
+                try:
+                    version = current_version(self.folder)
+                    if version is not None and (self._model is None or self._model.version != version):
+                        self._model = load(self.folder, version)
+                except Exception as e:
+                    print(f"cluster model: {e}")
+        return self._model
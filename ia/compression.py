@@ -0,0 +1,86 @@
+# compression.py
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli  # اعتماد اختياري
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "text/csv",
+    "text/plain",
+    "text/html",
+}
+
+
+def _choose_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept["br"]:
+        return "br"
+    if accept["gzip"]:
+        return "gzip"
+    return None
+
+
+def _gzip_stream(chunks, level):
+    # ضغط البث (التصدير) قطعة قطعة دون تجميعه في الذاكرة
+    z = zlib.compressobj(level, zlib.DEFLATED, 31)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            out = z.compress(chunk)
+            if out:
+                yield out
+        yield z.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+# =====================================================
+# ضغط استجابات JSON/CSV (gzip أو brotli) فوق حد أدنى للحجم
+# =====================================================
+def init_compression(app, min_size=1024, level=6):
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        encoding = _choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            if encoding != "gzip" and not request.accept_encodings["gzip"]:
+                return response
+            response.response = _gzip_stream(response.response, level)
+            response.headers.pop("Content-Length", None)
+            response.headers["Content-Encoding"] = "gzip"
+            return response
+
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        if encoding == "br":
+            response.set_data(brotli.compress(data, quality=5))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers["Content-Encoding"] = encoding
+
+        # ETag قوي يخص التمثيل المضغوط
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
@@ -0,0 +1,139 @@
+# customer_features.py
+# تحديث جدول customer_features من الطلبات الجديدة فقط (بعد الـ watermark)
+# الاستعمال: python customer_features.py refresh | python customer_features.py rebuild
+import os
+
+
+WATERMARK = "customer_features"
+LOCK_ID = 7319002  # مهمة تحديث واحدة في كل مرة (عدة عمّال gunicorn)
+
+# الزبائن المتأثرون: طلبات بعد الـ watermark + زبائن محددون + زبائن بلا صف بعد
+AFFECTED_SQL = """
+    SELECT customer_id FROM customers c
+    WHERE %(all)s
+       OR c.customer_id = ANY(%(ids)s)
+       OR c.customer_id IN (SELECT customer_id FROM orders WHERE order_id > %(watermark)s)
+       OR NOT EXISTS (SELECT 1 FROM customer_features f WHERE f.customer_id = c.customer_id)
+"""
+
+# إعادة حساب كاملة لكل زبون متأثر (وليس إضافة فروق): التكرار آمن
+# fav_category: الفئة الأكثر بين الوجبات المتمايزة، والأصغر رقماً عند التعادل
+UPSERT_SQL = f"""
+    WITH affected AS ({AFFECTED_SQL}),
+    median AS (
+        SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY age) AS age FROM customers
+    ),
+    totals AS (
+        SELECT o.customer_id, COUNT(*) AS order_count, SUM(o.price) AS total_spend,
+               MAX(o.order_datetime) AS last_order_at
+        FROM orders o JOIN affected a ON a.customer_id = o.customer_id
+        GROUP BY o.customer_id
+    ),
+    favorites AS (
+        SELECT DISTINCT ON (customer_id) customer_id, category_id
+        FROM (
+            SELECT o.customer_id, m.category_id, COUNT(DISTINCT o.meal_id) AS meals
+            FROM orders o
+            JOIN affected a ON a.customer_id = o.customer_id
+            JOIN meals m ON m.meal_id = o.meal_id
+            GROUP BY o.customer_id, m.category_id
+        ) t
+        ORDER BY customer_id, meals DESC, category_id
+    )
+    INSERT INTO customer_features AS f (
+        customer_id, age, age_imputed, health_condition, fav_category,
+        order_count, total_spend, last_order_at, updated_at
+    )
+    SELECT c.customer_id, COALESCE(c.age, median.age), c.age IS NULL, COALESCE(c.health_condition, 'None'),
+           fav.category_id, COALESCE(t.order_count, 0), COALESCE(t.total_spend, 0), t.last_order_at, now()
+    FROM customers c
+    JOIN affected a ON a.customer_id = c.customer_id
+    CROSS JOIN median
+    LEFT JOIN totals t ON t.customer_id = c.customer_id
+    LEFT JOIN favorites fav ON fav.customer_id = c.customer_id
+    ON CONFLICT (customer_id) DO UPDATE SET
+        age = EXCLUDED.age,
+        age_imputed = EXCLUDED.age_imputed,
+        health_condition = EXCLUDED.health_condition,
+        fav_category = EXCLUDED.fav_category,
+        order_count = EXCLUDED.order_count,
+        total_spend = EXCLUDED.total_spend,
+        last_order_at = EXCLUDED.last_order_at,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# الوسيط يتغير مع الزبائن الجدد: تحديث الأعمار المقدّرة عند تغيّره فقط
+IMPUTED_AGE_SQL = """
+    UPDATE customer_features f SET age = m.age, updated_at = now()
+    FROM (SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY age) AS age FROM customers) m
+    WHERE f.age_imputed AND f.age IS DISTINCT FROM m.age
+"""
+
+# الـ watermark يتقدم فقط إلى الطلبات الأقدم من lag_seconds: طلب من معاملة
+# لم تكتمل بعد يُعالج في الدورة التالية (الطلبات الأحدث تُعاد معالجتها، وهذا آمن)
+SAFE_WATERMARK_SQL = """
+    SELECT COALESCE(MAX(order_id), %(watermark)s) FROM orders
+    WHERE order_id > %(watermark)s AND order_datetime < now() - make_interval(secs => %(lag)s)
+"""
+
+
+def refresh_features(conn, customer_ids=(), rebuild=False, lag_seconds=5, wait=False):
+    # conn: اتصال DB-API (psycopg2)؛ يعيد عدد الزبائن المحدَّثين
+    # أو None إذا كانت عملية أخرى تنفذ التحديث الآن (wait=True: انتظارها)
+    try:
+        with conn.cursor() as cur:
+            if wait:
+                cur.execute("SELECT pg_advisory_xact_lock(%s)", (LOCK_ID,))
+            else:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (LOCK_ID,))
+                if not cur.fetchone()[0]:
+                    conn.rollback()
+                    return None
+
+            cur.execute(
+                "INSERT INTO feature_watermarks (name) VALUES (%s) ON CONFLICT (name) DO NOTHING", (WATERMARK,)
+            )
+            cur.execute("SELECT last_order_id FROM feature_watermarks WHERE name = %s", (WATERMARK,))
+            watermark = cur.fetchone()[0]
+
+            params = {"all": rebuild, "ids": [int(c) for c in customer_ids], "watermark": watermark, "lag": lag_seconds}
+            cur.execute(UPSERT_SQL, params)
+            updated = cur.rowcount
+            cur.execute(IMPUTED_AGE_SQL)
+            updated += cur.rowcount
+
+            cur.execute(SAFE_WATERMARK_SQL, params)
+            cur.execute(
+                "UPDATE feature_watermarks SET last_order_id = %s, refreshed_at = now() WHERE name = %s",
+                (cur.fetchone()[0], WATERMARK),
+            )
+        conn.commit()
+        return updated
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description="Refresh the customer_features table")
+    parser.add_argument("command", choices=["refresh", "rebuild"])
+    parser.add_argument("--lag", type=float, default=5, help="seconds before an order counts as settled")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.environ.get("DB_HOST"),
+        database=os.environ.get("DB_NAME"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+    try:
+        started = time.time()
+        updated = refresh_features(conn, rebuild=args.command == "rebuild", lag_seconds=args.lag, wait=True)
+        print(f"Updated {updated} customers in {time.time() - started:.2f}s")
+    finally:
+        conn.close()
@@ -0,0 +1,197 @@
+# db_pool.py
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeout(PoolError):
+    pass
+
+
+# =====================================================
+# مجمّع اتصالات PostgreSQL آمن للخيوط (thread-safe)
+# =====================================================
+class ConnectionPool:
+    def __init__(self, minconn=1, maxconn=10, timeout=5.0, max_idle=300.0,
+                 check_after=30.0, **conn_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("invalid pool size: min=%s max=%s" % (minconn, maxconn))
+
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout          # أقصى مدة انتظار لاتصال حر (ثوانٍ)
+        self.max_idle = max_idle        # إغلاق الاتصالات الزائدة عن الحد الأدنى بعد هذه المدة
+        self.check_after = check_after  # تنفيذ SELECT 1 فقط إذا بقي الاتصال خاملاً أكثر من هذا
+        self._conn_kwargs = conn_kwargs
+
+        self._idle = []      # [(conn, last_used)] — LIFO حتى تبقى الاتصالات الساخنة في الأعلى
+        self._in_use = 0     # يشمل الاتصالات قيد الإنشاء
+        self._closed = False
+        self._cond = threading.Condition()
+        self._stats = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "broken": 0,
+        }
+
+    # ---------- إنشاء / فحص الاتصالات ----------
+    def _connect(self):
+        conn = psycopg2.connect(**self._conn_kwargs)
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["connections_closed"] += 1
+
+    def _is_broken(self, conn):
+        return conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN
+
+    def _is_healthy(self, conn, idle_for):
+        if self._is_broken(conn):
+            return False
+        if idle_for < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def warm(self):
+        # فتح الحد الأدنى من الاتصالات مسبقاً (يُستدعى عند الإقلاع)
+        conns = [self.getconn() for _ in range(self.minconn)]
+        for conn in conns:
+            self.putconn(conn)
+
+    # ---------- الاستعارة والإرجاع ----------
+    def getconn(self, timeout=None):
+        deadline = time.monotonic() + (self.timeout if timeout is None else timeout)
+        conn, last_used = None, None
+
+        with self._cond:
+            waited = False
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._in_use + len(self._idle) < self.maxconn:
+                    break
+                if not waited:
+                    waited = True
+                    self._stats["waits"] += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout("no database connection available after %.1fs" % (
+                        self.timeout if timeout is None else timeout))
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._reap_idle()
+
+        try:
+            if conn is not None and not self._is_healthy(conn, time.monotonic() - last_used):
+                with self._cond:
+                    self._stats["broken"] += 1
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._connect()
+        except BaseException:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn):
+        broken = self._is_broken(conn)
+        if not broken and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            # لا نعيد اتصالاً بمعاملة مفتوحة إلى المجمّع
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+
+        with self._cond:
+            self._in_use -= 1
+            keep = not broken and not self._closed
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+        if not keep:
+            self._discard(conn)
+
+    def _reap_idle(self):
+        # يُستدعى والقفل محجوز: إغلاق الاتصالات الخاملة الزائدة عن الحد الأدنى
+        if not self._idle or self.max_idle is None:
+            return
+        now = time.monotonic()
+        total = self._in_use + len(self._idle)
+        stale = []
+        # أقدم الاتصالات في أسفل القائمة
+        while self._idle and total > self.minconn and now - self._idle[0][1] > self.max_idle:
+            stale.append(self._idle.pop(0)[0])
+            total -= 1
+        for conn in stale:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            self._stats["connections_closed"] += 1
+
+    @contextmanager
+    def connection(self, timeout=None):
+        # الإرجاع مضمون حتى عند حدوث استثناء أو return مبكر
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            return dict(
+                self._stats,
+                min_size=self.minconn,
+                max_size=self.maxconn,
+                idle=len(self._idle),
+                in_use=self._in_use,
+                size=self._in_use + len(self._idle),
+            )
@@ -0,0 +1,104 @@
+# images.py
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+
+# أقصى طول للضلع الأكبر لكل نسخة (من الأكبر إلى الأصغر)
+VARIANTS = (("full", 1280), ("card", 480), ("thumb", 160))
+
+FORMATS = (
+    ("webp", "WEBP", {"quality": 80, "method": 4}),
+    ("jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+)
+
+# آخر ملف يُكتب؛ وجوده يعني أن كل النسخ جاهزة
+READY_MARKER = ("thumb", "jpg")
+
+
+def variant_name(filename, variant, ext):
+    return f"{os.path.splitext(filename)[0]}_{variant}.{ext}"
+
+
+def is_variant(filename):
+    stem = os.path.splitext(filename)[0]
+    return any(stem.endswith("_" + v) for v, _ in VARIANTS)
+
+
+# =====================================================
+# معالجة الصور المرفوعة خارج خيط الطلب:
+# فك الترميز مرة واحدة، حذف البيانات الوصفية (EXIF...)، وتوليد
+# نسخ مصغّرة بصيغتي WebP و JPEG
+# =====================================================
+class ImagePipeline:
+    def __init__(self, storage, workers=2, on_done=None):
+        self.storage = storage
+        self.on_done = on_done
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="images")
+
+    def submit(self, filename):
+        return self._executor.submit(self._run, filename)
+
+    def _run(self, filename):
+        try:
+            self.process(filename)
+            if self.on_done:
+                self.on_done(filename)
+        except Exception as e:
+            print(f"image pipeline {filename}: {e}")
+
+    def ready(self, filename):
+        return self.storage.exists(variant_name(filename, *READY_MARKER))
+
+    def process(self, filename):
+        # الأسماء حسب المحتوى: إن وُجدت النسخ فهي لنفس الصورة
+        if self.ready(filename):
+            return
+        with self.storage.open(filename) as f, Image.open(f) as original:
+            # تطبيق اتجاه الكاميرا قبل حذف EXIF
+            image = ImageOps.exif_transpose(original)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+            # كل نسخة تُصغَّر من السابقة (الأكبر) بدل الأصل
+            for variant, size in VARIANTS:
+                image = image.copy()
+                image.thumbnail((size, size), Image.LANCZOS)
+                for ext, fmt, options in FORMATS:
+                    out = image
+                    if fmt == "JPEG" and out.mode == "RGBA":
+                        out = Image.new("RGB", out.size, (255, 255, 255))
+                        out.paste(image, mask=image.getchannel("A"))
+                    # الحفظ بدون exif= يُسقط البيانات الوصفية؛ الكتابة ذرية في التخزين
+                    buf = io.BytesIO()
+                    out.save(buf, fmt, **options)
+                    self.storage.write(variant_name(filename, variant, ext), buf.getvalue())
+
+    def variants(self, image_url):
+        # روابط النسخ الجاهزة لصورة محلية (/uploads/...) أو None
+        if not image_url or not image_url.startswith("/uploads/"):
+            return None
+        filename = image_url.rsplit("/", 1)[1]
+        if not self.ready(filename):
+            return None
+        return {
+            variant: {ext: f"/uploads/{variant_name(filename, variant, ext)}" for ext, _, _ in FORMATS}
+            for variant, _ in VARIANTS
+        }
+
+
+# معالجة الصور الموجودة مسبقاً: python images.py
+if __name__ == "__main__":
+    from storage import LocalStorage
+
+    pipeline = ImagePipeline(LocalStorage(os.path.join(os.getcwd(), "uploads")))
+    for name, _ in sorted(pipeline.storage.names()):
+        if is_variant(name) or pipeline.ready(name):
+            continue
+        try:
+            pipeline.process(name)
+            print("✅", name)
+        except Exception as e:
+            print("❌", name, e)
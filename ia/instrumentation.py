@@ -0,0 +1,304 @@
+# instrumentation.py
+import bisect
+import json
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import Response, g, request
+from flask.json.provider import DefaultJSONProvider
+from psycopg2 import extensions
+
+
+# حدود مدرّج زمن الطلب (ثوانٍ)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SQL_LENGTH = 2000
+# ردود البث (SSE والتصدير) مفتوحة لمدة طويلة: لا تدخل مدرّج الزمن ولا سجل البطء
+STREAMING_TYPES = {"text/event-stream", "application/x-ndjson", "text/csv"}
+
+# إحصاءات الطلب الحالي؛ None خارج الطلبات (خيوط الخلفية، سكربتات)
+current = ContextVar("request_stats", default=None)
+
+
+# =====================================================
+# إحصاءات طلب واحد: عدد الاستعلامات، زمن قاعدة البيانات، الصفوف، زمن JSON
+# وأبطأ الاستعلامات فقط (عدد محدود) لسجل الطلبات البطيئة
+# =====================================================
+class RequestStats:
+    __slots__ = ("started", "queries", "db_seconds", "rows", "serialize_seconds", "slowest", "keep")
+
+    def __init__(self, keep=5):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.serialize_seconds = 0.0
+        self.slowest = []   # [(ثوانٍ، sql، صفوف)] مرتبة تصاعدياً
+        self.keep = keep
+
+    def add_query(self, sql, seconds, rows):
+        self.queries += 1
+        self.db_seconds += seconds
+        if rows > 0:
+            self.rows += rows
+        if len(self.slowest) < self.keep or seconds > self.slowest[0][0]:
+            if len(self.slowest) >= self.keep:
+                self.slowest.pop(0)
+            bisect.insort(self.slowest, (seconds, sql, rows), key=lambda s: s[0])
+
+
+def _sql_text(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        query = str(query)  # psycopg2.sql.Composed
+    return " ".join(query.split())[:MAX_SQL_LENGTH]
+
+
+def timed_cursor(base):
+    # صنف مؤشر يسجّل كل execute في إحصاءات الطلب الحالي (لا شيء خارج الطلبات)
+    class TimedCursor(base):
+        def execute(self, query, vars=None):
+            stats = current.get()
+            if stats is None:
+                return super().execute(query, vars)
+            started = time.perf_counter()
+            try:
+                return super().execute(query, vars)
+            finally:
+                stats.add_query(query, time.perf_counter() - started, self.rowcount)
+
+        def executemany(self, query, vars_list):
+            stats = current.get()
+            if stats is None:
+                return super().executemany(query, vars_list)
+            started = time.perf_counter()
+            try:
+                return super().executemany(query, vars_list)
+            finally:
+                stats.add_query(query, time.perf_counter() - started, self.rowcount)
+
+    TimedCursor.__name__ = f"Timed{base.__name__}"
+    return TimedCursor
+
+
+TimedCursor = timed_cursor(extensions.cursor)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    # زمن تحويل الردود إلى JSON (jsonify) ضمن إحصاءات الطلب
+    def dumps(self, obj, **kwargs):
+        stats = current.get()
+        if stats is None:
+            return super().dumps(obj, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            stats.serialize_seconds += time.perf_counter() - started
+
+
+# =====================================================
+# مقاييس بصيغة Prometheus (لكل عملية؛ مع عدة عمّال gunicorn يُجمع كل عامل على حدة)
+# =====================================================
+def _labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels)
+
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests = {}    # (method، route، status) -> عدد
+        self._routes = {}      # (method، route) -> [مدرّج..., sum، count، queries، db، rows، serialize، slow]
+        self._gauges = []      # دوال تعيد {اسم: قيمة}
+
+    def add_gauges(self, fn):
+        self._gauges.append(fn)
+
+    def observe(self, method, route, status, seconds, stats, slow, streamed=False):
+        n = len(self.buckets)
+        with self._lock:
+            key = (method, route, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            values = self._routes.get((method, route))
+            if values is None:
+                values = self._routes[(method, route)] = [0] * (n + 1) + [0.0, 0, 0, 0.0, 0, 0.0, 0]
+            if not streamed:
+                values[bisect.bisect_left(self.buckets, seconds)] += 1
+                values[n + 1] += seconds
+                values[n + 2] += 1
+            values[n + 3] += stats.queries
+            values[n + 4] += stats.db_seconds
+            values[n + 5] += stats.rows
+            values[n + 6] += stats.serialize_seconds
+            values[n + 7] += slow
+
+    def render(self):
+        n = len(self.buckets)
+        with self._lock:
+            requests = sorted(self._requests.items())
+            routes = sorted((k, list(v)) for k, v in self._routes.items())
+
+        lines = [
+            "# HELP http_requests_total Requests by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in requests:
+            lines.append(f"http_requests_total{{{_labels([('method', method), ('route', route), ('status', status)])}}} {count}")
+
+        lines += [
+            "# HELP http_request_duration_seconds Request latency (streamed responses excluded).",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), values in routes:
+            labels = [("method", method), ("route", route)]
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                lines.append(f"http_request_duration_seconds_bucket{{{_labels(labels + [('le', bound)])}}} {cumulative}")
+            lines.append(f"http_request_duration_seconds_sum{{{_labels(labels)}}} {values[n + 1]:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{_labels(labels)}}} {values[n + 2]}")
+
+        counters = [
+            ("db_queries_total", "SQL statements executed.", n + 3, "{}"),
+            ("db_query_seconds_total", "Time spent in SQL statements.", n + 4, "{:.6f}"),
+            ("db_rows_total", "Rows returned or affected by SQL statements.", n + 5, "{}"),
+            ("response_serialization_seconds_total", "Time spent encoding JSON responses.", n + 6, "{:.6f}"),
+            ("http_slow_requests_total", "Requests over the slow-request threshold.", n + 7, "{}"),
+        ]
+        for name, help_text, index, fmt in counters:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, route), values in routes:
+                lines.append(f"{name}{{{_labels([('method', method), ('route', route)])}}} {fmt.format(values[index])}")
+
+        for fn in self._gauges:
+            for name, value in fn().items():
+                lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+# =====================================================
+# سجل الطلبات البطيئة: سطر JSON لكل طلب مع أبطأ استعلاماته
+# =====================================================
+class SlowRequestLog:
+    def __init__(self, threshold_ms=500, path=None):
+        self.threshold = threshold_ms / 1000
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            else:
+                print(line, file=sys.stderr, flush=True)
+
+
+def record_request(metrics, slow_log, stats, method, route, path, status, streamed=False, error=None):
+    # نهاية طلب (Flask أو asgi_app.py): المقاييس + سجل البطء
+    seconds = time.perf_counter() - stats.started
+    slow = not streamed and seconds >= slow_log.threshold
+    metrics.observe(method, route, str(status), seconds, stats, slow, streamed)
+    if slow:
+        slow_log.write({
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(seconds * 1000, 1),
+            "queries": stats.queries,
+            "db_ms": round(stats.db_seconds * 1000, 1),
+            "rows": stats.rows,
+            "serialize_ms": round(stats.serialize_seconds * 1000, 1),
+            "error": repr(error) if error else None,
+            "slowest_queries": [
+                {"ms": round(s * 1000, 1), "rows": rows, "sql": _sql_text(sql)}
+                for s, sql, rows in reversed(stats.slowest)
+            ],
+        })
+
+
+def init_instrumentation(app, metrics=None, slow_log=None, keep_statements=5, endpoint="/metrics"):
+    # تسجيل كل طلب Flask (بما فيه ai_bp) + مسار المقاييس
+    # استعلامات SQL تُحسب فقط عبر TimedCursor (cursor_factory للمجمّع وللـ engine)
+    metrics = metrics or Metrics()
+    slow_log = slow_log or SlowRequestLog()
+    app.json = TimedJSONProvider(app)
+
+    @app.before_request
+    def start_request_stats():
+        g.request_stats_token = current.set(RequestStats(keep_statements))
+
+    @app.after_request
+    def record_status(response):
+        g.request_status = response.status_code
+        g.request_streamed = response.is_streamed and response.mimetype in STREAMING_TYPES
+        return response
+
+    @app.teardown_request
+    def finish_request_stats(error=None):
+        token = g.pop("request_stats_token", None)
+        if token is None:
+            return
+        stats = current.get()
+        current.reset(token)
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        record_request(
+            metrics, slow_log, stats, request.method, route, request.full_path.rstrip("?"),
+            g.get("request_status", 500), g.get("request_streamed", False), error,
+        )
+
+    @app.route(endpoint, methods=["GET"])
+    def metrics_endpoint():
+        return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    return metrics
+
+
+# =====================================================
+# نفس التسجيل لتطبيق ASGI (asgi_app.py)
+# route_for(scope) -> قالب المسار، أو None لطلب لا يُسجَّل هنا
+# (المسارات المُمرَّرة إلى Flask تسجّلها خطافات Flask)
+# =====================================================
+class InstrumentationMiddleware:
+    def __init__(self, app, metrics, slow_log, route_for, keep_statements=5):
+        self.app = app
+        self.metrics = metrics
+        self.slow_log = slow_log
+        self.route_for = route_for
+        self.keep_statements = keep_statements
+
+    async def __call__(self, scope, receive, send):
+        route = self.route_for(scope) if scope["type"] == "http" else None
+        if route is None:
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats(self.keep_statements)
+        token = current.set(stats)
+        response = {"status": 500, "streamed": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                content_type = dict(message.get("headers", ())).get(b"content-type", b"")
+                response["streamed"] = content_type.decode("latin-1").split(";")[0].strip() in STREAMING_TYPES
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            current.reset(token)
+            query = scope.get("query_string", b"").decode("latin-1")
+            record_request(
+                self.metrics, self.slow_log, stats, scope["method"], route,
+                scope["path"] + (f"?{query}" if query else ""), response["status"], response["streamed"], error,
+            )
@@ -0,0 +1,99 @@
+# keyword_matcher.py
+import hashlib
+import threading
+import unicodedata
+from collections import deque
+
+import numpy as np
+
+
+# التشكيل (الحركات، الشدة، السكون، الألف الخنجرية...) والتطويل تُحذف
+_ARABIC_MARKS = dict.fromkeys(
+    [*range(0x0610, 0x061B), *range(0x064B, 0x0660), 0x0670, *range(0x06D6, 0x06EE), 0x0640]
+)
+# أشكال الألف والياء والتاء المربوطة تُوحَّد
+_ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ة": "ه"})
+
+
+def normalize(text):
+    # نفس التطبيع للكلمات المفتاحية وللأوصاف: "مشويّ" = "مشوي"، "Fried" = "fried"
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return text.translate(_ARABIC_MARKS).translate(_ARABIC_LETTERS)
+
+
+# =====================================================
+# مطابقة كل الكلمات المفتاحية في مرور واحد على النص (Aho-Corasick)
+# النتيجة متجه منطقي بطول قائمة الكلمات، ويُخزَّن حسب (meal_id، بصمة الوصف)
+# =====================================================
+class KeywordMatcher:
+    def __init__(self, keywords, cache_size=10000):
+        self.keywords = list(dict.fromkeys(keywords))
+        self.index = {k: i for i, k in enumerate(self.keywords)}
+        self.cache_size = cache_size
+        self._cache = {}           # meal_id (أو البصمة) -> (البصمة، المتجه)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+        # شجرة البادئات: انتقالات كل عقدة + رابط الفشل + الكلمات المنتهية عندها
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for i, keyword in enumerate(self.keywords):
+            node = 0
+            for ch in normalize(keyword):
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][ch] = nxt
+                node = nxt
+            if node:
+                self._out[node].append(i)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self.keywords)
+
+    def match(self, text):
+        hits = np.zeros(len(self.keywords), dtype=bool)
+        goto, fail, out = self._goto, self._fail, self._out
+        node = 0
+        for ch in normalize(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if out[node]:
+                hits[out[node]] = True
+        return hits
+
+    def hits(self, text, key=None):
+        # key = meal_id: وصف الوجبة المعدَّل يحل محل القديم في الكاش
+        if not text:
+            return np.zeros(len(self.keywords), dtype=bool)
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        key = digest if key is None else key
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == digest:
+            self.stats["hits"] += 1
+            return cached[1]
+
+        self.stats["misses"] += 1
+        hits = self.match(text)
+        hits.flags.writeable = False  # مشترك بين كل المستدعين
+        with self._lock:
+            if key not in self._cache and len(self._cache) >= self.cache_size:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[key] = (digest, hits)
+        return hits
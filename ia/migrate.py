@@ -0,0 +1,239 @@
+# migrate.py
+import argparse
+import hashlib
+import os
+import re
+import sys
+from datetime import datetime, timedelta
+
+import psycopg2
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+NO_TRANSACTION = "-- migrate: no-transaction"
+LOCK_ID = 7319001  # pg_advisory_lock: عملية ترحيل واحدة في كل مرة
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT now()
+    )
+"""
+
+
+# =====================================================
+# الترحيلات: ملفات migrations/NNNN_name.sql تُطبَّق بالترتيب مرة واحدة
+# وتُسجَّل في schema_migrations مع بصمة المحتوى
+# =====================================================
+def load_migrations(folder=MIGRATIONS_DIR):
+    migrations = []
+    for filename in sorted(os.listdir(folder)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(folder, filename), encoding="utf-8") as f:
+            sql = f.read()
+        migrations.append({
+            "version": int(match.group(1)),
+            "name": match.group(2),
+            "sql": sql,
+            "checksum": hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+            # CREATE INDEX CONCURRENTLY لا يعمل داخل معاملة
+            "transactional": not sql.startswith(NO_TRANSACTION),
+        })
+    versions = [m["version"] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("duplicate migration version")
+    return migrations
+
+
+def statements(sql):
+    # تقسيم بسيط عند ";" في آخر السطر (ملفات الترحيل لا تحتوي دوال)
+    for chunk in re.split(r";\s*$", sql, flags=re.M):
+        if any(line.strip() and not line.strip().startswith("--") for line in chunk.splitlines()):
+            yield chunk.strip()
+
+
+def applied_migrations(conn):
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA)
+        cur.execute("SELECT version, name, checksum, applied_at FROM schema_migrations ORDER BY version")
+        rows = cur.fetchall()
+    conn.commit()
+    return {row[0]: {"name": row[1], "checksum": row[2], "applied_at": row[3]} for row in rows}
+
+
+def changed_migrations(migrations, applied):
+    # ترحيل طُبّق ثم عُدّل ملفه: يجب إضافة ترحيل جديد بدل تعديله
+    return [m for m in migrations if m["version"] in applied and applied[m["version"]]["checksum"] != m["checksum"]]
+
+
+def migrate_up(conn, migrations, target=None):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+    conn.commit()
+    try:
+        applied = applied_migrations(conn)
+        changed = changed_migrations(migrations, applied)
+        if changed:
+            raise ValueError("applied migrations were modified: " + ", ".join(f"{m['version']:04d}" for m in changed))
+
+        done = []
+        for m in migrations:
+            if m["version"] in applied or (target is not None and m["version"] > target):
+                continue
+            record = ("INSERT INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                      (m["version"], m["name"], m["checksum"]))
+            if m["transactional"]:
+                with conn.cursor() as cur:
+                    cur.execute(m["sql"])
+                    cur.execute(*record)
+                conn.commit()
+            else:
+                # كل عبارة وحدها؛ عند الفشل تُعاد الملف كاملاً (IF NOT EXISTS)
+                # والفهرس المتروك INVALID يُحذف يدوياً قبل ذلك
+                conn.autocommit = True
+                try:
+                    with conn.cursor() as cur:
+                        for statement in statements(m["sql"]):
+                            cur.execute(statement)
+                        cur.execute(*record)
+                finally:
+                    conn.autocommit = False
+            done.append(m)
+        return done
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+        conn.commit()
+
+
+# =====================================================
+# check: EXPLAIN لاستعلامات المسارات الساخنة والتنبيه على Seq Scan
+# الاستعلامات تُبنى بنفس دوال server.py حتى تطابق ما يُنفَّذ فعلاً
+# =====================================================
+def route_queries():
+    from werkzeug.datastructures import MultiDict
+    import customer_features
+    import server
+    from recommender import FEATURE_COLUMNS
+
+    now = datetime.now().replace(microsecond=0)
+    month_ago = now - timedelta(days=30)
+
+    # watermark في آخر الطلبات: دورة تحديث عادية بلا طلبات جديدة كثيرة
+    features = {"all": False, "ids": [], "watermark": 2 ** 31 - 1, "lag": 5}
+
+    def orders(**args):
+        return server.orders_query(server.ORDER_DEFAULT_FIELDS, 50, args=MultiDict(args))
+
+    return [
+        ("GET /api/meals", *server.meals_query([], limit=20)),
+        ("GET /api/meals?category_id=", *server.meals_query([], limit=20, category_id=1)),
+        ("GET /api/customers", *server.customers_query([], limit=20)),
+        ("GET /api/customers-with-orders", *server.customers_with_orders_query(20, 0, month_ago, now)),
+        ("GET /api/orders", *orders()),
+        ("GET /api/orders?customer_id=", *orders(customer_id="1")),
+        ("GET /api/orders?from=&to=", *orders(**{"from": month_ago.isoformat(), "to": now.isoformat()})),
+        ("GET /api/orders?status=", *orders(status="pending,preparing")),
+        ("POST /api/register", "SELECT 1 FROM customers WHERE email=%s", ["check@example.com"]),
+        ("POST /api/login", f"SELECT {server.CUSTOMER_COLUMNS}, password FROM customers WHERE email=%s",
+         ["check@example.com"]),
+        ("GET /api/available-tables", server.AVAILABLE_TABLES_SQL, [2, now, now + timedelta(minutes=90)]),
+        ("DELETE /api/meals/<id> (cascade)", "DELETE FROM orders WHERE meal_id = %s", [1]),
+        ("DELETE /api/customers/<id> (cascade)", "DELETE FROM orders WHERE customer_id = %s", [1]),
+        ("DELETE /api/customers/<id> (reservations)", "DELETE FROM reservations WHERE customer_id = %s", [1]),
+        # RecommendationEngine.refresh: الميزات المحدَّثة منذ آخر قراءة
+        ("recommender refresh",
+         f"SELECT {FEATURE_COLUMNS} FROM customer_features WHERE updated_at > CAST(%s AS timestamp) - interval '1 minute'",
+         [now]),
+        # refresh_features: الطلبات بعد الـ watermark فقط (دورة عادية، بدون rebuild)
+        ("customer_features refresh", customer_features.UPSERT_SQL, features),
+        ("customer_features watermark", customer_features.SAFE_WATERMARK_SQL, features),
+    ]
+
+
+# مسح كامل مقصود: refresh_features يحسب وسيط الأعمار على كل الزبائن ويبحث عن
+# الزبائن بلا صف في customer_features (مرة لكل دورة، وليس لكل طلب)
+EXPECTED_SEQ_SCANS = {
+    "customer_features refresh": {"customers", "customer_features"},
+}
+
+
+def seq_scans(plan):
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def check_queries(conn, queries, min_rows=10000, strict=False):
+    # strict: enable_seqscan=off؛ Seq Scan المتبقي يعني عدم وجود فهرس مناسب
+    # (مفيد على قاعدة تطوير صغيرة حيث يفضّل المخطط Seq Scan دائماً)
+    with conn.cursor() as cur:
+        cur.execute("SELECT relname, reltuples FROM pg_class WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace")
+        sizes = dict(cur.fetchall())
+        if strict:
+            cur.execute("SET enable_seqscan = off")
+        flagged = []
+        for label, query, params in queries:
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0][0]["Plan"]
+            tables = sorted({t for t in seq_scans(plan) if strict or sizes.get(t, 0) >= min_rows}
+                            - EXPECTED_SEQ_SCANS.get(label, set()))
+            if tables:
+                flagged.append((label, tables))
+            print(("SEQ  " if tables else "ok   ") + label +
+                  (": " + ", ".join(f"{t} (~{max(int(sizes.get(t, 0)), 0)} rows)" for t in tables) if tables else ""))
+    conn.rollback()
+    return flagged
+
+
+# الاستعمال: python migrate.py up [--to N] | status | check [--strict] [--min-rows N]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply and inspect schema migrations")
+    parser.add_argument("command", choices=["up", "status", "check"])
+    parser.add_argument("--to", type=int, help="stop after this migration version")
+    parser.add_argument("--min-rows", type=int, default=10000, help="flag seq scans on tables with at least this many rows")
+    parser.add_argument("--strict", action="store_true", help="flag every seq scan the planner can't avoid")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=os.environ.get("DB_HOST"),
+        database=os.environ.get("DB_NAME"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+    try:
+        migrations = load_migrations()
+        if args.command == "up":
+            done = migrate_up(conn, migrations, args.to)
+            for m in done:
+                print(f"Applied {m['version']:04d}_{m['name']}")
+            if not done:
+                print("Nothing to apply")
+        elif args.command == "status":
+            applied = applied_migrations(conn)
+            changed = {m["version"] for m in changed_migrations(migrations, applied)}
+            for m in migrations:
+                if m["version"] in changed:
+                    state = "CHANGED"
+                elif m["version"] in applied:
+                    state = f"applied {applied[m['version']]['applied_at']:%Y-%m-%d %H:%M}"
+                else:
+                    state = "pending"
+                print(f"{m['version']:04d}_{m['name']:<32} {state}")
+        else:
+            flagged = check_queries(conn, route_queries(), args.min_rows, args.strict)
+            if flagged:
+                print(f"{len(flagged)} queries with sequential scans")
+                sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,7 @@
+-- أعمدة نوع الطلب (توصيل / داخل المطعم) التي يستعملها server.py
+-- وكانت تُضاف يدوياً؛ IF NOT EXISTS لأن أغلب القواعد القائمة تحتويها
+ALTER TABLE orders
+    ADD COLUMN IF NOT EXISTS order_type VARCHAR(20) DEFAULT 'delivery',
+    ADD COLUMN IF NOT EXISTS address VARCHAR(255),
+    ADD COLUMN IF NOT EXISTS table_id INT REFERENCES tables(table_id),
+    ADD COLUMN IF NOT EXISTS reservation_time TIMESTAMP;
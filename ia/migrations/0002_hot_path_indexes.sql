@@ -0,0 +1,29 @@
+-- migrate: no-transaction
+-- فهارس المسارات الساخنة؛ CONCURRENTLY حتى لا تُقفل الجداول أثناء الخدمة
+-- (customers.email و tables.status مغطّاة مسبقاً: UNIQUE و idx_tables_available_capacity)
+
+-- GET /api/orders: ORDER BY o.order_datetime DESC, o.order_id DESC + التصفح بالمؤشر و ?from=&to=
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_datetime
+    ON orders (order_datetime DESC, order_id DESC);
+
+-- ?customer_id= و customers-with-orders (LATERAL لكل زبون مرتبة بالتاريخ)، وحذف الزبون (CASCADE)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_customer_datetime
+    ON orders (customer_id, order_datetime DESC);
+
+-- حذف وجبة (ON DELETE CASCADE) يبحث في orders بـ meal_id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_meal
+    ON orders (meal_id);
+
+-- حذف طاولة: فحص المفتاح الأجنبي؛ أغلب الطلبات توصيل بدون طاولة
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_table
+    ON orders (table_id) WHERE table_id IS NOT NULL;
+
+-- GET /api/meals?category_id=: WHERE m.category_id = %s ORDER BY m.meal_id DESC
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_meals_category
+    ON meals (category_id, meal_id DESC);
+
+-- حذف زبون (ON DELETE CASCADE على reservations)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_reservations_customer
+    ON reservations (customer_id);
+
+ANALYZE orders, meals, reservations;
@@ -0,0 +1,20 @@
+-- ميزات الزبون للتوصيات والتجميع (تحدّثها customer_features.py)
+CREATE TABLE IF NOT EXISTS customer_features (
+    customer_id INT PRIMARY KEY REFERENCES customers(customer_id) ON DELETE CASCADE,
+    age DOUBLE PRECISION,                 -- العمر، أو وسيط الأعمار إن كان مجهولاً
+    age_imputed BOOLEAN NOT NULL DEFAULT FALSE,
+    health_condition VARCHAR(50) NOT NULL DEFAULT 'None',
+    fav_category INT,                     -- NULL = لا طلبات بعد
+    order_count INT NOT NULL DEFAULT 0,
+    total_spend NUMERIC(12,2) NOT NULL DEFAULT 0,
+    last_order_at TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_customer_features_updated_at ON customer_features (updated_at);
+
+-- آخر طلب عالجته كل مهمة تدريجية
+CREATE TABLE IF NOT EXISTS feature_watermarks (
+    name VARCHAR(50) PRIMARY KEY,
+    last_order_id INT NOT NULL DEFAULT 0,
+    refreshed_at TIMESTAMP
+);
@@ -0,0 +1,10 @@
+-- التوصيات المحسوبة مسبقاً (يكتبها precompute_recommendations.py)
+-- كانت في sql_IA.sql فقط؛ IF NOT EXISTS للقواعد التي أُنشئت منه
+CREATE TABLE IF NOT EXISTS customer_recommendations (
+    customer_id INT NOT NULL REFERENCES customers(customer_id) ON DELETE CASCADE,
+    rank INT NOT NULL,
+    meal_id INT NOT NULL REFERENCES meals(meal_id) ON DELETE CASCADE,
+    score NUMERIC(6,3) NOT NULL,
+    generated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (customer_id, rank)
+);
@@ -0,0 +1,10 @@
+-- سجل تغييرات الطلبات (تكتبه add/update/delete_order ويقرأه order_feed.py)
+-- GET /api/orders يقرأ آخر حدث في كل طلب فلا يعمل بدونه
+CREATE TABLE IF NOT EXISTS order_events (
+    event_id BIGSERIAL PRIMARY KEY,
+    order_id INT NOT NULL,
+    op VARCHAR(10) NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+    payload JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_order_events_created_at ON order_events (created_at);
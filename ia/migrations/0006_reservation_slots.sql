@@ -0,0 +1,40 @@
+-- حجوزات بفترات زمنية: لا تُحجز الطاولة مرتين لفترتين متداخلتين
+-- (tables.status يبقى حجزاً يدوياً من صفحة الإدارة)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE reservations
+    ADD COLUMN IF NOT EXISTS party_size INT NOT NULL DEFAULT 1 CHECK (party_size > 0),
+    ADD COLUMN IF NOT EXISTS reservation_end TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS cancelled_at TIMESTAMP;
+
+-- الحجوزات القديمة بمدة 90 دقيقة (RESERVATION_MINUTES الافتراضية)
+UPDATE reservations SET reservation_end = reservation_datetime + interval '90 minutes'
+WHERE reservation_end IS NULL;
+
+ALTER TABLE reservations ALTER COLUMN reservation_end SET NOT NULL;
+
+-- ADD CONSTRAINT لا يدعم IF NOT EXISTS
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'reservations_slot_valid') THEN
+        ALTER TABLE reservations
+            ADD CONSTRAINT reservations_slot_valid CHECK (reservation_end > reservation_datetime);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'reservations_no_overlap') THEN
+        -- الحجوزات المكررة من قبل (لم يكن هناك منع): يبقى الأقدم ويُلغى الباقي
+        UPDATE reservations r SET cancelled_at = now()
+        WHERE r.cancelled_at IS NULL AND EXISTS (
+            SELECT 1 FROM reservations o
+            WHERE o.table_id = r.table_id AND o.reservation_id < r.reservation_id AND o.cancelled_at IS NULL
+              AND tsrange(o.reservation_datetime, o.reservation_end) && tsrange(r.reservation_datetime, r.reservation_end)
+        );
+        ALTER TABLE reservations
+            ADD CONSTRAINT reservations_no_overlap EXCLUDE USING gist (
+                table_id WITH =,
+                tsrange(reservation_datetime, reservation_end) WITH &&
+            ) WHERE (cancelled_at IS NULL);
+    END IF;
+END $$;
+
+-- GET /api/available-tables (ويغطي tables.status، انظر 0002)
+CREATE INDEX IF NOT EXISTS idx_tables_available_capacity ON tables (capacity) WHERE status = 'Available';
@@ -0,0 +1,2 @@
+-- مفتاح منع التكرار لطابور الطلبات (ORDER_INGEST_MODE=queue)
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64) UNIQUE;
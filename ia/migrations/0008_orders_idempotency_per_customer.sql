@@ -0,0 +1,7 @@
+-- migrate: no-transaction
+-- مفتاح idempotency فريد لكل زبون بدل كل الطلبات: زبونان بنفس المفتاح
+-- كانا يُدمجان في طلب واحد. الفهرس الجديد أولاً حتى لا تخلو الفترة من قيد
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_orders_customer_idempotency_key
+    ON orders (customer_id, idempotency_key);
+
+ALTER TABLE orders DROP CONSTRAINT IF EXISTS orders_idempotency_key_key;
@@ -0,0 +1,235 @@
+# order_feed.py
+import asyncio
+import json
+import queue
+import select
+import threading
+import time
+
+import psycopg2
+
+
+CHANNEL = "order_events"
+EVENT_COLUMNS = "event_id, order_id, op, payload"
+
+
+def format_sse(event):
+    # حدث SSE واحد؛ id يسمح لـ EventSource بالاستئناف عبر Last-Event-ID
+    if event is None:
+        return ": keep-alive\n\n"
+    if event.get("op") == "reset":
+        return "event: reset\ndata: {}\n\n"
+    data = {"op": event["op"], "order_id": event["order_id"], "order": event["payload"]}
+    return f"id: {event['event_id']}\nevent: order\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# =====================================================
+# اشتراك لوحة واحدة: الأحداث الفائتة (من order_events) ثم الأحداث الحية
+# =====================================================
+class Subscription:
+    def __init__(self, feed, loop=None, queue_size=1000):
+        self.feed = feed
+        self.loop = loop
+        self.backlog = []
+        self.overflowed = False
+        if loop is None:
+            self._queue = queue.Queue(maxsize=queue_size)
+        else:
+            self._queue = asyncio.Queue(maxsize=queue_size)
+
+    def push(self, event):
+        # يُستدعى من خيط المستمع؛ اللوحة البطيئة تُفصل بدل حجز الذاكرة
+        if self.loop is None:
+            try:
+                self._queue.put_nowait(event)
+            except queue.Full:
+                self.overflowed = True
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self._put_async, event)
+            except RuntimeError:  # حلقة الأحداث أُغلقت
+                self.overflowed = True
+
+    def _put_async(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    def _replay(self):
+        seen = set()
+        for event in self.backlog:
+            seen.add(event["event_id"])
+            yield event
+        self.backlog = []
+        return seen
+
+    def events(self, heartbeat=15):
+        # None = نبضة keep-alive؛ op=reset = يجب إعادة تحميل القائمة كاملة
+        seen = yield from self._replay()
+        while not self.overflowed:
+            try:
+                event = self._queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+                continue
+            if event["event_id"] not in seen:
+                yield event
+        yield {"op": "reset"}
+
+    async def aevents(self, heartbeat=15):
+        seen = set()
+        for event in self.backlog:
+            seen.add(event["event_id"])
+            yield event
+        self.backlog = []
+        while not self.overflowed:
+            try:
+                event = await asyncio.wait_for(self._queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if event["event_id"] not in seen:
+                yield event
+        yield {"op": "reset"}
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =====================================================
+# موزّع أحداث الطلبات: اتصال واحد لكل عملية ينفّذ LISTEN
+# ويوزّع كل حدث على اللوحات المشتركة في هذه العملية
+# =====================================================
+class OrderFeed:
+    def __init__(self, conn_kwargs, connection, channel=CHANNEL, replay_limit=1000,
+                 retention_hours=24, prune_interval=3600):
+        self.conn_kwargs = conn_kwargs
+        self.connection = connection          # اتصال من المجمّع لقراءة الأحداث الفائتة
+        self.channel = channel
+        self.replay_limit = replay_limit
+        self.retention_hours = retention_hours
+        self.prune_interval = prune_interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_seen = 0
+        self._last_prune = 0.0
+        self.stats = {"delivered": 0, "reconnects": 0, "dropped": 0}
+
+    # ---------- الاشتراك ----------
+    def subscribe(self, last_event_id=None, loop=None):
+        self.start()
+        subscription = Subscription(self, loop)
+        # التسجيل قبل قراءة الأحداث الفائتة حتى لا يضيع حدث بينهما؛ المكرر يُتجاهل
+        with self._lock:
+            self._subscribers.add(subscription)
+        if last_event_id is not None:
+            try:
+                subscription.backlog = self.backlog(last_event_id)
+            except Exception:
+                self.unsubscribe(subscription)
+                raise
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def backlog(self, last_event_id):
+        with self.connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"SELECT {EVENT_COLUMNS} FROM order_events WHERE event_id > %s ORDER BY event_id LIMIT %s",
+                (last_event_id, self.replay_limit + 1),
+            )
+            events = [dict(row) for row in cur.fetchall()]
+        # انقطاع طويل: أحداث كثيرة أو محذوفة بالتنظيف → إعادة تحميل كاملة
+        if len(events) > self.replay_limit:
+            return [{"event_id": 0, "op": "reset"}]
+        return events
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    # ---------- خيط المستمع ----------
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="order-feed", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        delay = 1
+        while True:
+            started = time.monotonic()
+            try:
+                self._listen()
+            except Exception as e:
+                print(f"order feed: {e}")
+            self.stats["reconnects"] += 1
+            # انتظار متزايد فقط إذا كانت الأعطال متتالية
+            delay = 1 if time.monotonic() - started > 60 else min(delay * 2, 30)
+            time.sleep(delay)
+
+    def _listen(self):
+        conn = psycopg2.connect(**self.conn_kwargs)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {self.channel}")
+                # بعد إعادة الاتصال: ما فات أثناء الانقطاع
+                if self._last_seen:
+                    cur.execute(
+                        f"SELECT {EVENT_COLUMNS} FROM order_events WHERE event_id > %s ORDER BY event_id",
+                        (self._last_seen,),
+                    )
+                    self._dispatch(cur)
+
+                while True:
+                    # التنظيف في كل دورة (الفاصل الزمني يحدّه) حتى لا يتوقف تحت الضغط
+                    self._maybe_prune(cur)
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    ids = [int(n.payload) for n in conn.notifies]
+                    conn.notifies.clear()
+                    if ids:
+                        cur.execute(
+                            f"SELECT {EVENT_COLUMNS} FROM order_events WHERE event_id = ANY(%s) ORDER BY event_id",
+                            (ids,),
+                        )
+                        self._dispatch(cur)
+        finally:
+            conn.close()
+
+    def _dispatch(self, cur):
+        columns = [c.name for c in cur.description]
+        events = [dict(zip(columns, row)) for row in cur.fetchall()]
+        if not events:
+            return
+        self._last_seen = max(self._last_seen, events[-1]["event_id"])
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            for event in events:
+                subscription.push(event)
+            if subscription.overflowed:
+                self.stats["dropped"] += 1
+                self.unsubscribe(subscription)
+        self.stats["delivered"] += len(events) * len(subscribers)
+
+    def _maybe_prune(self, cur):
+        if time.monotonic() - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = time.monotonic()
+        cur.execute(
+            "DELETE FROM order_events WHERE created_at < now() - make_interval(hours => %s)",
+            (self.retention_hours,),
+        )
@@ -0,0 +1,233 @@
+# order_queue.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+# مفتاح idempotency خاص بكل زبون: زبونان بنفس المفتاح طلبان مختلفان
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_orders (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer_id INTEGER NOT NULL,
+    idempotency_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    enqueued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_until REAL,
+    order_id INTEGER,
+    last_error TEXT,
+    UNIQUE (customer_id, idempotency_key)
+);
+CREATE INDEX IF NOT EXISTS idx_pending_orders_status ON pending_orders (status, seq);
+"""
+
+# ملف طابور من النسخة السابقة (المفتاح فريد لكل الزبائن): إعادة بناء الجدول
+# customer_id هو أول قيمة في payload (ORDER_INSERT_COLUMNS في server.py)
+UPGRADE_SQL = """
+ALTER TABLE pending_orders RENAME TO pending_orders_old;
+DROP INDEX IF EXISTS idx_pending_orders_status;
+""" + SCHEMA + """
+INSERT INTO pending_orders (seq, customer_id, idempotency_key, payload, status, enqueued_at,
+                            attempts, claimed_by, claimed_until, order_id, last_error)
+SELECT seq, json_extract(payload, '$[0]'), idempotency_key, payload, status, enqueued_at,
+       attempts, claimed_by, claimed_until, order_id, last_error
+FROM pending_orders_old;
+DROP TABLE pending_orders_old;
+"""
+
+
+def _entry(row):
+    seq, key, status, order_id, error = row
+    return {
+        "provisional_id": seq,
+        "idempotency_key": key,
+        "status": status,
+        "order_id": order_id,
+        "error": error,
+    }
+
+
+# =====================================================
+# طابور طلبات دائم (SQLite) لفترات الذروة:
+# الطلب يُكتب محلياً ويُرد عليه فوراً، وخيط كاتب يرسل الطلبات إلى PostgreSQL
+# على دفعات. التسليم "مرة واحدة على الأقل"؛ المفتاح (customer_id، idempotency_key) في orders
+# يمنع التكرار عند إعادة المحاولة
+# =====================================================
+class OrderQueue:
+    def __init__(self, path, writer, permanent_errors=(), batch_size=200, interval=0.2,
+                 lease_seconds=60, retention_hours=24):
+        self.path = path
+        self.writer = writer                      # writer(entries) -> {seq: order_id}
+        self.permanent_errors = permanent_errors  # أخطاء بيانات لا تفيد معها إعادة المحاولة
+        self.batch_size = batch_size
+        self.interval = interval
+        self.lease_seconds = lease_seconds
+        self.retention_hours = retention_hours
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_cleanup = 0.0
+        self.stats = {"enqueued": 0, "written": 0, "failed": 0, "retries": 0}
+        self._create_schema()
+
+    def _db(self):
+        # اتصال لكل خيط؛ WAL يسمح بعدة عمّال على نفس الملف
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")  # الإقرار للعميل بعد fsync فقط
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row[1] for row in db.execute("PRAGMA table_info(pending_orders)")]
+            if columns and "customer_id" not in columns:
+                for statement in UPGRADE_SQL.split(";"):
+                    if statement.strip():
+                        db.execute(statement)
+            else:
+                for statement in SCHEMA.split(";"):
+                    if statement.strip():
+                        db.execute(statement)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    # ---------- الإدخال ----------
+    def enqueue(self, customer_id, key, payload):
+        # يعيد نفس القيد إذا تكرر المفتاح لنفس الزبون (إعادة إرسال من العميل)
+        db = self._db()
+        try:
+            cur = db.execute(
+                "INSERT INTO pending_orders (customer_id, idempotency_key, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+                (customer_id, key, json.dumps(payload, default=str), time.time()),
+            )
+            self.stats["enqueued"] += 1
+            self._wakeup.set()
+            return {"provisional_id": cur.lastrowid, "idempotency_key": key,
+                    "status": "pending", "order_id": None, "error": None}, True
+        except sqlite3.IntegrityError:
+            return self.lookup(customer_id, key), False
+
+    def lookup(self, customer_id, key):
+        # None أيضاً إذا كان المفتاح لزبون آخر
+        row = self._db().execute(
+            "SELECT seq, idempotency_key, status, order_id, last_error FROM pending_orders "
+            "WHERE customer_id = ? AND idempotency_key = ?",
+            (customer_id, key),
+        ).fetchone()
+        return _entry(row) if row else None
+
+    def depth(self):
+        return self._db().execute("SELECT COUNT(*) FROM pending_orders WHERE status = 'pending'").fetchone()[0]
+
+    # ---------- الكاتب ----------
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+            self._thread.start()
+
+    def _claim(self):
+        # حجز دفعة بعقد مؤقت؛ إذا توقف العامل تعود الدفعة للطابور بعد lease_seconds
+        db = self._db()
+        now = time.time()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = db.execute("""
+                SELECT seq, customer_id, idempotency_key, payload FROM pending_orders
+                WHERE status = 'pending' AND (claimed_until IS NULL OR claimed_until < ?)
+                ORDER BY seq LIMIT ?
+            """, (now, self.batch_size)).fetchall()
+            if rows:
+                db.executemany(
+                    "UPDATE pending_orders SET claimed_by = ?, claimed_until = ?, attempts = attempts + 1 WHERE seq = ?",
+                    [(self.worker_id, now + self.lease_seconds, row[0]) for row in rows],
+                )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return [{"seq": seq, "customer_id": customer_id, "idempotency_key": key, "payload": json.loads(payload)}
+                for seq, customer_id, key, payload in rows]
+
+    def _finish(self, written, failed):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        db.executemany(
+            "UPDATE pending_orders SET status = 'done', order_id = ?, claimed_until = NULL, last_error = NULL "
+            "WHERE seq = ?",
+            [(order_id, seq) for seq, order_id in written.items()],
+        )
+        db.executemany(
+            "UPDATE pending_orders SET status = 'failed', claimed_until = NULL, last_error = ? WHERE seq = ?",
+            [(error, seq) for seq, error in failed.items()],
+        )
+        db.execute("COMMIT")
+        self.stats["written"] += len(written)
+        self.stats["failed"] += len(failed)
+
+    def _release(self, entries, error):
+        # خطأ مؤقت (انقطاع قاعدة البيانات...): تعود للطابور دون انتظار العقد
+        self._db().executemany(
+            "UPDATE pending_orders SET claimed_until = NULL, last_error = ? WHERE seq = ?",
+            [(error, e["seq"]) for e in entries],
+        )
+
+    def drain_once(self):
+        entries = self._claim()
+        if not entries:
+            return 0
+        written, failed = {}, {}
+        try:
+            try:
+                written = self.writer(entries)
+            except self.permanent_errors:
+                # عزل السطر المعيب: كتابة كل طلب وحده
+                for entry in entries:
+                    try:
+                        written.update(self.writer([entry]))
+                    except self.permanent_errors as e:
+                        failed[entry["seq"]] = str(e).strip()
+        except Exception as e:
+            self._finish(written, failed)
+            done = set(written) | set(failed)
+            self._release([x for x in entries if x["seq"] not in done], str(e).strip())
+            raise
+        self._finish(written, failed)
+        return len(entries)
+
+    def _run(self):
+        delay = self.interval
+        while True:
+            try:
+                written = self.drain_once()
+                self._cleanup()
+                delay = self.interval
+                if written >= self.batch_size:
+                    continue
+            except Exception as e:
+                print(f"order queue: {e}")
+                self.stats["retries"] += 1
+                delay = min(max(delay * 2, 1), 30)
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def _cleanup(self):
+        if time.monotonic() - self._last_cleanup < 3600:
+            return
+        self._last_cleanup = time.monotonic()
+        self._db().execute(
+            "DELETE FROM pending_orders WHERE status = 'done' AND enqueued_at < ?",
+            (time.time() - self.retention_hours * 3600,),
+        )
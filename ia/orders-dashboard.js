@@ -214,7 +214,7 @@ function applyFiltersAndRender(){
 // ---------- Load reference data & orders ----------
 async function loadCustomers(){
   try{
-    const res = await fetch("https://smart-restorent-1.onrender.com/api/customers");
+    const res = await fetch("https://smart-restorent-1.onrender.com/api/customers?fields=customer_id,first_name,last_name");
     customers = await res.json();
     buildCustomerOptions();
   }catch(err){ console.error("loadCustomers:", err); }
@@ -222,39 +222,74 @@ async function loadCustomers(){
 
 async function loadMeals(){
   try{
-    const res = await fetch("hhttps://smart-restorent-1.onrender.com/api/meals");
+    const res = await fetch("https://smart-restorent-1.onrender.com/api/meals?fields=meal_id,name,price");
     meals = await res.json();
     buildMealOptions();
   }catch(err){ console.error("loadMeals:", err); }
 }
 
+const normalizeOrder = o => ({
+  order_id: Number(o.order_id),
+  customer_id: o.customer_id != null ? Number(o.customer_id) : null,
+  customer_name: safe(o.customer_name),
+  meal_id: o.meal_id != null ? Number(o.meal_id) : null,
+  meal_name: safe(o.meal_name),
+  quantity: o.quantity != null ? Number(o.quantity) : 1,
+  price: o.price != null ? Number(o.price) : null,
+  total: o.total != null ? Number(o.total) : (o.price != null ? Number(o.price) * (o.quantity || 1) : null),
+  status: safe(o.status),
+  order_datetime: o.order_datetime || o.orderDatetime || o.datetime || null,
+  phone: safe(o.phone),
+  address: safe(o.address),
+  order_type: o.order_type,
+  table_number: o.table_number
+});
+
+let lastOrderEventId = null;
+
 async function loadOrders(){
   try{
     const res = await fetch("https://smart-restorent-1.onrender.com/api/orders");
     const data = await res.json();
+    // رقم آخر تغيير قبل هذه القائمة؛ البث يبدأ من بعده
+    lastOrderEventId = res.headers.get("X-Order-Event-Id");
 
-    orders = data.map(o => ({
-      order_id: Number(o.order_id),
-      customer_id: o.customer_id != null ? Number(o.customer_id) : null,
-      customer_name: safe(o.customer_name),
-      meal_id: o.meal_id != null ? Number(o.meal_id) : null,
-      meal_name: safe(o.meal_name),
-      quantity: o.quantity != null ? Number(o.quantity) : 1,
-      price: o.price != null ? Number(o.price) : null,
-      total: o.total != null ? Number(o.total) : (o.price != null ? Number(o.price) * (o.quantity || 1) : null),
-      status: safe(o.status),
-      order_datetime: o.order_datetime || o.orderDatetime || o.datetime || null,
-      phone: safe(o.phone),
-      address: safe(o.address),
-      order_type: o.order_type,
-      table_number: o.table_number
-
-    }));
+    orders = data.map(normalizeOrder);
 
     applyFiltersAndRender();
   }catch(err){ console.error("loadOrders:", err); }
 }
 
+// ---------- Live order feed (SSE) ----------
+// التغييرات فقط بدل إعادة جلب القائمة؛ EventSource يعيد الاتصال تلقائياً
+// ويرسل Last-Event-ID فيستلم ما فاته
+let orderFeed = null;
+
+function applyOrderEvent(evt){
+  const { op, order_id, order } = JSON.parse(evt.data);
+  const idx = orders.findIndex(o => o.order_id == order_id);
+  if(op === "delete"){
+    if(idx > -1) orders.splice(idx, 1);
+  }else if(order){
+    const o = normalizeOrder(order);
+    if(idx > -1) orders[idx] = o;
+    else orders.unshift(o);
+  }
+  applyFiltersAndRender();
+}
+
+function connectOrderFeed(){
+  if(orderFeed) orderFeed.close();
+  const qs = lastOrderEventId ? `?last_event_id=${encodeURIComponent(lastOrderEventId)}` : "";
+  orderFeed = new EventSource(`https://smart-restorent-1.onrender.com/api/orders/stream${qs}`);
+  orderFeed.addEventListener("order", applyOrderEvent);
+  // انقطاع طويل أو لوحة متأخرة: إعادة تحميل كاملة ثم اشتراك جديد
+  orderFeed.addEventListener("reset", async () => {
+    await loadOrders();
+    connectOrderFeed();
+  });
+}
+
 // ---------- Modal (Add / Edit) ----------
 function openAddModal(){
   modalTitle.textContent="Add New Order";
@@ -581,6 +616,7 @@ function renderCharts(filteredOrders){
 document.addEventListener("DOMContentLoaded", async ()=>{
   await Promise.all([ loadCustomers(), loadMeals() ]);
   await loadOrders();
+  connectOrderFeed();
 
   if(elExists(orderForm)) orderForm.onsubmit = saveOrderFromForm;
   if(elExists(btnAdd)) btnAdd.onclick = openAddModal;
@@ -0,0 +1,57 @@
+# pagination.py
+import base64
+import json
+from datetime import datetime
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# =====================================================
+# مؤشر (cursor) مبهم للتصفح بالمفاتيح (keyset)
+# يحمل قيم مفتاح الترتيب لآخر صف في الصفحة
+# =====================================================
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, types):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("invalid cursor")
+    # مؤشر سليم الصيغة لكن بأنواع خاطئة (مثلاً [null] أو رقم مكان التاريخ)
+    try:
+        return [convert(v) for convert, v in zip(types, values)]
+    except (TypeError, ValueError):
+        raise ValueError("invalid cursor")
+
+
+def parse_fields(raw, allowed, default):
+    # ?fields=a,b,c — يُسمح فقط بالحقول المعرّفة
+    if not raw:
+        return list(default)
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown or not fields:
+        raise ValueError("unknown fields: " + ", ".join(unknown))
+    return fields
+
+
+def split_page(rows, limit, cursor_columns):
+    # الصفوف مجلوبة بـ LIMIT limit+1 لمعرفة وجود صفحة تالية
+    if limit is None:
+        return rows, None
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([rows[-1][c] for c in cursor_columns])
+    for row in rows:
+        for c in cursor_columns:
+            row.pop(c, None)
+    return rows, next_cursor
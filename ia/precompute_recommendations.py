@@ -0,0 +1,69 @@
+# precompute_recommendations.py
+# حساب التوصيات لكل الزبائن دفعة واحدة وحفظها في جدول customer_recommendations
+# الاستعمال: python precompute_recommendations.py --top-n 5
+import argparse
+import os
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from ai_routes import recommender
+
+
+CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS customer_recommendations (
+        customer_id INT NOT NULL REFERENCES customers(customer_id) ON DELETE CASCADE,
+        rank INT NOT NULL,
+        meal_id INT NOT NULL REFERENCES meals(meal_id) ON DELETE CASCADE,
+        score NUMERIC(6,3) NOT NULL,
+        generated_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (customer_id, rank)
+    )
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute meal recommendations for every customer")
+    parser.add_argument("--top-n", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    started = time.time()
+    customer_ids = recommender.customer_ids()
+    print(f"Scoring {len(customer_ids)} customers...")
+
+    conn = psycopg2.connect(
+        host=os.environ.get("DB_HOST"),
+        database=os.environ.get("DB_NAME"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(CREATE_TABLE)
+            # استبدال كل الجدول داخل معاملة واحدة: القرّاء يرون النسخة القديمة حتى الـ commit
+            cur.execute("DELETE FROM customer_recommendations")
+
+            generated_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            rows = []
+            written = 0
+            for customer_id, meals in recommender.recommend_many(customer_ids, args.top_n, args.chunk_size):
+                for rank, meal in enumerate(meals or (), start=1):
+                    rows.append((customer_id, rank, meal["meal_id"], meal["score"], generated_at))
+                if len(rows) >= args.chunk_size * args.top_n:
+                    execute_values(cur, "INSERT INTO customer_recommendations VALUES %s", rows, page_size=1000)
+                    written += len(rows)
+                    rows = []
+            if rows:
+                execute_values(cur, "INSERT INTO customer_recommendations VALUES %s", rows, page_size=1000)
+                written += len(rows)
+    finally:
+        conn.close()
+
+    print(f"✅ Wrote {written} recommendations in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
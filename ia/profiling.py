@@ -0,0 +1,199 @@
+# profiling.py
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+from flask import make_response, request
+
+
+MODES = ("cprofile", "sample")
+PROFILE_ID = re.compile(r"^[0-9]{8}-[0-9]{6}-[0-9a-f]{8}$")
+EXTENSIONS = {"cprofile": ".pstats", "sample": ".collapsed"}
+
+
+# =====================================================
+# عيّنات المكدس: خيط يقرأ إطار خيط الطلب كل interval ثانية
+# النتيجة بصيغة collapsed stacks (flamegraph.pl، speedscope، inferno)
+# =====================================================
+class StackSampler:
+    def __init__(self, thread_id, root_code=None, interval=0.002):
+        self.thread_id = thread_id
+        self.root_code = root_code   # قص الإطارات فوق دالة المسار (werkzeug/flask)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                if code is self.root_code:
+                    break
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+# =====================================================
+# وضع التحليل: لكل طلب بالترويسة X-Profile (مع X-Profile-Key = PROFILE_KEY)
+# أو لعينة عشوائية من الطلبات (sample_rate)؛ الملفات تُحفظ في folder للتنزيل
+# =====================================================
+class Profiler:
+    def __init__(self, folder, key=None, sample_rate=0.0, mode="sample", interval=0.002, keep=50):
+        if mode not in MODES:
+            raise ValueError(f"profile mode must be one of {', '.join(MODES)}")
+        self.folder = folder
+        self.key = key
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.interval = interval
+        self.keep = keep
+        # cProfile واحد في كل مرة (في Python 3.12 أداة تحليل واحدة فقط للعملية)
+        self._cprofile_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self.stats = {"profiled": 0, "skipped": 0}
+
+    # headers: ترويسات Flask افتراضياً، أو ترويسات Starlette من asgi_app.py
+    def authorized(self, headers=None):
+        # بدون PROFILE_KEY لا يُقبل التحليل عبر الترويسة ولا التنزيل
+        given = (request.headers if headers is None else headers).get("X-Profile-Key", "")
+        return bool(self.key) and hmac.compare_digest(given.encode(), self.key.encode())
+
+    def requested_mode(self, headers=None):
+        header = (request.headers if headers is None else headers).get("X-Profile")
+        if header and self.authorized(headers):
+            return header if header in MODES else self.mode
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.mode
+        return None
+
+    def run(self, mode, func, *args, **kwargs):
+        # تنفيذ func في الخيط الحالي مع التحليل: (النتيجة، التحليل، الزمن)
+        # التحليل None إذا كان cProfile مشغولاً بطلب آخر
+        if mode == "cprofile" and not self._cprofile_lock.acquire(blocking=False):
+            self.stats["skipped"] += 1
+            return func(*args, **kwargs), None, 0.0
+
+        started = time.perf_counter()
+        if mode == "cprofile":
+            profile = cProfile.Profile()
+            try:
+                result = profile.runcall(func, *args, **kwargs)
+            finally:
+                self._cprofile_lock.release()
+        else:
+            profile = StackSampler(threading.get_ident(), func.__code__, self.interval)
+            profile.start()
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                profile.stop()
+        return result, profile, time.perf_counter() - started
+
+    def profiled(self, view):
+        # مزخرف لمسارات ai_bp: بدون تحليل لا يضاف سوى فحص الترويسة
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            mode = self.requested_mode()
+            if mode is None:
+                return view(*args, **kwargs)
+            response, profile, seconds = self.run(mode, view, *args, **kwargs)
+            if profile is None:
+                return response
+
+            profile_id = self.save(mode, profile, seconds, request.full_path.rstrip("?"), request.endpoint)
+            response = make_response(response)
+            response.headers["X-Profile-Id"] = profile_id
+            return response
+        return wrapper
+
+    # ---------- التخزين ----------
+    def save(self, mode, profile, seconds, path, endpoint):
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.folder, exist_ok=True)
+        meta = {
+            "id": profile_id,
+            "mode": mode,
+            "path": path,
+            "endpoint": endpoint,
+            "duration_ms": round(seconds * 1000, 2),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        base = os.path.join(self.folder, profile_id)
+        if mode == "cprofile":
+            profile.dump_stats(base + EXTENSIONS[mode])
+        else:
+            meta["samples"] = profile.samples
+            meta["interval_ms"] = self.interval * 1000
+            with open(base + EXTENSIONS[mode], "w", encoding="utf-8") as f:
+                f.write(profile.collapsed())
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+        with self._lock:
+            self.stats["profiled"] += 1
+            for old in self.list()[self.keep:]:
+                for ext in (".json",) + tuple(EXTENSIONS.values()):
+                    try:
+                        os.remove(os.path.join(self.folder, old["id"] + ext))
+                    except FileNotFoundError:
+                        pass
+        return profile_id
+
+    def list(self):
+        # الأحدث أولاً
+        if not os.path.isdir(self.folder):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.folder), reverse=True):
+            if name.endswith(".json") and PROFILE_ID.match(name[:-5]):
+                try:
+                    with open(os.path.join(self.folder, name), encoding="utf-8") as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return profiles
+
+    def get(self, profile_id):
+        # (البيانات الوصفية، مسار الملف) أو None
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.folder, profile_id + ".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return meta, os.path.join(self.folder, profile_id + EXTENSIONS[meta["mode"]])
+
+
+def pstats_text(path, sort="cumulative", limit=40):
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
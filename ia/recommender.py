@@ -0,0 +1,275 @@
+# recommender.py
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import text
+
+from customer_features import refresh_features
+from keyword_matcher import KeywordMatcher
+from scoring import MealScorer, rule_keywords
+
+
+RESULT_FIELDS = ("meal_id", "name", "price", "meal_time", "description", "image_url")
+FEATURE_COLUMNS = "customer_id, age, health_condition, fav_category, updated_at"
+
+
+# =====================================================
+# محرك توصيات مقيم في الذاكرة
+# ميزات الزبائن تُقرأ من جدول customer_features (يُحدَّث في قاعدة البيانات)
+# ثم تُحدَّث تدريجياً
+# =====================================================
+class RecommendationEngine:
+    def __init__(self, engine, health_rules, healthy_words, refresh_interval=30, full_reload_interval=900,
+                 feature_lag=5, matcher=None):
+        self._db = engine
+        self.health_rules = health_rules
+        self.healthy_words = healthy_words
+        self.matcher = matcher or KeywordMatcher(rule_keywords(health_rules, healthy_words))
+        self.refresh_interval = refresh_interval
+        self.full_reload_interval = full_reload_interval
+        self.feature_lag = feature_lag
+
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._loaded_at = 0.0
+        self._refreshed_at = 0.0
+        self._refresher = None
+
+        self.customers = {}        # customer_id -> {"age", "health_condition", "fav_category"}
+        self.meals = {}            # meal_id -> صف الوجبة
+        self._scorer = None        # MealScorer يُبنى عند أول طلب بعد تغيّر الوجبات
+        self._features_seen = None  # أحدث updated_at مقروء من customer_features
+        self._dirty = set()        # زبائن تغيّرت طلباتهم أو بياناتهم في هذه العملية
+        self._rebuild = False      # تغيّرت فئات الوجبات: إعادة حساب كل الميزات
+
+    # ---------- التحميل ----------
+    def _read(self, sql, **params):
+        with self._db.connect() as conn:
+            return pd.read_sql(text(sql), conn, params=params)
+
+    def _load_meals(self):
+        meals = self._read(
+            "SELECT meal_id, name, price, meal_time, description, image_url, category_id FROM meals"
+        )
+        return {int(m["meal_id"]): self._meal_row(m) for m in meals.to_dict(orient="records")}
+
+    def _refresh_features(self, customer_ids=(), rebuild=False, wait=False):
+        conn = self._db.raw_connection()
+        try:
+            return refresh_features(conn, customer_ids, rebuild, self.feature_lag, wait)
+        finally:
+            conn.close()
+
+    def _read_features(self, since=None):
+        # هامش دقيقة: صف حُدّث في معاملة بدأت قبل آخر قراءة وانتهت بعدها
+        if since is None:
+            return self._read(f"SELECT {FEATURE_COLUMNS} FROM customer_features")
+        return self._read(
+            f"SELECT {FEATURE_COLUMNS} FROM customer_features "
+            "WHERE updated_at > CAST(:since AS timestamp) - interval '1 minute'",
+            since=since,
+        )
+
+    def _apply_features(self, features):
+        for c in features.to_dict(orient="records"):
+            self.customers[int(c["customer_id"])] = self._customer_row(c)
+        if not features.empty:
+            latest = features["updated_at"].max()
+            if self._features_seen is None or latest > self._features_seen:
+                self._features_seen = latest
+
+    def load(self, rebuild=False):
+        # عند الإقلاع ننتظر من يحدّث الجدول حتى لا نقرأ نسخة ناقصة؛
+        # إعادة الحساب الكاملة تُترك لمن يمسك القفل الآن
+        self._refresh_features(rebuild=rebuild, wait=not rebuild)
+        features = self._read_features()
+        meals = self._load_meals()
+
+        with self._lock:
+            self.customers = {}
+            self._features_seen = None
+            self._apply_features(features)
+            self.meals = meals
+            self._scorer = None
+            self._loaded = True
+            self._loaded_at = self._refreshed_at = time.monotonic()
+
+    def refresh(self):
+        # تحديث تدريجي: الجدول يعالج الطلبات الجديدة فقط، ثم تُقرأ الصفوف المتغيرة
+        if not self._loaded:
+            return self.load()
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            rebuild, self._rebuild = self._rebuild, False
+        try:
+            self._refresh_features(dirty, rebuild)
+        except Exception:
+            with self._lock:
+                self._dirty |= dirty
+                self._rebuild = self._rebuild or rebuild
+            raise
+        features = self._read_features(self._features_seen)
+        meals = self._load_meals()
+
+        with self._lock:
+            self._apply_features(features)
+            if meals != self.meals:
+                self.meals = meals
+                self._scorer = None
+            self._refreshed_at = time.monotonic()
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+        self._start_refresher()
+
+    def _start_refresher(self):
+        if self._refresher is not None or not self.refresh_interval:
+            return
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                if time.monotonic() - self._loaded_at > self.full_reload_interval:
+                    # إعادة حساب كاملة تصحّح ما لا يراه الـ watermark (تعديل/حذف الطلبات)
+                    self.load(rebuild=True)
+                else:
+                    self.refresh()
+            except Exception as e:
+                print(f"recommender refresh: {e}")
+
+    # ---------- التحويل إلى صفوف ----------
+    @staticmethod
+    def _customer_row(c):
+        age = c.get("age")
+        health = c.get("health_condition")
+        fav = c.get("fav_category")
+        return {
+            "age": float("nan") if age is None or pd.isna(age) else float(age),
+            "health_condition": "None" if health is None or pd.isna(health) else health,
+            "fav_category": "Unknown" if fav is None or pd.isna(fav) else int(fav),
+        }
+
+    @staticmethod
+    def _meal_row(m):
+        row = {k: (None if v is not None and not isinstance(v, str) and pd.isna(v) else v) for k, v in m.items()}
+        row["meal_id"] = int(row["meal_id"])
+        row["price"] = float(row["price"])
+        return row
+
+    def customer_features(self, customer_id):
+        with self._lock:
+            c = self.customers.get(customer_id)
+            if c is None:
+                return None
+            return dict(c, customer_id=customer_id)
+
+    # ---------- التوصية ----------
+    def scorer(self):
+        with self._lock:
+            if self._scorer is None:
+                self._scorer = MealScorer(self.meals.values(), self.health_rules, self.healthy_words, self.matcher)
+            return self._scorer
+
+    def recommend(self, customer_id, top_n=5):
+        self.ensure_loaded()
+        customer = self.customer_features(customer_id)
+        if customer is None:
+            return None
+
+        scorer = self.scorer()
+        idx, scores = scorer.top_n([customer], top_n)
+        return [
+            dict({k: scorer.meals[i][k] for k in RESULT_FIELDS}, score=float(score))
+            for i, score in zip(idx[0], scores[0])
+        ]
+
+    def recommend_many(self, customer_ids, top_n=5, chunk_size=512):
+        # توصيات لعدة زبائن: مصفوفة (زبائن × وجبات) لكل دفعة
+        self.ensure_loaded()
+        scorer = self.scorer()
+        customer_ids = list(customer_ids)
+
+        for start in range(0, len(customer_ids), chunk_size):
+            chunk = customer_ids[start:start + chunk_size]
+            features = [self.customer_features(cid) for cid in chunk]
+            found = [f for f in features if f is not None]
+            if found:
+                idx, scores = scorer.top_n(found, top_n)
+            rows = iter(zip(idx, scores)) if found else iter(())
+
+            for cid, f in zip(chunk, features):
+                if f is None:
+                    yield cid, None
+                    continue
+                meal_idx, meal_scores = next(rows)
+                yield cid, [
+                    dict({k: scorer.meals[i][k] for k in RESULT_FIELDS}, score=float(score))
+                    for i, score in zip(meal_idx, meal_scores)
+                ]
+
+    def customer_ids(self):
+        self.ensure_loaded()
+        with self._lock:
+            return list(self.customers)
+
+    # ---------- التحديث عند الكتابة (يُستدعى من server.py) ----------
+    # الميزات تُعاد حسابها في قاعدة البيانات عند التحديث التالي
+    def order_added(self, order):
+        with self._lock:
+            if self._loaded:
+                self._dirty.add(int(order["customer_id"]))
+
+    def order_removed(self, order):
+        self.order_added(order)
+
+    def meal_changed(self, meal):
+        with self._lock:
+            if not self._loaded:
+                return
+            meal_id = int(meal["meal_id"])
+            old = self.meals.get(meal_id)
+            self.meals[meal_id] = self._meal_row(
+                {k: meal.get(k) for k in RESULT_FIELDS + ("category_id",)}
+            )
+            self._scorer = None
+            if old is not None and old.get("category_id") != self.meals[meal_id].get("category_id"):
+                self._rebuild = True
+
+    def meal_removed(self, meal_id):
+        with self._lock:
+            if not self._loaded:
+                return
+            self.meals.pop(meal_id, None)
+            self._scorer = None
+            self._rebuild = True  # حذف الوجبة يحذف طلباتها (CASCADE)
+
+    def customer_changed(self, customer):
+        with self._lock:
+            if not self._loaded:
+                return
+            customer_id = int(customer["customer_id"])
+            row = self._customer_row(customer)
+            old = self.customers.get(customer_id)
+            row["fav_category"] = old["fav_category"] if old else "Unknown"
+            if pd.isna(row["age"]) and old:
+                row["age"] = old["age"]  # العمر المقدّر حتى التحديث التالي
+            self.customers[customer_id] = row
+            self._dirty.add(customer_id)
+
+    def customer_removed(self, customer_id):
+        with self._lock:
+            if not self._loaded:
+                return
+            self.customers.pop(customer_id, None)
+            self._dirty.discard(customer_id)
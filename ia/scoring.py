@@ -0,0 +1,145 @@
+# scoring.py
+import numpy as np
+
+from keyword_matcher import KeywordMatcher
+
+
+# =====================================================
+# تقييم كل الوجبات دفعة واحدة باستعمال NumPy
+# نفس أوزان recommendation_score في ai_routes.py
+# =====================================================
+HEALTH_WEIGHT = 0.4
+DESCRIPTION_WEIGHT = 0.2
+CATEGORY_WEIGHT = 0.15
+AGE_WEIGHT = 0.15
+PRICE_WEIGHT = 0.1
+
+AGE_YOUNG, AGE_OLD, AGE_OTHER = 0, 1, 2
+
+
+def rule_keywords(health_rules, healthy_words):
+    # كل الكلمات المفتاحية (صحية + وصف) في عمود واحد لكل كلمة
+    keywords = []
+    for rules in health_rules.values():
+        keywords += rules["bad"] + rules["good"]
+    return list(dict.fromkeys(keywords + list(healthy_words)))
+
+
+class MealScorer:
+    def __init__(self, meals, health_rules, healthy_words, matcher=None):
+        self.meals = list(meals)
+        self.conditions = list(health_rules)
+        self._bad_keywords = {c: list(rules["bad"]) for c, rules in health_rules.items()}
+        self._unsafe_names = {c: set(rules.get("unsafe_meals", ())) for c, rules in health_rules.items()}
+        self._condition_index = {c: i for i, c in enumerate(self.conditions)}
+
+        # matcher مشترك بين نسخ MealScorer: الوجبات غير المعدَّلة لا يُعاد فحص وصفها
+        if matcher is None:
+            matcher = KeywordMatcher(rule_keywords(health_rules, healthy_words))
+        self.keywords = matcher.keywords
+        kw_index = self._kw_index = matcher.index
+
+        n, k = len(self.meals), len(self.keywords)
+        descriptions = [m.get("description") or "" for m in self.meals]
+        has_desc = np.array([bool(d) for d in descriptions], dtype=bool)
+
+        # مصفوفة منطقية: هل تظهر الكلمة في وصف الوجبة؟ (مرور واحد لكل وصف)
+        self.hits = np.zeros((n, k), dtype=bool)
+        for i, (meal, desc) in enumerate(zip(self.meals, descriptions)):
+            if desc:
+                self.hits[i] = matcher.hits(desc, meal.get("meal_id"))
+        hits = self.hits.astype(np.float64)
+
+        # صف لكل حالة صحية + صف أخير للحالات بدون قواعد (= 1.0)
+        health = np.ones((len(self.conditions) + 1, n))
+        for c, rules in health_rules.items():
+            w = np.zeros(k)
+            for bad in rules["bad"]:
+                w[kw_index[bad]] -= 0.7
+            for good in rules["good"]:
+                w[kw_index[good]] += 0.4
+            row = np.maximum(1.0 + hits @ w, 0)
+            health[self._condition_index[c]] = np.where(has_desc, row, 1.0)
+        self.health = health
+
+        w = np.zeros(k)
+        for word in healthy_words:
+            w[kw_index[word]] += 0.2
+        self.description = np.where(has_desc, np.minimum(hits @ w, 1), 0.5)
+
+        price = np.array([float(m["price"]) for m in self.meals])
+        self.price = np.select([price < 500, price < 1000], [1.0, 0.7], 0.4)
+
+        meal_time = np.array([m.get("meal_time") for m in self.meals], dtype=object)
+        self.age = np.ones((3, n))
+        self.age[AGE_YOUNG] = np.where(meal_time == "LateNight", 0.2, 1.0)
+        self.age[AGE_OLD] = np.where(meal_time == "Heavy", 0.4, 1.0)
+
+        self.category = np.array(
+            [np.nan if m.get("category_id") is None else float(m["category_id"]) for m in self.meals]
+        )
+
+    def __len__(self):
+        return len(self.meals)
+
+    # ---------- ترميز الزبائن ----------
+    def _encode(self, customers):
+        cond = np.array(
+            [self._condition_index.get(c["health_condition"], len(self.conditions)) for c in customers],
+            dtype=np.intp,
+        )
+        age = np.array([c["age"] for c in customers], dtype=np.float64)
+        bucket = np.full(len(customers), AGE_OTHER, dtype=np.intp)
+        bucket[age > 50] = AGE_OLD
+        bucket[age < 18] = AGE_YOUNG
+        fav = np.array(
+            [c["fav_category"] if isinstance(c["fav_category"], (int, float, np.number)) else np.nan
+             for c in customers],
+            dtype=np.float64,
+        )
+        return cond, bucket, fav
+
+    def score(self, customers, meals=None):
+        # مصفوفة (زبائن × وجبات) بالدرجات النهائية؛ meals: فهارس وجبات محددة فقط
+        cond, bucket, fav = self._encode(customers)
+        sel = slice(None) if meals is None else np.asarray(meals, dtype=np.intp)
+        category = np.where(self.category[sel][None, :] == fav[:, None], 1.0, 0.4)
+        final = (
+            self.health[cond][:, sel] * HEALTH_WEIGHT +
+            self.description[sel] * DESCRIPTION_WEIGHT +
+            category * CATEGORY_WEIGHT +
+            self.age[bucket][:, sel] * AGE_WEIGHT +
+            self.price[sel] * PRICE_WEIGHT
+        )
+        return np.round(final, 3)
+
+    def safe_mask(self, condition):
+        # الوجبات التي لا يظهر في وصفها أي كلمة "bad" للحالة الصحية
+        # وليست في قائمة unsafe_meals بالاسم
+        if condition not in self._bad_keywords:
+            return np.ones(len(self.meals), dtype=bool)
+        bad = [self._kw_index[k] for k in self._bad_keywords[condition]]
+        mask = ~self.hits[:, bad].any(axis=1)
+        names = self._unsafe_names[condition]
+        if names:
+            mask &= np.array([m.get("name") not in names for m in self.meals], dtype=bool)
+        return mask
+
+    def top_n(self, customers, top_n=5):
+        # أفضل top_n وجبة لكل زبون دون ترتيب كامل (argpartition)
+        scores = self.score(customers)
+        n = scores.shape[1]
+        top_n = min(top_n, n)
+        if top_n <= 0:
+            empty = np.empty((len(customers), 0), dtype=np.intp)
+            return empty, np.empty((len(customers), 0))
+
+        if top_n < n:
+            idx = np.argpartition(-scores, top_n - 1, axis=1)[:, :top_n]
+            idx.sort(axis=1)
+        else:
+            idx = np.broadcast_to(np.arange(n), scores.shape).copy()
+        top = np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-top, axis=1, kind="stable")
+        idx = np.take_along_axis(idx, order, axis=1)
+        return idx, np.take_along_axis(top, order, axis=1)
@@ -1,28 +1,62 @@
 # server.py
 # server.py
-from flask import Flask, request, jsonify, send_from_directory, render_template_string
+from flask import Flask, g, request, jsonify, send_from_directory, send_file, render_template_string, Response, stream_with_context
 from flask_cors import CORS
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import psycopg2.errors
+from psycopg2.extras import RealDictCursor, execute_values
 import os
-from werkzeug.utils import secure_filename
 import uuid
-from ai_routes import ai_bp  # استيراد Blueprint
+import time
+from ai_routes import ai_bp, recommender  # استيراد Blueprint
 import subprocess
-from datetime import datetime
+import csv
+import io
+import json
+from datetime import date, datetime, timedelta
+from auth import HasherBusy, PasswordHasher, TokenSigner
+from db_pool import ConnectionPool
+from cache import ResponseCache, RedisBackend
+from compression import init_compression
+from images import ImagePipeline
+from instrumentation import Metrics, SlowRequestLog, init_instrumentation, timed_cursor
+from order_feed import CHANNEL as ORDER_FEED_CHANNEL, OrderFeed, format_sse
+from order_queue import OrderQueue
+from storage import LocalStorage, MemoryStorage, normalize_ext
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, parse_fields, split_page
 
 
 app = Flask(__name__)
-CORS(app, origins=["https://infosarafg.github.io"])
+CORS(app, origins=["https://infosarafg.github.io"], expose_headers=["X-Next-Cursor", "X-Order-Event-Id"])
 app.register_blueprint(ai_bp)
+init_compression(app, min_size=int(os.environ.get("COMPRESS_MIN_SIZE", 1024)))
+
+# ----- Instrumentation -----
+# لكل طلب: الزمن، عدد استعلامات SQL وزمنها، الصفوف، زمن JSON -> GET /metrics (Prometheus)
+# الطلبات الأبطأ من SLOW_REQUEST_MS تُكتب (JSON) مع أبطأ استعلاماتها في SLOW_REQUEST_LOG أو stderr
+slow_log = SlowRequestLog(float(os.environ.get("SLOW_REQUEST_MS", 500)), os.environ.get("SLOW_REQUEST_LOG"))
+metrics = init_instrumentation(app, Metrics(), slow_log)
+metrics.add_gauges(lambda: {f"db_pool_{k}": v for k, v in db_pool.stats().items() if k in ("in_use", "idle", "size")})
 
 # ----- إعدادات أساسية -----
 app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # 2MB limit
 app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
 app.config['ALLOWED_EXTENSIONS'] = {'jpeg', 'jpg', 'png', 'gif'}
 
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+# ----- Upload storage -----
+# الملفات تُسمّى بـ sha256 محتواها: الصورة نفسها تُحفظ مرة واحدة مهما رُفعت
+# UPLOAD_STORAGE=memory بديل لمخزن كائنات خارجي (للتجارب)
+if os.environ.get("UPLOAD_STORAGE") == "memory":
+    upload_storage = MemoryStorage()
+else:
+    upload_storage = LocalStorage(app.config['UPLOAD_FOLDER'])
+
+# ----- Image processing -----
+# النسخ المصغّرة تُولَّد في الخلفية؛ عند الانتهاء يُبطل كاش قائمة الوجبات لتظهر روابطها
+image_pipeline = ImagePipeline(
+    upload_storage,
+    workers=int(os.environ.get("IMAGE_WORKERS", 2)),
+    on_done=lambda filename: response_cache.invalidate('meals'),
+)
 
 # ----- Helpers -----
 def allowed_file(filename):
@@ -30,46 +64,254 @@ def allowed_file(filename):
 
 def save_image(file):
     if file and allowed_file(file.filename):
-        filename = secure_filename(str(uuid.uuid4()) + os.path.splitext(file.filename)[1])
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        filename, created = upload_storage.save(file.stream, normalize_ext(file.filename))
+        # ملف مكرر: النسخ المصغّرة موجودة أو قيد التوليد
+        if created or not image_pipeline.ready(filename):
+            image_pipeline.submit(filename)
         return f'/uploads/{filename}'
     return None
 
+# args اختياري: request.args افتراضياً، أو query params من asgi_app.py
+def int_arg(name, default=None, minimum=0, maximum=None, args=None):
+    # قراءة معامل رقمي من query string (ValueError إذا كان غير صالح)
+    value = (request.args if args is None else args).get(name)
+    if value in (None, ''):
+        return default
+    value = int(value)
+    if value < minimum or (maximum is not None and value > maximum):
+        raise ValueError(f"{name} out of range")
+    return value
+
+def datetime_arg(name, end_of_day=False, args=None):
+    # تاريخ ISO من query string؛ التاريخ بدون وقت في حد "to" يشمل اليوم كاملاً
+    value = (request.args if args is None else args).get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", ""))
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
+def list_arg(name, allowed=None, args=None):
+    # ?status=pending,preparing أو ?status=pending&status=preparing
+    args = request.args if args is None else args
+    values = [v.strip() for raw in args.getlist(name) for v in raw.split(',') if v.strip()]
+    if allowed is not None and any(v not in allowed for v in values):
+        raise ValueError(f"invalid {name}")
+    return values
+
+def page_args(args=None):
+    # limit + cursor للتصفح بالمفاتيح؛ بدونهما تُعاد كل الصفوف كما في السابق
+    args = request.args if args is None else args
+    limit = int_arg('limit', minimum=1, maximum=MAX_PAGE_SIZE, args=args)
+    cursor = args.get('cursor')
+    if cursor and limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    return limit, cursor
+
+def paged_response(rows, limit, cursor_columns):
+    rows, next_cursor = split_page(rows, limit, cursor_columns)
+    response = jsonify(rows)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def iso_sql(column):
+    # نفس ناتج datetime.isoformat() لكن محسوب في PostgreSQL
+    return (f"CASE WHEN {column} = date_trunc('second', {column}) "
+            f"THEN to_char({column}, 'YYYY-MM-DD\"T\"HH24:MI:SS') "
+            f"ELSE to_char({column}, 'YYYY-MM-DD\"T\"HH24:MI:SS.US') END")
+
+# ----- Streaming exports -----
+EXPORT_ITERSIZE = int(os.environ.get("EXPORT_ITERSIZE", 2000))
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def export_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def export_arg():
+    fmt = request.args.get('export')
+    if fmt and fmt not in ('ndjson', 'csv'):
+        raise ValueError("export must be ndjson or csv")
+    return fmt
+
+def stream_export(query, params, fmt, name):
+    # مؤشر مُسمّى (server-side) يجلب EXPORT_ITERSIZE صفاً في كل مرة
+    # فتبقى الذاكرة ثابتة مهما كان حجم الجدول
+    def generate():
+        with get_db_connection() as conn, \
+                conn.cursor(name=f"export_{uuid.uuid4().hex}", cursor_factory=TimedRealDictCursor) as cur:
+            cur.itersize = EXPORT_ITERSIZE
+            cur.execute(query, params)
+            buf = io.StringIO()
+            writer = None
+            for row in cur:
+                if fmt == 'csv':
+                    if writer is None:
+                        writer = csv.DictWriter(buf, fieldnames=list(row.keys()))
+                        writer.writeheader()
+                    writer.writerow({k: export_default(v) if v is not None else '' for k, v in row.items()})
+                else:
+                    buf.write(json.dumps(row, default=export_default, ensure_ascii=False))
+                    buf.write("\n")
+                if buf.tell() >= EXPORT_CHUNK_BYTES:
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            if fmt == 'csv' and writer is None and cur.description:
+                csv.writer(buf).writerow([col.name for col in cur.description])
+            yield buf.getvalue()
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
+
 # ----- Routes for uploads -----
+UPLOAD_MAX_AGE = 365 * 24 * 3600
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # الاسم بصمة المحتوى (أو uuid للملفات القديمة)، فالمحتوى لا يتغير أبداً
+    if isinstance(upload_storage, LocalStorage):
+        response = send_from_directory(upload_storage.folder, filename, max_age=UPLOAD_MAX_AGE)
+    else:
+        try:
+            response = send_file(upload_storage.open(filename), download_name=filename, max_age=UPLOAD_MAX_AGE)
+        except FileNotFoundError:
+            return jsonify({"error": "Not found"}), 404
+    response.headers['Cache-Control'] = f'public, max-age={UPLOAD_MAX_AGE}, immutable'
+    return response
+
+# ----- Response cache -----
+# CACHE_URL (redis://...) لمشاركة الكاش والإبطال بين العمّال، وإلا فكاش داخل العملية
+response_cache = ResponseCache(
+    RedisBackend(os.environ["CACHE_URL"]) if os.environ.get("CACHE_URL") else None,
+    ttl=int(os.environ.get("CACHE_TTL", 300)),
+)
 
 # ----- Database connection -----
-def get_db_connection():
-    return psycopg2.connect(
-        host=os.environ.get("DB_HOST"),
-        database=os.environ.get("DB_NAME"),
-        user=os.environ.get("DB_USER"),
-        password=os.environ.get("DB_PASSWORD"),
-        port=os.environ.get("DB_PORT", 5432),
-        cursor_factory=RealDictCursor
+DB_CONFIG = dict(
+    host=os.environ.get("DB_HOST"),
+    database=os.environ.get("DB_NAME"),
+    user=os.environ.get("DB_USER"),
+    password=os.environ.get("DB_PASSWORD"),
+    port=os.environ.get("DB_PORT", 5432),
+)
+
+# المؤشر يسجّل كل استعلام في مقاييس الطلب الحالي
+TimedRealDictCursor = timed_cursor(RealDictCursor)
+
+db_pool = ConnectionPool(
+    minconn=int(os.environ.get("DB_POOL_MIN", 1)),
+    maxconn=int(os.environ.get("DB_POOL_MAX", 10)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 5)),
+    cursor_factory=TimedRealDictCursor,
+    **DB_CONFIG
+)
 
-    )
+def get_db_connection():
+    # يُستعمل مع with: الاتصال يعود إلى المجمّع دائماً
+    return db_pool.connection()
+
+# ----- Auth -----
+# AUTH_SCRYPT_N/R/P: تكلفة التجزئة (انظر bench_auth.py)، AUTH_HASH_WORKERS: خيوط التجزئة
+# AUTH_SECRET: مفتاح توقيع الرموز، نفسه لكل العمّال (بدونه تبطل الرموز عند إعادة التشغيل)
+password_hasher = PasswordHasher(
+    n=int(os.environ.get("AUTH_SCRYPT_N", 2 ** 14)),
+    r=int(os.environ.get("AUTH_SCRYPT_R", 8)),
+    p=int(os.environ.get("AUTH_SCRYPT_P", 1)),
+    workers=int(os.environ.get("AUTH_HASH_WORKERS", 2)),
+    max_pending=int(os.environ.get("AUTH_HASH_QUEUE", 32)),
+)
+if not os.environ.get("AUTH_SECRET"):
+    print("AUTH_SECRET is not set: using a random key, tokens will not survive a restart")
+auth_tokens = TokenSigner(
+    os.environ.get("AUTH_SECRET") or os.urandom(32).hex(),
+    max_age=int(os.environ.get("AUTH_TOKEN_TTL", 86400)),
+)
+
+def hasher_busy():
+    # مجمّع التجزئة ممتلئ (HasherBusy)
+    return jsonify({"error": "Server busy, try again"}), 503, {"Retry-After": "1"}
+
+@app.route('/api/db/pool-stats', methods=['GET'])
+def pool_stats():
+    return jsonify(dict(
+        db_pool.stats(),
+        cache=response_cache.stats(),
+        order_feed=dict(order_feed.stats, subscribers=order_feed.subscriber_count()),
+        order_queue=dict(order_queue.stats, depth=order_queue.depth()) if order_queue else None,
+        auth=dict(password_hasher.stats, **password_hasher.config()),
+    ))
 
 
 # ------------------ API Meals ------------------
+MEAL_FIELDS = {
+    "meal_id": "m.meal_id",
+    "category_id": "m.category_id",
+    "meal_time": "m.meal_time",
+    "name": "m.name",
+    "price": "m.price",
+    "description": "m.description",
+    "image_url": "m.image_url",
+    "category_name": "c.category_name",
+}
+
+def meals_query(fields, limit=None, after=None, category_id=None):
+    columns = [f"{MEAL_FIELDS[f]} AS {f}" for f in fields] or ["m.*", "c.category_name"]
+    join = ""
+    if not fields or "category_name" in fields:
+        join = "LEFT JOIN meal_categories c ON m.category_id = c.category_id"
+    where, params = [], []
+    if category_id:
+        where.append("m.category_id = %s")
+        params.append(category_id)
+    if after:
+        where.append("m.meal_id < %s")
+        params += after
+    if limit:
+        columns.append("m.meal_id AS _cursor_id")
+        params.append(limit + 1)
+
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM meals m
+        {join}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY m.meal_id DESC
+        {'LIMIT %s' if limit else ''}
+    """
+    return query, params
+
+def add_image_variants(meals):
+    # روابط النسخ المصغّرة (thumb/card/full × webp/jpg) إن كانت جاهزة
+    if meals and "image_url" in meals[0]:
+        for meal in meals:
+            meal["image_variants"] = image_pipeline.variants(meal["image_url"])
+    return meals
+
 @app.route('/api/meals', methods=['GET'])
+@response_cache.cached('meals', 'categories')
 def get_meals():
+    # ?fields= ?category_id= ?limit=&cursor= (الترتيب: meal_id DESC)
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT m.*, c.category_name
-            FROM meals m
-            LEFT JOIN meal_categories c ON m.category_id = c.category_id
-            ORDER BY meal_id DESC
-        """)
-        meals = cur.fetchall()
-        cur.close()
-        conn.close()
-        return jsonify([dict(meal) for meal in meals])
+        fields = parse_fields(request.args.get('fields'), MEAL_FIELDS, ())
+        limit, cursor = page_args()
+        after = decode_cursor(cursor, (int,)) if cursor else None
+        category_id = int_arg('category_id', minimum=1)
+        query, params = meals_query(fields, limit, after, category_id)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            meals = cur.fetchall()
+
+        return paged_response(add_image_variants(meals), limit, ["_cursor_id"])
     except Exception as e:
         print(f"GET /api/meals: {e}")
         return jsonify({"error": "Server error"}), 500
@@ -104,25 +346,22 @@ def add_meal():
         image_url = save_image(image)
 
         # التحقق من وجود category_id في جدول meal_categories
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM meal_categories WHERE category_id=%s", (category_id,))
-        category = cur.fetchone()
-        if not category:
-            cur.close()
-            conn.close()
-            return jsonify({"error": f"category_id {category_id} does not exist"}), 400
-
-        # إدخال الوجبة
-        cur.execute(
-            "INSERT INTO meals (name, description, price, meal_time, category_id, image_url) "
-            "VALUES (%s, %s, %s, %s, %s, %s) RETURNING *",
-            (name, description, price_num, meal_time, category_id, image_url)
-        )
-        meal = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT * FROM meal_categories WHERE category_id=%s", (category_id,))
+            category = cur.fetchone()
+            if not category:
+                return jsonify({"error": f"category_id {category_id} does not exist"}), 400
+
+            # إدخال الوجبة
+            cur.execute(
+                "INSERT INTO meals (name, description, price, meal_time, category_id, image_url) "
+                "VALUES (%s, %s, %s, %s, %s, %s) RETURNING *",
+                (name, description, price_num, meal_time, category_id, image_url)
+            )
+            meal = cur.fetchone()
+            conn.commit()
+        response_cache.invalidate('meals')
+        recommender.meal_changed(meal)
         return jsonify(dict(meal)), 201
 
     except Exception as e:
@@ -145,28 +384,26 @@ def update_meal(id):
         price_num = float(price)
         image_url = save_image(image) if image else None
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        if image_url:
-            cur.execute(
-                "UPDATE meals SET name=%s, description=%s, price=%s, meal_time=%s, category_id=%s, image_url=%s "
-                "WHERE meal_id=%s RETURNING *",
-                (name, description, price_num, meal_time, category_id, image_url, id)
-            )
-        else:
-            cur.execute(
-                "UPDATE meals SET name=%s, description=%s, price=%s, meal_time=%s, category_id=%s "
-                "WHERE meal_id=%s RETURNING *",
-                (name, description, price_num, meal_time, category_id, id)
-            )
-
-        meal = cur.fetchone()
-        if not meal:
-            return jsonify({"error": "meal not found"}), 404
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            if image_url:
+                cur.execute(
+                    "UPDATE meals SET name=%s, description=%s, price=%s, meal_time=%s, category_id=%s, image_url=%s "
+                    "WHERE meal_id=%s RETURNING *",
+                    (name, description, price_num, meal_time, category_id, image_url, id)
+                )
+            else:
+                cur.execute(
+                    "UPDATE meals SET name=%s, description=%s, price=%s, meal_time=%s, category_id=%s "
+                    "WHERE meal_id=%s RETURNING *",
+                    (name, description, price_num, meal_time, category_id, id)
+                )
+
+            meal = cur.fetchone()
+            if not meal:
+                return jsonify({"error": "meal not found"}), 404
+            conn.commit()
+        response_cache.invalidate('meals')
+        recommender.meal_changed(meal)
         return jsonify(dict(meal))
     except Exception as e:
         print(f"PUT /api/meals/{id}: {e}")
@@ -175,12 +412,11 @@ def update_meal(id):
 @app.route('/api/meals/<int:id>', methods=['DELETE'])
 def delete_meal(id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM meals WHERE meal_id=%s", (id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM meals WHERE meal_id=%s", (id,))
+            conn.commit()
+        response_cache.invalidate('meals')
+        recommender.meal_removed(id)
         return '', 204
     except Exception as e:
         print(f"DELETE /api/meals/{id}: {e}")
@@ -188,14 +424,12 @@ def delete_meal(id):
 
 # ------------------ API Meal Categories ------------------
 @app.route('/api/meal-categories', methods=['GET'])
+@response_cache.cached('categories')
 def get_categories():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM meal_categories ORDER BY category_name ASC")
-        categories = cur.fetchall()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT * FROM meal_categories ORDER BY category_name ASC")
+            categories = cur.fetchall()
         return jsonify([dict(cat) for cat in categories])
     except Exception as e:
         print(f"GET /api/meal-categories: {e}")
@@ -208,28 +442,58 @@ def add_category():
         name = data.get('category_name')
         if not name:
             return jsonify({"error": "category_name is required"}), 400
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("INSERT INTO meal_categories (category_name) VALUES (%s) RETURNING *", (name,))
-        category = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("INSERT INTO meal_categories (category_name) VALUES (%s) RETURNING *", (name,))
+            category = cur.fetchone()
+            conn.commit()
+        response_cache.invalidate('categories')
         return jsonify(dict(category)), 201
     except Exception as e:
         print(f"POST /api/meal-categories: {e}")
         return jsonify({"error": "Server error"}), 500
 # ------------------ API Customers ------------------
+CUSTOMER_FIELDS = (
+    "customer_id", "first_name", "last_name", "phone", "address", "email",
+    "username", "age", "health_condition", "profile_image_url",
+)
+# كل الأعمدة ما عدا password (لا تُعاد في أي رد)
+CUSTOMER_COLUMNS = ", ".join(CUSTOMER_FIELDS)
+
+def customers_query(fields, limit=None, after=None):
+    columns = list(fields or CUSTOMER_FIELDS)
+    if limit:
+        columns.append("customer_id AS _cursor_id")
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM customers
+        {'WHERE customer_id < %s' if after else ''}
+        ORDER BY customer_id DESC
+        {'LIMIT %s' if limit else ''}
+    """
+    return query, (after or []) + ([limit + 1] if limit else [])
+
 @app.route('/api/customers', methods=['GET'])
 def get_customers():
+    # ?fields= ?limit=&cursor= (الترتيب: customer_id DESC)
+    # ?export=ndjson|csv لتصدير كامل الجدول كبث
+    try:
+        export = export_arg()
+        fields = parse_fields(request.args.get('fields'), CUSTOMER_FIELDS, CUSTOMER_FIELDS if export else ())
+        limit, cursor = page_args()
+        after = decode_cursor(cursor, (int,)) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if export:
+        return stream_export(
+            f"SELECT {', '.join(fields)} FROM customers ORDER BY customer_id DESC", [], export, "customers"
+        )
+
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM customers ORDER BY customer_id DESC")
-        customers = cur.fetchall()
-        cur.close()
-        conn.close()
-        return jsonify([dict(customer) for customer in customers])
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(*customers_query(fields, limit, after))
+            customers = cur.fetchall()
+        return paged_response(customers, limit, ["_cursor_id"])
     except Exception as e:
         print(f"GET /api/customers: {e}")
         return jsonify({"error": "Server error"}), 500
@@ -249,27 +513,28 @@ def add_customer():
         if not first_name or not password:
             return jsonify({"error": "first_name and password are required"}), 400
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO customers (first_name, last_name, email, phone, address, username, password) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING *",
-            (first_name, last_name, email, phone, address, username, password)
-        )
-        customer = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+        password = password_hasher.hash(password)
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO customers (first_name, last_name, email, phone, address, username, password) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING {CUSTOMER_COLUMNS}",
+                (first_name, last_name, email, phone, address, username, password)
+            )
+            customer = cur.fetchone()
+            conn.commit()
+        recommender.customer_changed(customer)
         return jsonify(dict(customer)), 201
+    except HasherBusy:
+        return hasher_busy()
     except Exception as e:
         print(f"POST /api/customers: {e}")
         return jsonify({"error": "Server error"}), 500
 
 @app.route('/api/customers/<int:id>/profile', methods=['POST'])
+@auth_tokens.required
 def update_profile(id):
+ if g.customer_id != id:
+     return jsonify({"error": "Forbidden"}), 403
  try:
-     conn = get_db_connection()
-     cur = conn.cursor()
-
      first_name = request.form.get('first_name')
      phone = request.form.get('phone')
      address = request.form.get('address')
@@ -279,9 +544,8 @@ def update_profile(id):
      image_filename = None
 
      if profile_image and allowed_file(profile_image.filename):
-        filename = secure_filename(profile_image.filename)
-        profile_image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        image_filename = filename
+        # اسم حسب المحتوى بدل اسم العميل حتى لا تتلف صورة مستخدم آخر ولا تُخدم نسخة قديمة من الكاش
+        image_filename = save_image(profile_image).rsplit('/', 1)[1]
 
      updates = []
      values = []
@@ -293,11 +557,12 @@ def update_profile(id):
      if image_filename: updates.append("profile_image_url=%s"); values.append(image_filename)
 
      values.append(id)
-     cur.execute(f"UPDATE customers SET {', '.join(updates)} WHERE customer_id=%s RETURNING *", tuple(values))
-     updated_user = cur.fetchone()
-     conn.commit()
-     cur.close()
-     conn.close()
+     with get_db_connection() as conn, conn.cursor() as cur:
+         cur.execute(f"UPDATE customers SET {', '.join(updates)} WHERE customer_id=%s RETURNING {CUSTOMER_COLUMNS}", tuple(values))
+         updated_user = cur.fetchone()
+         conn.commit()
+     if updated_user:
+         recommender.customer_changed(updated_user)
 
      return jsonify(dict(updated_user))
  except Exception as e:
@@ -308,12 +573,10 @@ def update_profile(id):
 @app.route('/api/customers/<int:id>', methods=['DELETE'])
 def delete_customer(id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM customers WHERE customer_id=%s", (id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM customers WHERE customer_id=%s", (id,))
+            conn.commit()
+        recommender.customer_removed(id)
         return '', 204
     except Exception as e:
         print(f"DELETE /api/customers/{id}: {e}")
@@ -327,7 +590,7 @@ def register():
         first_name = data.get('first_name')
         last_name = data.get('last_name') or ''
         email = data.get('email')
-        username = data.get('username') or ''
+        username = data.get('username') or None  # UNIQUE: عدة حسابات بدون اسم مستخدم
         phone = data.get('phone') or ''
         address = data.get('address') or ''
         password = data.get('password')
@@ -337,23 +600,30 @@ def register():
         if not first_name or not email or not password:
             return jsonify({"error": "first_name, email, and password are required"}), 400
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM customers WHERE email=%s", (email,))
-        if cur.fetchone():
-            return jsonify({"error": "Email already registered"}), 400
-
-        cur.execute(
-            """INSERT INTO customers 
-               (first_name, last_name, phone, address, email, username, password, age, health_condition) 
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING *""",
-            (first_name, last_name, phone, address, email, username, password, age, health_condition)
-        )
-        customer = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
-        return jsonify({"customer": dict(customer)}), 201
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM customers WHERE email=%s", (email,))
+            if cur.fetchone():
+                return jsonify({"error": "Email already registered"}), 400
+
+        # التجزئة خارج الاتصال حتى لا يبقى محجوزاً من المجمّع أثناءها
+        password = password_hasher.hash(password)
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                f"""INSERT INTO customers 
+                   (first_name, last_name, phone, address, email, username, password, age, health_condition) 
+                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING {CUSTOMER_COLUMNS}""",
+                (first_name, last_name, phone, address, email, username, password, age, health_condition)
+            )
+            customer = cur.fetchone()
+            conn.commit()
+        recommender.customer_changed(customer)
+        return jsonify({"customer": dict(customer), "token": auth_tokens.issue(customer["customer_id"])}), 201
+    except psycopg2.errors.UniqueViolation as e:
+        # تسجيلان متزامنان بنفس البريد، أو اسم مستخدم مأخوذ
+        taken = "Username" if e.diag.constraint_name == "customers_username_key" else "Email"
+        return jsonify({"error": f"{taken} already registered"}), 400
+    except HasherBusy:
+        return hasher_busy()
     except Exception as e:
         print(f"POST /api/register: {e}")
         return jsonify({"error": "Server error"}), 500
@@ -366,159 +636,437 @@ def login():
         email = data.get('email')
         password = data.get('password')
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM customers WHERE email=%s AND password=%s", (email, password))
-        customer = cur.fetchone()
-        cur.close()
-        conn.close()
+        if not email or not password:
+            return jsonify({"error": "email and password are required"}), 400
 
-        if not customer:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"SELECT {CUSTOMER_COLUMNS}, password FROM customers WHERE email=%s", (email,))
+            customer = cur.fetchone()
+
+        # المقارنة في مجمّع التجزئة بعد إرجاع الاتصال
+        stored = customer.pop("password") if customer else None
+        ok, upgraded = password_hasher.verify(password, stored)
+        if not ok:
             return jsonify({"error": "Invalid credentials"}), 401
 
-        return jsonify({"message": "Login successful", "customer": dict(customer)})
+        if upgraded:
+            # نص صريح قديم أو معاملات تكلفة سابقة: تُستبدل بالتجزئة الحالية
+            with get_db_connection() as conn, conn.cursor() as cur:
+                cur.execute("UPDATE customers SET password=%s WHERE customer_id=%s AND password=%s",
+                            (upgraded, customer["customer_id"], stored))
+                conn.commit()
+
+        return jsonify({
+            "message": "Login successful",
+            "token": auth_tokens.issue(customer["customer_id"]),
+            "expires_in": auth_tokens.max_age,
+            "customer": dict(customer),
+        })
+    except HasherBusy:
+        return hasher_busy()
     except Exception as e:
         print(f"POST /api/login: {e}")
         return jsonify({"error": "Server error"}), 500
 
+@app.route('/api/auth/me', methods=['GET'])
+@auth_tokens.required
+def auth_me():
+    # هوية صاحب الرمز من التوقيع وحده، دون قاعدة البيانات
+    return jsonify({"customer_id": g.customer_id})
+
 
 
 # ------------------ API Orders ------------------
+ORDER_STATUSES = ('pending', 'preparing', 'onway', 'delivered', 'canceled')
+
+# كل حقل يُحسب في SQL بشكله النهائي فلا حاجة لإعادة بناء الصفوف في Python
+ORDER_FIELDS = {
+    "order_id": "o.order_id",
+    "customer_id": "o.customer_id",
+    "customer_name": "concat_ws(' ', c.first_name, c.last_name)",
+    "meal_id": "o.meal_id",
+    "meal_name": "m.name",
+    "quantity": "o.quantity",
+    "price": "o.price::float8",
+    "total": "o.price::float8 * o.quantity",
+    "status": "o.status",
+    "order_type": "o.order_type",
+    "address": "o.address",
+    "table_id": "o.table_id",
+    "table_number": "t.table_number",
+    "reservation_time": iso_sql("o.reservation_time"),
+    "order_datetime": iso_sql("o.order_datetime"),
+}
+ORDER_DEFAULT_FIELDS = (
+    "order_id", "customer_name", "meal_name", "quantity", "price", "total", "status",
+    "order_type", "address", "table_number", "reservation_time", "order_datetime",
+)
+
+def orders_select(fields):
+    columns = [f"{ORDER_FIELDS[f]} AS {f}" for f in fields]
+    used = " ".join(columns)
+    # الربط فقط بالجداول التي تحتاجها الحقول المطلوبة
+    joins = []
+    if "c." in used:
+        joins.append("JOIN customers c ON o.customer_id = c.customer_id")
+    if "m." in used:
+        joins.append("JOIN meals m ON o.meal_id = m.meal_id")
+    if "t." in used:
+        joins.append("LEFT JOIN tables t ON o.table_id = t.table_id")
+    return columns, joins
+
+def orders_query(fields, limit=None, after=None, args=None):
+    # يبني استعلام الطلبات من الحقول المطلوبة وفلاتر query string
+    # (ValueError إذا كانت الفلاتر غير صالحة)
+    statuses = list_arg('status', ORDER_STATUSES, args=args)
+    order_types = list_arg('order_type', args=args)
+    customer_id = int_arg('customer_id', minimum=1, args=args)
+    date_from = datetime_arg('from', args=args)
+    date_to = datetime_arg('to', end_of_day=True, args=args)
+
+    columns, joins = orders_select(fields)
+
+    where, params = [], []
+    if statuses:
+        where.append("o.status = ANY(%s::order_status_enum[])")
+        params.append(statuses)
+    if order_types:
+        where.append("o.order_type = ANY(%s)")
+        params.append(order_types)
+    if customer_id:
+        where.append("o.customer_id = %s")
+        params.append(customer_id)
+    if date_from:
+        where.append("o.order_datetime >= %s")
+        params.append(date_from)
+    if date_to:
+        where.append("o.order_datetime < %s")
+        params.append(date_to)
+    if after:
+        where.append("(o.order_datetime, o.order_id) < (%s, %s)")
+        params += after
+    if limit:
+        columns += ["o.order_datetime AS _cursor_datetime", "o.order_id AS _cursor_id"]
+        params.append(limit + 1)
+
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM orders o
+        {' '.join(joins)}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY o.order_datetime DESC, o.order_id DESC
+        {'LIMIT %s' if limit else ''}
+    """
+    return query, params
+
+# ----- Order feed -----
+# كل تغيير يُسجَّل في order_events داخل معاملة الطلب نفسها ثم pg_notify
+# (يصل للمستمعين عند COMMIT فقط)؛ الحمولة بنفس شكل GET /api/orders
+ORDER_EVENT_FIELDS = ("order_id", "customer_id", "meal_id") + ORDER_DEFAULT_FIELDS[1:]
+_event_columns, _event_joins = orders_select(ORDER_EVENT_FIELDS)
+ORDER_EVENT_SQL = f"""
+    WITH e AS (
+        INSERT INTO order_events (order_id, op, payload)
+        SELECT x.order_id, %s::varchar, (
+            SELECT row_to_json(r) FROM (
+                SELECT {', '.join(_event_columns)}
+                FROM orders o
+                {' '.join(_event_joins)}
+                WHERE o.order_id = x.order_id
+            ) r
+        )
+        FROM unnest(%s::int[]) WITH ORDINALITY AS x(order_id, n)
+        ORDER BY x.n
+        RETURNING event_id
+    )
+    SELECT pg_notify('{ORDER_FEED_CHANNEL}', event_id::text) FROM e
+"""
+LAST_ORDER_EVENT_SQL = "SELECT COALESCE(MAX(event_id), 0) AS event_id FROM order_events"
+
+def publish_order_event(cur, op, *order_ids):
+    # حدث لكل طلب في استعلام واحد
+    cur.execute(ORDER_EVENT_SQL, (op, list(order_ids)))
+
+order_feed = OrderFeed(
+    DB_CONFIG,
+    get_db_connection,
+    retention_hours=int(os.environ.get("ORDER_EVENTS_RETENTION_HOURS", 24)),
+)
+
 @app.route('/api/orders', methods=['GET'])
 def get_orders():
+    # ?fields= ?status= ?order_type= ?customer_id= ?from=&to= ?limit=&cursor=
+    # ?export=ndjson|csv لتصدير كل الطلبات المطابقة كبث
+    # الترتيب: order_datetime DESC ثم order_id DESC
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        query = """
-            SELECT
-                o.order_id,
-                o.customer_id,
-                c.first_name,
-                c.last_name,
-                o.meal_id,
-                m.name AS meal_name,
-                o.quantity,
-                o.price,
-                o.status,
-                o.order_type,
-                o.address,
-                o.table_id,
-                t.table_number,
-                o.reservation_time,
-                o.order_datetime
-            FROM orders o
-            JOIN customers c ON o.customer_id = c.customer_id
-            JOIN meals m ON o.meal_id = m.meal_id
-            LEFT JOIN tables t ON o.table_id = t.table_id
-            ORDER BY o.order_datetime DESC
-        """
-        cur.execute(query)
-        rows = cur.fetchall()
-        cur.close()
-        conn.close()
-
-        orders = []
-        for r in rows:
-            orders.append({
-                "order_id": r["order_id"],
-                "customer_name": f"{r['first_name']} {r['last_name']}",
-                "meal_name": r["meal_name"],
-                "quantity": r["quantity"],
-                "price": float(r["price"]),
-                "total": float(r["price"]) * r["quantity"],
-                "status": r["status"],
-                "order_type": r["order_type"],
-                "address": r["address"],
-                "table_number": r["table_number"],
-                "reservation_time": r["reservation_time"].isoformat() if r["reservation_time"] else None,
-                "order_datetime": r["order_datetime"].isoformat()
-            })
-
-        return jsonify(orders)
+        export = export_arg()
+        fields = parse_fields(request.args.get('fields'), ORDER_FIELDS, ORDER_DEFAULT_FIELDS)
+        limit, cursor = (None, None) if export else page_args()
+        after = decode_cursor(cursor, (datetime.fromisoformat, int)) if cursor else None
+        query, params = orders_query(fields, limit, after)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if export:
+        return stream_export(query, params, export, "orders")
+
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            # رقم آخر حدث قبل القراءة: اللوحة تشترك في /api/orders/stream من بعده
+            cur.execute(LAST_ORDER_EVENT_SQL)
+            last_event_id = cur.fetchone()['event_id']
+            cur.execute(query, params)
+            orders = cur.fetchall()
+
+        response = paged_response(orders, limit, ["_cursor_datetime", "_cursor_id"])
+        response.headers['X-Order-Event-Id'] = str(last_event_id)
+        return response
 
     except Exception as e:
         print("GET /api/orders:", e)
         return jsonify({"error": "Server error"}), 500
 
 
+ORDER_INSERT_COLUMNS = (
+    "customer_id", "meal_id", "quantity", "price", "status",
+    "order_type", "address", "table_id", "reservation_time",
+)
+
+def order_values(data):
+    # (قيم الإدخال بترتيب ORDER_INSERT_COLUMNS، رسالة خطأ التحقق أو None)
+    customer_id = int(data["customer_id"])
+    meal_id = int(data["meal_id"])
+    quantity = int(data.get("quantity", 1))
+    price = float(data["price"])
+    status = data.get("status", "pending")
+    order_type = data.get("order_type", "delivery")
+
+    address = data.get("address")
+    table_id = data.get("table_id")
+    reservation_time = data.get("reservation_time")
+
+    if reservation_time:
+            reservation_time = datetime.fromisoformat(
+            reservation_time.replace("Z", "")
+       )
+
+    # تحقق ذكي
+    if order_type == "delivery" and not address:
+        return None, "Address required for delivery"
+
+    if order_type == "dinein" and (not table_id or not reservation_time):
+        return None, "Table & reservation time required for dine-in"
+
+    return (
+        customer_id,
+        meal_id,
+        quantity,
+        price,
+        status,
+        order_type,
+        address,
+        table_id,
+        reservation_time
+    ), None
+
+def order_updates(data):
+    updates = {}
+    if 'order_type' in data:
+           updates['order_type'] = data['order_type']
+    if 'address' in data:
+            updates['address'] = data['address']
+    if 'table_id' in data:
+            updates['table_id'] = data['table_id']
+    if 'reservation_time' in data and data['reservation_time']:
+                updates['reservation_time'] = datetime.fromisoformat(
+                data['reservation_time'].replace("Z", "")
+     )
+
+    if 'status' in data:
+            updates['status'] = data['status']
+    return updates
+
+# ----- Write-behind order queue -----
+# ORDER_INGEST_MODE=queue: POST /api/orders يُكتب في طابور محلي دائم ويُرد بـ 202
+# ورقم مؤقت، وخيط كاتب يرسل الطلبات إلى PostgreSQL على دفعات
+QUEUED_ORDER_COLUMNS = ("idempotency_key",) + ORDER_INSERT_COLUMNS
+MAX_IDEMPOTENCY_KEY = 64
+
+def write_queued_orders(entries):
+    # {seq: order_id}؛ الطلبات المكتوبة سابقاً (إعادة محاولة) تُعاد كما هي
+    # المفتاح فريد لكل زبون: (customer_id، idempotency_key)
+    rows = [[e["idempotency_key"]] + e["payload"] for e in entries]
+    with get_db_connection() as conn, conn.cursor() as cur:
+        inserted = execute_values(cur, f"""
+            INSERT INTO orders ({', '.join(QUEUED_ORDER_COLUMNS)})
+            VALUES %s
+            ON CONFLICT (customer_id, idempotency_key) DO NOTHING
+            RETURNING *
+        """, rows, page_size=len(rows), fetch=True)
+        ids = {(o['customer_id'], o['idempotency_key']): o['order_id'] for o in inserted}
+        existing = [e for e in entries if (e["customer_id"], e["idempotency_key"]) not in ids]
+        if existing:
+            cur.execute("""
+                SELECT customer_id, idempotency_key, order_id FROM orders
+                WHERE (customer_id, idempotency_key) IN (SELECT * FROM unnest(%s::int[], %s::text[]))
+            """, ([e["customer_id"] for e in existing], [e["idempotency_key"] for e in existing]))
+            ids.update(((row['customer_id'], row['idempotency_key']), row['order_id']) for row in cur.fetchall())
+        if inserted:
+            publish_order_event(cur, 'insert', *(o['order_id'] for o in inserted))
+        conn.commit()
+    for order in inserted:
+        recommender.order_added(order)
+    return {e["seq"]: ids[(e["customer_id"], e["idempotency_key"])]
+            for e in entries if (e["customer_id"], e["idempotency_key"]) in ids}
+
+order_queue = None
+if os.environ.get("ORDER_INGEST_MODE") == "queue":
+    order_queue = OrderQueue(
+        os.environ.get("ORDER_QUEUE_PATH", os.path.join(os.getcwd(), "order_queue.sqlite3")),
+        write_queued_orders,
+        permanent_errors=(psycopg2.IntegrityError, psycopg2.DataError),
+        batch_size=int(os.environ.get("ORDER_QUEUE_BATCH", 200)),
+    )
+    order_queue.start()
+
+def idempotency_key():
+    # ترويسة Idempotency-Key من العميل تجعل إعادة الإرسال آمنة (ValueError إذا كانت طويلة)
+    key = request.headers.get('Idempotency-Key') or uuid.uuid4().hex
+    if len(key) > MAX_IDEMPOTENCY_KEY:
+        raise ValueError(f"Idempotency-Key longer than {MAX_IDEMPOTENCY_KEY} characters")
+    return key
+
 @app.route('/api/orders', methods=['POST'])
 def add_order():
     try:
         data = request.get_json()
+        values, error = order_values(data)
+        if error:
+            return jsonify({"error": error}), 400
+
+        if order_queue is not None:
+            try:
+                key = idempotency_key()
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            customer_id = values[ORDER_INSERT_COLUMNS.index("customer_id")]
+            entry, created = order_queue.enqueue(customer_id, key, values)
+            return jsonify(entry), 202 if created else 200
+
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO orders
+                ({', '.join(ORDER_INSERT_COLUMNS)})
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
+                RETURNING *
+            """, values)
+
+            order = cur.fetchone()
+            publish_order_event(cur, 'insert', order['order_id'])
+            conn.commit()
+
+        recommender.order_added(order)
+        return jsonify(dict(order)), 201
 
-        customer_id = int(data["customer_id"])
-        meal_id = int(data["meal_id"])
-        quantity = int(data.get("quantity", 1))
-        price = float(data["price"])
-        status = data.get("status", "pending")
-        order_type = data.get("order_type", "delivery")
-
-        address = data.get("address")
-        table_id = data.get("table_id")
-        reservation_time = data.get("reservation_time")
-
-        if reservation_time:
-                reservation_time = datetime.fromisoformat(
-                reservation_time.replace("Z", "")
-           )
-
-        # تحقق ذكي
-        if order_type == "delivery" and not address:
-            return jsonify({"error": "Address required for delivery"}), 400
-
-        if order_type == "dinein" and (not table_id or not reservation_time):
-            return jsonify({"error": "Table & reservation time required for dine-in"}), 400
-
-        conn = get_db_connection()
-        cur = conn.cursor()
+    except Exception as e:
+        print("POST /api/orders:", e)
+        return jsonify({"error": "Server error"}), 500
 
-        cur.execute("""
-            INSERT INTO orders
-            (customer_id, meal_id, quantity, price, status, order_type, address, table_id, reservation_time)
-            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)
-            RETURNING *
-        """, (
-            customer_id,
-            meal_id,
-            quantity,
-            price,
-            status,
-            order_type,
-            address,
-            table_id,
-            reservation_time
-        ))
-
-        order = cur.fetchone()
-        conn.commit()
-        cur.close()
-        conn.close()
+# ----- Bulk orders -----
+MAX_BULK_ORDER_ITEMS = 100
+BULK_ITEM_FIELDS = ("meal_id", "quantity", "status", "order_type", "address", "table_id", "reservation_time")
 
-        return jsonify(dict(order)), 201
+def bulk_order_rows(data, prices):
+    # (صفوف الإدخال، رسالة خطأ أو None) — السعر من جدول meals لا من العميل
+    shared = {k: v for k, v in data.items() if k != "items"}
+    rows = []
+    for i, item in enumerate(data["items"]):
+        try:
+            line = dict(shared, **{k: item[k] for k in BULK_ITEM_FIELDS if k in item})
+            line["price"] = prices[int(line["meal_id"])]
+            values, error = order_values(line)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            values, error = None, "invalid fields"
+        if error:
+            return None, f"items[{i}]: {error}"
+        rows.append(values)
+    return rows, None
+
+def bulk_meal_ids(data):
+    # التحقق من شكل السلة (ValueError) وإرجاع أرقام الوجبات
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        raise ValueError("items must be a non-empty list")
+    if len(items) > MAX_BULK_ORDER_ITEMS:
+        raise ValueError(f"at most {MAX_BULK_ORDER_ITEMS} items per request")
+    try:
+        return sorted({int(item["meal_id"]) for item in items})
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("every item needs an integer meal_id")
+
+MEAL_PRICES_SQL = "SELECT meal_id, price FROM meals WHERE meal_id = ANY(%s)"
+
+def unknown_meals(meal_ids, prices):
+    missing = [str(m) for m in meal_ids if m not in prices]
+    return "Unknown meal_id: " + ", ".join(missing) if missing else None
+
+@app.route('/api/orders/bulk', methods=['POST'])
+def add_orders_bulk():
+    # سلة كاملة في طلب واحد ومعاملة واحدة:
+    # {"customer_id", "order_type", "address"... , "items": [{"meal_id", "quantity", ...}]}
+    # حقول العنصر تطغى على الحقول المشتركة
+    data = request.get_json(silent=True)
+    try:
+        meal_ids = bulk_meal_ids(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(MEAL_PRICES_SQL, (meal_ids,))
+            prices = {row['meal_id']: row['price'] for row in cur.fetchall()}
+            error = unknown_meals(meal_ids, prices)
+            if not error:
+                rows, error = bulk_order_rows(data, prices)
+            if error:
+                return jsonify({"error": error}), 400
+
+            try:
+                orders = execute_values(cur, f"""
+                    INSERT INTO orders ({', '.join(ORDER_INSERT_COLUMNS)})
+                    VALUES %s
+                    RETURNING *
+                """, rows, page_size=MAX_BULK_ORDER_ITEMS, fetch=True)
+            except psycopg2.errors.ForeignKeyViolation:
+                conn.rollback()
+                return jsonify({"error": "Unknown customer or table"}), 400
+            publish_order_event(cur, 'insert', *(o['order_id'] for o in orders))
+            conn.commit()
+
+        for order in orders:
+            recommender.order_added(order)
+        return jsonify([dict(o) for o in orders]), 201
     except Exception as e:
-        print("POST /api/orders:", e)
+        print("POST /api/orders/bulk:", e)
         return jsonify({"error": "Server error"}), 500
 
+@app.route('/api/orders/queued/<key>', methods=['GET'])
+@auth_tokens.required
+def queued_order_status(key):
+    # حالة طلب في الطابور: pending / done (+ order_id) / failed (+ error)
+    # لصاحب الطلب فقط: المفتاح يُبحث عنه ضمن طلبات زبون الرمز
+    if order_queue is None:
+        return jsonify({"error": "order queue is disabled"}), 404
+    entry = order_queue.lookup(g.customer_id, key)
+    if entry is None:
+        return jsonify({"error": "unknown idempotency key"}), 404
+    return jsonify(entry)
+
 @app.route('/api/orders/<int:id>', methods=['PUT'])
 def update_order(id):
     try:
         data = request.get_json()
-        updates = {}
-        if 'order_type' in data:
-               updates['order_type'] = data['order_type']
-        if 'address' in data:
-                updates['address'] = data['address']
-        if 'table_id' in data:
-                updates['table_id'] = data['table_id']
-        if 'reservation_time' in data and data['reservation_time']:
-                    updates['reservation_time'] = datetime.fromisoformat(
-                    data['reservation_time'].replace("Z", "")
-         )
-
-        if 'status' in data:
-                updates['status'] = data['status']
-
+        updates = order_updates(data)
 
         if not updates:
             return jsonify({"error": "no updatable fields provided"}), 400
@@ -526,15 +1074,13 @@ def update_order(id):
         set_clause = ', '.join([f"{k}=%s" for k in updates.keys()])
         values = list(updates.values()) + [id]
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute(f"UPDATE orders SET {set_clause} WHERE order_id=%s RETURNING *", values)
-        order = cur.fetchone()
-        if not order:
-            return jsonify({"error": "order not found"}), 404
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(f"UPDATE orders SET {set_clause} WHERE order_id=%s RETURNING *", values)
+            order = cur.fetchone()
+            if not order:
+                return jsonify({"error": "order not found"}), 404
+            publish_order_event(cur, 'update', id)
+            conn.commit()
         return jsonify(dict(order))
     except Exception as e:
         print(f"PUT /api/orders/{id}: {e}")
@@ -543,27 +1089,64 @@ def update_order(id):
 @app.route('/api/orders/<int:id>', methods=['DELETE'])
 def delete_order(id):
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("DELETE FROM orders WHERE order_id=%s", (id,))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM orders WHERE order_id=%s RETURNING order_id, customer_id, meal_id", (id,))
+            order = cur.fetchone()
+            if order:
+                publish_order_event(cur, 'delete', id)
+            conn.commit()
+        if order:
+            recommender.order_removed(order)
         return '', 204
     except Exception as e:
         print(f"DELETE /api/orders/{id}: {e}")
         return jsonify({"error": "Server error"}), 500
 
+ORDER_STREAM_HEARTBEAT = int(os.environ.get("ORDER_STREAM_HEARTBEAT", 15))
+# كل اتصال SSE هنا يحجز خيطاً/عاملاً طوال عمره: شغّل asgi_app (uvicorn) للوحات الطلبات،
+# أو عمّال threaded/gevent (gunicorn -k gevent / --threads)؛ العامل المتزامن الواحد يتجمد.
+# الحد الأقصى لعمر الاتصال يحرر العامل دورياً، و EventSource يعيد الاتصال بـ Last-Event-ID
+ORDER_STREAM_MAX_SECONDS = int(os.environ.get("ORDER_STREAM_MAX_SECONDS", 300))
+
+@app.route('/api/orders/stream', methods=['GET'])
+def order_stream():
+    # SSE: تغييرات الطلبات فقط (op = insert/update/delete + الطلب بشكل GET /api/orders)
+    # ?last_event_id= من ترويسة X-Order-Event-Id عند أول اتصال؛
+    # بعد الانقطاع يرسل EventSource ترويسة Last-Event-ID فتُعاد الأحداث الفائتة
+    try:
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "invalid last_event_id"}), 400
+
+    try:
+        subscription = order_feed.subscribe(last_event_id)
+    except Exception as e:
+        print(f"GET /api/orders/stream: {e}")
+        return jsonify({"error": "Server error"}), 500
+
+    def generate():
+        deadline = time.monotonic() + ORDER_STREAM_MAX_SECONDS
+        with subscription:
+            yield "retry: 3000\n\n"
+            for event in subscription.events(heartbeat=min(ORDER_STREAM_HEARTBEAT, ORDER_STREAM_MAX_SECONDS)):
+                yield format_sse(event)
+                if time.monotonic() >= deadline:
+                    return
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 # ------------------ API Tables ------------------
 @app.route('/api/tables', methods=['GET'])
+@response_cache.cached('tables')
 def get_tables():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM tables ORDER BY table_id ASC")
-        tables = cur.fetchall()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT * FROM tables ORDER BY table_id ASC")
+            tables = cur.fetchall()
         return jsonify([dict(table) for table in tables])
     except Exception as e:
         print(f"GET /api/tables: {e}")
@@ -577,47 +1160,66 @@ def add_table():
     if not table_number or not capacity:
         return jsonify({"error": "Missing fields"}), 400
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("INSERT INTO tables (table_number, capacity, status) VALUES (%s, %s, 'Available') RETURNING *",
-                (table_number, capacity))
-    table = cur.fetchone()
-    conn.commit()
-    cur.close()
-    conn.close()
+    with get_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("INSERT INTO tables (table_number, capacity, status) VALUES (%s, %s, 'Available') RETURNING *",
+                    (table_number, capacity))
+        table = cur.fetchone()
+        conn.commit()
+    response_cache.invalidate('tables')
     return jsonify(dict(table)), 201
 
-# ------------------ API Reservations ------------------
-
-
 # ------------------ Customers with Orders ------------------
+def customers_with_orders_query(limit=None, offset=0, date_from=None, date_to=None):
+    window = ""
+    params = [limit, offset]
+    if date_from:
+        window += " AND o.order_datetime >= %s"
+        params.append(date_from)
+    if date_to:
+        window += " AND o.order_datetime < %s"
+        params.append(date_to)
+
+    # استعلام واحد: الزبائن + طلباتهم مجمّعة في JSON بدل استعلام لكل زبون
+    query = f"""
+        SELECT {', '.join('c.' + f for f in CUSTOMER_FIELDS)}, COALESCE(co.orders, '[]'::json) AS orders
+        FROM (
+            SELECT {CUSTOMER_COLUMNS} FROM customers
+            ORDER BY customer_id DESC
+            LIMIT %s OFFSET %s
+        ) c
+        LEFT JOIN LATERAL (
+            SELECT json_agg(json_build_object(
+                'meal', m.name,
+                'price', NULLIF(o.price, 0)::float8,
+                'quantity', o.quantity,
+                'order_date', to_char(o.order_datetime, 'YYYY-MM-DD'),
+                'order_time', to_char(o.order_datetime, 'HH24:MI')
+            ) ORDER BY o.order_datetime DESC) AS orders
+            FROM orders o
+            LEFT JOIN meals m ON o.meal_id = m.meal_id
+            WHERE o.customer_id = c.customer_id{window}
+        ) co ON TRUE
+        ORDER BY c.customer_id DESC
+    """
+    return query, params
+
 @app.route('/api/customers-with-orders', methods=['GET'])
 def get_customers_with_orders():
+    # ?limit=&offset= للتصفح و ?from=&to= لحصر الطلبات في فترة زمنية
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM customers ORDER BY customer_id DESC")
-        customers = cur.fetchall()
+        limit = int_arg('limit', minimum=1, maximum=1000)
+        offset = int_arg('offset', default=0)
+        date_from = datetime_arg('from')
+        date_to = datetime_arg('to', end_of_day=True)
+    except ValueError:
+        return jsonify({"error": "invalid limit, offset, from or to"}), 400
 
-        for customer in customers:
-            cur.execute(
-                "SELECT o.order_id, m.name AS meal, o.price, o.quantity, o.order_datetime "
-                "FROM orders o LEFT JOIN meals m ON o.meal_id = m.meal_id "
-                "WHERE o.customer_id = %s ORDER BY o.order_datetime DESC",
-                (customer['customer_id'],)
-            )
-            orders = cur.fetchall()
-            customer['orders'] = [{
-                'meal': o['meal'],
-                'price': float(o['price']) if o['price'] else None,
-                'quantity': int(o['quantity']),
-                'order_date': o['order_datetime'].date().isoformat() if o['order_datetime'] else None,
-                'order_time': o['order_datetime'].time().strftime('%H:%M') if o['order_datetime'] else None
-            } for o in orders]
-
-        cur.close()
-        conn.close()
-        return jsonify([dict(customer) for customer in customers])
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(*customers_with_orders_query(limit, offset, date_from, date_to))
+            customers = cur.fetchall()
+
+        return jsonify(customers)
     except Exception as e:
         print(f"GET /api/customers-with-orders: {e}")
         return jsonify({"error": "Server error"}), 500
@@ -629,96 +1231,159 @@ def update_table_status(table_id):
         if new_status not in ['Available', 'Reserved']:
             return jsonify({"error": "Invalid status"}), 400
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute("UPDATE tables SET status=%s WHERE table_id=%s", (new_status, table_id))
-        conn.commit()
-        cur.close()
-        conn.close()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("UPDATE tables SET status=%s WHERE table_id=%s", (new_status, table_id))
+            conn.commit()
+        response_cache.invalidate('tables')
         return jsonify({"table_id": table_id, "status": new_status})
     except Exception as e:
         print(f"PUT /api/tables/{table_id}/status: {e}")
         return jsonify({"error": "Server error"}), 500
     
+# ------------------ API Reservations ------------------
+# التوفر محسوب لكل فترة زمنية من جدول reservations (قيد استبعاد يمنع التداخل)
+# tables.status يبقى تعليقاً يدوياً من صفحة الإدارة ولا يتغير بالحجز
+RESERVATION_MINUTES = int(os.environ.get("RESERVATION_MINUTES", 90))
+MAX_RESERVATION_MINUTES = 24 * 60
+MAX_PARTY_SIZE = 50
+
+# NOT EXISTS يستعمل فهرس قيد الاستبعاد (table_id, الفترة)
+AVAILABLE_TABLES_SQL = """
+    SELECT t.table_id, t.table_number, t.capacity
+    FROM tables t
+    WHERE t.status = 'Available' AND t.capacity >= %s
+      AND NOT EXISTS (
+          SELECT 1 FROM reservations r
+          WHERE r.table_id = t.table_id
+            AND r.cancelled_at IS NULL
+            AND tsrange(r.reservation_datetime, r.reservation_end) && tsrange(%s, %s)
+      )
+    ORDER BY t.table_number ASC
+"""
+
+# إدخال شرطي واحد: لا قراءة ثم كتابة، والتداخل يرفضه القيد حتى مع الطلبات المتزامنة
+RESERVE_SQL = """
+    INSERT INTO reservations (customer_id, table_id, reservation_datetime, reservation_end, party_size)
+    SELECT %s, t.table_id, %s, %s, %s
+    FROM tables t
+    WHERE t.table_id = %s AND t.status = 'Available' AND t.capacity >= %s
+    RETURNING *
+"""
+
+def reservation_slot(start, minutes):
+    return start, start + timedelta(minutes=minutes)
+
+def current_slot_start():
+    # "الآن" مقرّباً إلى الدقيقة: نتيجة واحدة قابلة للتخزين لكل دقيقة
+    return datetime.now().replace(second=0, microsecond=0)
+
+def available_tables_args(args=None):
+    # ?time= (افتراضياً الآن) ?party_size= ?duration= بالدقائق
+    start = datetime_arg('time', args=args) or current_slot_start()
+    party_size = int_arg('party_size', 1, minimum=1, maximum=MAX_PARTY_SIZE, args=args)
+    minutes = int_arg('duration', RESERVATION_MINUTES, minimum=1, maximum=MAX_RESERVATION_MINUTES, args=args)
+    return (party_size,) + reservation_slot(start, minutes)
+
+def available_tables_vary(args):
+    # بدون ?time= تتغير النتيجة مع الوقت: الدقيقة الحالية جزء من مفتاح الكاش
+    return [] if args.get('time') else [("now", current_slot_start().isoformat())]
+
+def reservation_values(data):
+    # (قيم RESERVE_SQL، رسالة خطأ التحقق أو None)
+    customer_id = data.get('customer_id')
+    table_id = data.get('table_id')
+    if not customer_id or not table_id:
+        return None, "Missing fields"
+    try:
+        start = data.get('reservation_time')
+        start = datetime.fromisoformat(start.replace("Z", "")) if start else datetime.now()
+        party_size = int(data.get('party_size') or 1)
+        minutes = int(data.get('duration_minutes') or RESERVATION_MINUTES)
+        customer_id, table_id = int(customer_id), int(table_id)
+    except (TypeError, ValueError, AttributeError):
+        return None, "Invalid reservation fields"
+    if not 1 <= party_size <= MAX_PARTY_SIZE or not 1 <= minutes <= MAX_RESERVATION_MINUTES:
+        return None, "Invalid party_size or duration_minutes"
+    start, end = reservation_slot(start, minutes)
+    return (customer_id, start, end, party_size, table_id, party_size), None
+
 @app.route('/api/available-tables', methods=['GET'])
+@response_cache.cached('tables', 'reservations', vary=available_tables_vary)
 def get_available_tables():
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
+        params = available_tables_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        cur.execute("""
-            SELECT table_id, table_number, capacity
-            FROM tables
-            WHERE status = 'Available'
-            ORDER BY table_number ASC
-        """)
-
-        tables = cur.fetchall()
-        cur.close()
-        conn.close()
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(AVAILABLE_TABLES_SQL, params)
+            tables = cur.fetchall()
 
         return jsonify([dict(t) for t in tables])
 
     except Exception as e:
         print(f"GET /api/available-tables: {e}")
         return jsonify({"error": "Server error"}), 500
+
 @app.route('/api/reservations', methods=['POST'])
 def reserve_table():
-    data = request.get_json()
-
-    customer_id = data.get('customer_id')
-    table_id = data.get('table_id')
-    reservation_time = data.get('reservation_time')
-
-    if not reservation_time:
-        reservation_time = datetime.now()
-
-    if not customer_id or not table_id:
-        return jsonify({"error": "Missing fields"}), 400
-
-    conn = get_db_connection()
-    cur = conn.cursor(cursor_factory=RealDictCursor)
-
-    # تحقق أن الطاولة متاحة
-    cur.execute("SELECT status FROM tables WHERE table_id=%s", (table_id,))
-    table = cur.fetchone()
-
-    if not table or table['status'] != 'Available':
-        return jsonify({"error": "Table not available"}), 400
+    data = request.get_json(silent=True) or {}
+    values, error = reservation_values(data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    # إدخال الحجز
-    cur.execute("""
-        INSERT INTO reservations (customer_id, table_id, reservation_datetime)
-        VALUES (%s, %s, %s)
-        RETURNING *
-    """, (customer_id, table_id, reservation_time))
-
-    reservation = cur.fetchone()
-
-    # تغيير حالة الطاولة
-    cur.execute("""
-        UPDATE tables SET status='Reserved'
-        WHERE table_id=%s
-    """, (table_id,))
-
-    conn.commit()
-    cur.close()
-    conn.close()
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            try:
+                cur.execute(RESERVE_SQL, values)
+            except psycopg2.errors.ExclusionViolation:
+                conn.rollback()
+                return jsonify({"error": "Table already reserved for this time"}), 409
+            except psycopg2.errors.ForeignKeyViolation:
+                conn.rollback()
+                return jsonify({"error": "Unknown customer"}), 400
+            reservation = cur.fetchone()
+            if not reservation:
+                # غير موجودة، معلّقة يدوياً، أو أصغر من عدد الأشخاص
+                return jsonify({"error": "Table not available"}), 400
+            conn.commit()
+        response_cache.invalidate('reservations')
+        return jsonify(reservation), 201
+    except Exception as e:
+        print(f"POST /api/reservations: {e}")
+        return jsonify({"error": "Server error"}), 500
 
-    return jsonify(reservation), 201
+@app.route('/api/reservations/<int:id>', methods=['DELETE'])
+def cancel_reservation(id):
+    # الإلغاء يحرّر الفترة (القيد لا يشمل الحجوزات الملغاة)
+    try:
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                UPDATE reservations SET cancelled_at = now()
+                WHERE reservation_id = %s AND cancelled_at IS NULL
+                RETURNING reservation_id
+            """, (id,))
+            cancelled = cur.fetchone()
+            conn.commit()
+        if not cancelled:
+            return jsonify({"error": "reservation not found"}), 404
+        response_cache.invalidate('reservations')
+        return '', 204
+    except Exception as e:
+        print(f"DELETE /api/reservations/{id}: {e}")
+        return jsonify({"error": "Server error"}), 500
 
 # ----- Run server -----
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-try:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM meals;")
-    result = cur.fetchone()
-    print("✅ Meals in DB:", result)
-    cur.close()
-    conn.close()
-except Exception as e:
-    print("❌ DB connection failed:", e)
+    try:
+        db_pool.warm()
+        with get_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM meals;")
+            result = cur.fetchone()
+        print("✅ Meals in DB:", result)
+    except Exception as e:
+        print("❌ DB connection failed:", e)
 
     app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
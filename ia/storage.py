@@ -0,0 +1,223 @@
+# storage.py
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+
+CHUNK_SIZE = 64 * 1024
+EXTENSION_ALIASES = {"jpeg": "jpg"}
+
+
+def normalize_ext(filename):
+    ext = os.path.splitext(filename)[1].lower().lstrip(".")
+    return EXTENSION_ALIASES.get(ext, ext)
+
+
+# =====================================================
+# تخزين الملفات حسب المحتوى (content-addressed)
+# الاسم = sha256 للمحتوى، فالملفات المتطابقة تُحفظ مرة واحدة
+# =====================================================
+class LocalStorage:
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.folder, os.path.basename(name))
+
+    def save(self, stream, ext):
+        # حساب البصمة أثناء القراءة والكتابة إلى ملف مؤقت ثم إعادة تسمية ذرية
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    f.write(chunk)
+            name = f"{digest.hexdigest()}.{ext}"
+            path = self._path(name)
+            if os.path.exists(path):
+                os.remove(tmp)
+                # رفع جديد لملف موجود: تجديد mtime حتى لا يحذفه gc قبل حفظ سجله
+                os.utime(path)
+                return name, False
+            os.replace(tmp, path)
+            return name, True
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def write(self, name, data):
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(name))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def open(self, name):
+        return open(self._path(name), "rb")
+
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def names(self):
+        # [(name, mtime)] — يتجاهل الملفات المؤقتة
+        result = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                result.append((entry.name, entry.stat().st_mtime))
+        return result
+
+
+class MemoryStorage:
+    # بديل محلي لمخزن كائنات (S3...) بنفس الواجهة
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def save(self, stream, ext):
+        digest = hashlib.sha256()
+        buf = io.BytesIO()
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            buf.write(chunk)
+        name = f"{digest.hexdigest()}.{ext}"
+        with self._lock:
+            if name in self._objects:
+                self._objects[name] = (self._objects[name][0], time.time())
+                return name, False
+            self._objects[name] = (buf.getvalue(), time.time())
+        return name, True
+
+    def write(self, name, data):
+        with self._lock:
+            self._objects[name] = (bytes(data), time.time())
+
+    def open(self, name):
+        with self._lock:
+            if name not in self._objects:
+                raise FileNotFoundError(name)
+            return io.BytesIO(self._objects[name][0])
+
+    def exists(self, name):
+        return name in self._objects
+
+    def delete(self, name):
+        with self._lock:
+            self._objects.pop(name, None)
+
+    def names(self):
+        with self._lock:
+            return [(name, mtime) for name, (_, mtime) in self._objects.items()]
+
+
+# =====================================================
+# جمع الملفات اليتيمة: غير المرتبطة بـ meals.image_url ولا customers.profile_image_url
+# =====================================================
+def referenced_names(cur):
+    cur.execute("""
+        SELECT image_url AS url FROM meals WHERE image_url IS NOT NULL
+        UNION
+        SELECT profile_image_url FROM customers WHERE profile_image_url IS NOT NULL
+    """)
+    return {os.path.basename(row["url"] if isinstance(row, dict) else row[0]) for row in cur.fetchall()}
+
+
+# لاحقات النسخ المصغّرة (images.VARIANTS)
+VARIANT_SUFFIXES = ("_full", "_card", "_thumb")
+
+
+def collect_orphans(storage, referenced, grace_seconds=3600, dry_run=False):
+    # النسخ المصغّرة (name_thumb.webp ...) تتبع ملفها الأصلي
+    # مهلة grace_seconds تحمي الملفات المرفوعة التي لم يُحفظ سجلها بعد
+    referenced_stems = {os.path.splitext(n)[0] for n in referenced}
+    cutoff = time.time() - grace_seconds
+    names = storage.names()
+    # ملفات أصلية داخل المهلة: نسخها المصغّرة محمية معها (حتى لو كانت أقدم)
+    recent_stems = {os.path.splitext(n)[0] for n, mtime in names if mtime > cutoff}
+    removed = []
+    for name, mtime in names:
+        if name in referenced:
+            continue
+        stem = os.path.splitext(name)[0]
+        if stem.endswith(VARIANT_SUFFIXES) and stem.rsplit("_", 1)[0] in referenced_stems | recent_stems:
+            continue
+        if mtime > cutoff:
+            continue
+        if not dry_run:
+            storage.delete(name)
+        removed.append(name)
+    return removed
+
+
+def rehash_references(storage, conn):
+    # ترحيل الملفات القديمة (uuid / اسم العميل) إلى أسماء حسب المحتوى
+    # وتحديث الروابط؛ النسخ المكررة تصبح يتيمة فتُحذف في gc
+    renamed = {}
+    with conn.cursor() as cur:
+        for old in sorted(referenced_names(cur)):
+            if not storage.exists(old):
+                continue
+            with storage.open(old) as f:
+                new, _ = storage.save(f, normalize_ext(old))
+            if new == old:
+                continue
+            renamed[old] = new
+            cur.execute("UPDATE meals SET image_url=%s WHERE image_url=%s", (f"/uploads/{new}", f"/uploads/{old}"))
+            cur.execute("UPDATE customers SET profile_image_url=%s WHERE profile_image_url=%s", (new, old))
+    conn.commit()
+    return renamed
+
+
+# الاستعمال: python storage.py gc [--dry-run] | python storage.py rehash
+if __name__ == "__main__":
+    import argparse
+    import psycopg2
+
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed upload store")
+    parser.add_argument("command", choices=["gc", "rehash"])
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--grace", type=int, default=3600, help="keep unreferenced files younger than this (seconds)")
+    args = parser.parse_args()
+
+    storage = LocalStorage(os.path.join(os.getcwd(), "uploads"))
+    conn = psycopg2.connect(
+        host=os.environ.get("DB_HOST"),
+        database=os.environ.get("DB_NAME"),
+        user=os.environ.get("DB_USER"),
+        password=os.environ.get("DB_PASSWORD"),
+        port=os.environ.get("DB_PORT", 5432),
+    )
+    try:
+        if args.command == "rehash":
+            for old, new in rehash_references(storage, conn).items():
+                print(f"{old} -> {new}")
+        else:
+            with conn.cursor() as cur:
+                referenced = referenced_names(cur)
+            removed = collect_orphans(storage, referenced, args.grace, args.dry_run)
+            print(("Would remove" if args.dry_run else "Removed"), len(removed), "files")
+            for name in removed:
+                print(" ", name)
+    finally:
+        conn.close()
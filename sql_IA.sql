@@ -135,3 +135,56 @@ VALUES
 
 select * from customers;
 
+
+-- Precomputed recommendations (written by ia/precompute_recommendations.py)
+CREATE TABLE customer_recommendations (
+    customer_id INT NOT NULL REFERENCES customers(customer_id) ON DELETE CASCADE,
+    rank INT NOT NULL,
+    meal_id INT NOT NULL REFERENCES meals(meal_id) ON DELETE CASCADE,
+    score NUMERIC(6,3) NOT NULL,
+    generated_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (customer_id, rank)
+);
+
+
+-- Order change feed (written by add/update/delete_order, read by ia/order_feed.py)
+CREATE TABLE order_events (
+    event_id BIGSERIAL PRIMARY KEY,
+    order_id INT NOT NULL,
+    op VARCHAR(10) NOT NULL CHECK (op IN ('insert', 'update', 'delete')),
+    payload JSONB,
+    created_at TIMESTAMP NOT NULL DEFAULT now()
+);
+CREATE INDEX idx_order_events_created_at ON order_events (created_at);
+
+
+-- Time-slotted reservations: a table can't be booked twice for overlapping slots.
+-- tables.status stays a manual hold (set from the admin page) and is no longer
+-- flipped by bookings.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE reservations
+    ADD COLUMN party_size INT NOT NULL DEFAULT 1 CHECK (party_size > 0),
+    ADD COLUMN reservation_end TIMESTAMP,
+    ADD COLUMN cancelled_at TIMESTAMP;
+
+UPDATE reservations SET reservation_end = reservation_datetime + interval '90 minutes'
+WHERE reservation_end IS NULL;
+
+ALTER TABLE reservations
+    ALTER COLUMN reservation_end SET NOT NULL,
+    ADD CONSTRAINT reservations_slot_valid CHECK (reservation_end > reservation_datetime),
+    ADD CONSTRAINT reservations_no_overlap EXCLUDE USING gist (
+        table_id WITH =,
+        tsrange(reservation_datetime, reservation_end) WITH &&
+    ) WHERE (cancelled_at IS NULL);
+
+CREATE INDEX idx_tables_available_capacity ON tables (capacity) WHERE status = 'Available';
+
+-- مفتاح منع التكرار لطابور الطلبات (ORDER_INGEST_MODE=queue)، فريد لكل زبون
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_orders_customer_idempotency_key ON orders (customer_id, idempotency_key);
+
+
+-- Later schema changes and indexes are versioned in ia/migrations/.
+-- After loading this file: cd ia && python migrate.py up